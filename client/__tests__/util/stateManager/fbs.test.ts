@@ -2,11 +2,16 @@
 test FBS encode/decode API
 */
 import { expect, test } from "@playwright/test";
+import { flatbuffers } from "flatbuffers";
 import { Dataframe, KeyIndex } from "../../../src/util/dataframe";
 import {
   decodeMatrixFBS,
   encodeMatrixFBS,
 } from "../../../src/util/stateManager/matrix";
+import { Column } from "../../../src/util/stateManager/net-encoding/column";
+import { Matrix } from "../../../src/util/stateManager/net-encoding/matrix";
+import { SparseFloat32FBArray } from "../../../src/util/stateManager/net-encoding/sparse-float32-f-b-array";
+import { TypedFBArray } from "../../../src/util/stateManager/net-encoding/typed-f-b-array";
 
 const { describe } = test;
 
@@ -34,4 +39,31 @@ describe("encode/decode", () => {
     expect(dfB.rowIdx).toBeNull();
     expect(dfB.columns).toEqual(columns);
   });
+
+  test("decode sparse column", () => {
+    const builder = new flatbuffers.Builder(1024);
+    const indices = SparseFloat32FBArray.createIndicesVector(builder, [1, 3]);
+    const values = SparseFloat32FBArray.createValuesVector(builder, [1.5, 2.5]);
+    const sparse = SparseFloat32FBArray.createSparseFloat32FBArray(
+      builder,
+      5,
+      indices,
+      values
+    );
+    const column = Column.createColumn(
+      builder,
+      TypedFBArray.SparseFloat32FBArray,
+      sparse
+    );
+    const columns = Matrix.createColumnsVector(builder, [column]);
+    Matrix.startMatrix(builder);
+    Matrix.addNRows(builder, 5);
+    Matrix.addNCols(builder, 1);
+    Matrix.addColumns(builder, columns);
+    builder.finish(Matrix.endMatrix(builder));
+
+    const df = decodeMatrixFBS(builder.asUint8Array());
+    expect([df.nRows, df.nCols]).toEqual([5, 1]);
+    expect(df.columns).toEqual([new Float32Array([0, 1.5, 0, 2.5, 0])]);
+  });
 });
@@ -7,11 +7,13 @@ format is documented in dev_docs/diffexpdu.md
 const MAGIC_NUMBER = 0xde;
 
 /**
- * The diffex mode. Currently, only TopN is implemented.
+ * The diffex mode. Currently, only TopN (Welch's t-test) and WilcoxonTopN (Wilcoxon
+ * rank-sum test) are implemented.
  */
 export enum DiffExMode {
   TopN = 0,
   VarFilter = 1,
+  WilcoxonTopN = 3,
 }
 
 /**
@@ -35,8 +37,8 @@ export interface DiffExArguments {
  * @returns {Uint8Array} the binary encoded buffer
  */
 export function packDiffExPdu(args: DiffExArguments): Uint8Array {
-  if (args.mode !== DiffExMode.TopN)
-    throw new Error("Modes other than TopN are unsupported.");
+  if (args.mode !== DiffExMode.TopN && args.mode !== DiffExMode.WilcoxonTopN)
+    throw new Error("Modes other than TopN and WilcoxonTopN are unsupported.");
   if (args.set1.length === 0 || args.set2.length === 0)
     throw new Error("Cell sets must be nonzero length");
 
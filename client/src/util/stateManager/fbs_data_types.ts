@@ -7,6 +7,7 @@ import { Int32FBArray } from "./net-encoding/int32-f-b-array";
 import { JSONEncodedFBArray } from "./net-encoding/j-s-o-n-encoded-f-b-array";
 import { Uint32FBArray } from "./net-encoding/uint32-f-b-array";
 import { Int16EncodedXFBArray } from "./net-encoding/int16-encoded-x-f-b-array";
+import { SparseFloat32FBArray } from "./net-encoding/sparse-float32-f-b-array";
 
 export const NetEncodingDict = {
   DictEncoded8FBArray,
@@ -20,5 +21,6 @@ export const NetEncoding = {
   Float64FBArray,
   Int32FBArray,
   JSONEncodedFBArray,
+  SparseFloat32FBArray,
   Uint32FBArray,
 };
@@ -91,6 +91,22 @@ function decodeIntCodedArray(
   return dataArray;
 }
 
+function decodeSparseArray(
+  uType: TypedFBArray,
+  uValF: Column["u"]
+): TypedArray {
+  const TypeClass =
+    NetEncoding[TypedFBArray[uType] as keyof typeof NetEncoding];
+  const arr = uValF(new TypeClass());
+  const indicesArray = arr.indicesArray();
+  const valuesArray = arr.valuesArray();
+  const dataArray = new Float32Array(arr.length());
+  for (let i = 0; i < indicesArray.length; i += 1) {
+    dataArray[indicesArray[i]] = valuesArray[i];
+  }
+  return dataArray;
+}
+
 function decodeJSONArray(
   uType: TypedFBArray,
   uValF: Column["u"]
@@ -123,6 +139,9 @@ function decodeTypedArray(
     case TypedFBArray.Int16EncodedXFBArray: {
       return decodeIntCodedArray(uType, uValF);
     }
+    case TypedFBArray.SparseFloat32FBArray: {
+      return decodeSparseArray(uType, uValF);
+    }
     default: {
       return decodeNumericArray(uType, uValF, inplace);
     }
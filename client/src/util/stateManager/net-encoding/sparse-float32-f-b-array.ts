@@ -0,0 +1,183 @@
+// automatically generated by the FlatBuffers compiler, do not modify
+// @ts-nocheck
+import { flatbuffers } from "flatbuffers";
+
+export class SparseFloat32FBArray {
+  bb: flatbuffers.ByteBuffer | null = null;
+  bb_pos = 0;
+  __init(i: number, bb: flatbuffers.ByteBuffer): SparseFloat32FBArray {
+    this.bb_pos = i;
+    this.bb = bb;
+    return this;
+  }
+
+  static getRootAsSparseFloat32FBArray(
+    bb: flatbuffers.ByteBuffer,
+    obj?: SparseFloat32FBArray
+  ): SparseFloat32FBArray {
+    return (obj || new SparseFloat32FBArray()).__init(
+      bb.readInt32(bb.position()) + bb.position(),
+      bb
+    );
+  }
+
+  static getSizePrefixedRootAsSparseFloat32FBArray(
+    bb: flatbuffers.ByteBuffer,
+    obj?: SparseFloat32FBArray
+  ): SparseFloat32FBArray {
+    bb.setPosition(bb.position() + flatbuffers.SIZE_PREFIX_LENGTH);
+    return (obj || new SparseFloat32FBArray()).__init(
+      bb.readInt32(bb.position()) + bb.position(),
+      bb
+    );
+  }
+
+  length(): number {
+    const offset = this.bb!.__offset(this.bb_pos, 4);
+    return offset ? this.bb!.readUint32(this.bb_pos + offset) : 0;
+  }
+
+  indices(index: number): number | null {
+    const offset = this.bb!.__offset(this.bb_pos, 6);
+    return offset
+      ? this.bb!.readUint32(
+          this.bb!.__vector(this.bb_pos + offset) + index * 4
+        )
+      : 0;
+  }
+
+  indicesLength(): number {
+    const offset = this.bb!.__offset(this.bb_pos, 6);
+    return offset ? this.bb!.__vector_len(this.bb_pos + offset) : 0;
+  }
+
+  indicesArray(): Uint32Array | null {
+    const offset = this.bb!.__offset(this.bb_pos, 6);
+    return offset
+      ? new Uint32Array(
+          this.bb!.bytes().buffer,
+          this.bb!.bytes().byteOffset + this.bb!.__vector(this.bb_pos + offset),
+          this.bb!.__vector_len(this.bb_pos + offset)
+        )
+      : null;
+  }
+
+  values(index: number): number | null {
+    const offset = this.bb!.__offset(this.bb_pos, 8);
+    return offset
+      ? this.bb!.readFloat32(
+          this.bb!.__vector(this.bb_pos + offset) + index * 4
+        )
+      : 0;
+  }
+
+  valuesLength(): number {
+    const offset = this.bb!.__offset(this.bb_pos, 8);
+    return offset ? this.bb!.__vector_len(this.bb_pos + offset) : 0;
+  }
+
+  valuesArray(): Float32Array | null {
+    const offset = this.bb!.__offset(this.bb_pos, 8);
+    return offset
+      ? new Float32Array(
+          this.bb!.bytes().buffer,
+          this.bb!.bytes().byteOffset + this.bb!.__vector(this.bb_pos + offset),
+          this.bb!.__vector_len(this.bb_pos + offset)
+        )
+      : null;
+  }
+
+  static startSparseFloat32FBArray(builder: flatbuffers.Builder) {
+    builder.startObject(3);
+  }
+
+  static addLength(builder: flatbuffers.Builder, length: number) {
+    builder.addFieldInt32(0, length, 0);
+  }
+
+  static addIndices(
+    builder: flatbuffers.Builder,
+    indicesOffset: flatbuffers.Offset
+  ) {
+    builder.addFieldOffset(1, indicesOffset, 0);
+  }
+
+  static createIndicesVector(
+    builder: flatbuffers.Builder,
+    data: number[] | Uint32Array
+  ): flatbuffers.Offset;
+  /**
+   * @deprecated This Uint8Array overload will be removed in the future.
+   */
+  static createIndicesVector(
+    builder: flatbuffers.Builder,
+    data: number[] | Uint8Array
+  ): flatbuffers.Offset;
+  static createIndicesVector(
+    builder: flatbuffers.Builder,
+    data: number[] | Uint32Array | Uint8Array
+  ): flatbuffers.Offset {
+    builder.startVector(4, data.length, 4);
+    for (let i = data.length - 1; i >= 0; i--) {
+      builder.addInt32(data[i]!);
+    }
+    return builder.endVector();
+  }
+
+  static startIndicesVector(builder: flatbuffers.Builder, numElems: number) {
+    builder.startVector(4, numElems, 4);
+  }
+
+  static addValues(
+    builder: flatbuffers.Builder,
+    valuesOffset: flatbuffers.Offset
+  ) {
+    builder.addFieldOffset(2, valuesOffset, 0);
+  }
+
+  static createValuesVector(
+    builder: flatbuffers.Builder,
+    data: number[] | Float32Array
+  ): flatbuffers.Offset;
+  /**
+   * @deprecated This Uint8Array overload will be removed in the future.
+   */
+  static createValuesVector(
+    builder: flatbuffers.Builder,
+    data: number[] | Uint8Array
+  ): flatbuffers.Offset;
+  static createValuesVector(
+    builder: flatbuffers.Builder,
+    data: number[] | Float32Array | Uint8Array
+  ): flatbuffers.Offset {
+    builder.startVector(4, data.length, 4);
+    for (let i = data.length - 1; i >= 0; i--) {
+      builder.addFloat32(data[i]!);
+    }
+    return builder.endVector();
+  }
+
+  static startValuesVector(builder: flatbuffers.Builder, numElems: number) {
+    builder.startVector(4, numElems, 4);
+  }
+
+  static endSparseFloat32FBArray(
+    builder: flatbuffers.Builder
+  ): flatbuffers.Offset {
+    const offset = builder.endObject();
+    return offset;
+  }
+
+  static createSparseFloat32FBArray(
+    builder: flatbuffers.Builder,
+    length: number,
+    indicesOffset: flatbuffers.Offset,
+    valuesOffset: flatbuffers.Offset
+  ): flatbuffers.Offset {
+    SparseFloat32FBArray.startSparseFloat32FBArray(builder);
+    SparseFloat32FBArray.addLength(builder, length);
+    SparseFloat32FBArray.addIndices(builder, indicesOffset);
+    SparseFloat32FBArray.addValues(builder, valuesOffset);
+    return SparseFloat32FBArray.endSparseFloat32FBArray(builder);
+  }
+}
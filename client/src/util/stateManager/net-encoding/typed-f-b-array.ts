@@ -8,6 +8,7 @@ import { Float64FBArray } from "../net-encoding/float64-f-b-array";
 import { Int16EncodedXFBArray } from "../net-encoding/int16-encoded-x-f-b-array";
 import { Int32FBArray } from "../net-encoding/int32-f-b-array";
 import { JSONEncodedFBArray } from "../net-encoding/j-s-o-n-encoded-f-b-array";
+import { SparseFloat32FBArray } from "../net-encoding/sparse-float32-f-b-array";
 import { Uint32FBArray } from "../net-encoding/uint32-f-b-array";
 
 export enum TypedFBArray {
@@ -21,6 +22,7 @@ export enum TypedFBArray {
   DictEncoded16FBArray = 7,
   DictEncoded32FBArray = 8,
   Int16EncodedXFBArray = 9,
+  SparseFloat32FBArray = 10,
 }
 
 export function unionToTypedFBArray(
@@ -35,6 +37,7 @@ export function unionToTypedFBArray(
       | Int16EncodedXFBArray
       | Int32FBArray
       | JSONEncodedFBArray
+      | SparseFloat32FBArray
       | Uint32FBArray
   ) =>
     | DictEncoded16FBArray
@@ -45,6 +48,7 @@ export function unionToTypedFBArray(
     | Int16EncodedXFBArray
     | Int32FBArray
     | JSONEncodedFBArray
+    | SparseFloat32FBArray
     | Uint32FBArray
     | null
 ):
@@ -56,6 +60,7 @@ export function unionToTypedFBArray(
   | Int16EncodedXFBArray
   | Int32FBArray
   | JSONEncodedFBArray
+  | SparseFloat32FBArray
   | Uint32FBArray
   | null {
   switch (TypedFBArray[type]) {
@@ -79,6 +84,8 @@ export function unionToTypedFBArray(
       return accessor(new DictEncoded32FBArray())! as DictEncoded32FBArray;
     case "Int16EncodedXFBArray":
       return accessor(new Int16EncodedXFBArray())! as Int16EncodedXFBArray;
+    case "SparseFloat32FBArray":
+      return accessor(new SparseFloat32FBArray())! as SparseFloat32FBArray;
     default:
       return null;
   }
@@ -97,6 +104,7 @@ export function unionListToTypedFBArray(
       | Int16EncodedXFBArray
       | Int32FBArray
       | JSONEncodedFBArray
+      | SparseFloat32FBArray
       | Uint32FBArray
   ) =>
     | DictEncoded16FBArray
@@ -107,6 +115,7 @@ export function unionListToTypedFBArray(
     | Int16EncodedXFBArray
     | Int32FBArray
     | JSONEncodedFBArray
+    | SparseFloat32FBArray
     | Uint32FBArray
     | null,
   index: number
@@ -119,6 +128,7 @@ export function unionListToTypedFBArray(
   | Int16EncodedXFBArray
   | Int32FBArray
   | JSONEncodedFBArray
+  | SparseFloat32FBArray
   | Uint32FBArray
   | null {
   switch (TypedFBArray[type]) {
@@ -151,6 +161,11 @@ export function unionListToTypedFBArray(
         index,
         new Int16EncodedXFBArray()
       )! as Int16EncodedXFBArray;
+    case "SparseFloat32FBArray":
+      return accessor(
+        index,
+        new SparseFloat32FBArray()
+      )! as SparseFloat32FBArray;
     default:
       return null;
   }
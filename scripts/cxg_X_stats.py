@@ -0,0 +1,63 @@
+# Computes the per-gene sufficient statistics (sum, sum of squares, nnz) of a CXG's X matrix, and writes
+# them to the optional X_stats sidecar array in the CXG. When present, the explorer uses the sidecar to
+# compute "selection vs. rest" differential expression by scanning only the smaller of the two cell sets.
+# For usage: `python cxg_X_stats.py --help`
+import os
+import sys
+import time
+from typing import Optional
+
+import click
+import tiledb
+
+from server.common.config.app_config import AppConfig
+from server.common.utils.data_locator import DataLocator
+from server.compute.sufficient_stats import X_STATS_ARRAY_NAME, compute_X_stats, write_X_stats
+from server.dataset.cxg_dataset import CxgDataset
+
+
+@click.command()
+@click.option("--url", "-u", type=str, help="CXG file URL. E.g. `file:/my_dataset.cxg`, or `s3://fba8204.cxg`.")
+@click.option(
+    "--urls-file",
+    "-f",
+    type=str,
+    help="File containing a list of CXG file URLs, separated by newlines.",
+)
+@click.option("--overwrite", is_flag=True, default=False, help="Replace an existing X_stats array.")
+def cxg_X_stats(url: Optional[str], urls_file: Optional[str], overwrite: bool) -> None:
+    urls = []
+    if url:
+        urls.append(url)
+    if urls_file:
+        with open(os.path.expanduser(urls_file), "rt") as f:
+            urls.extend([line.strip() for line in f.readlines() if line.strip()])
+
+    for dataset_url in urls:
+        _write_cxg_X_stats(dataset_url, overwrite)
+
+
+def _write_cxg_X_stats(dataset_url: str, overwrite: bool) -> None:
+    dl = DataLocator(dataset_url)
+    if not dl.exists():
+        sys.stderr.write(f"NOT FOUND: {dataset_url}\n")
+        return
+
+    cxg = CxgDataset(dl, app_config=AppConfig())
+    if cxg.has_array(X_STATS_ARRAY_NAME):
+        if not overwrite:
+            sys.stderr.write(f"Skipping {dataset_url}, {X_STATS_ARRAY_NAME} exists\n")
+            return
+        tiledb.VFS(ctx=CxgDataset.tiledb_ctx).remove_dir(cxg.get_path(X_STATS_ARRAY_NAME))
+
+    sys.stderr.write(f"Computing {X_STATS_ARRAY_NAME} for {dataset_url}, shape {cxg.get_shape()}\n")
+    t = time.time()
+    X_stats = compute_X_stats(cxg.open_X_array(), cxg.get_shape())
+    write_X_stats(cxg.get_path(X_STATS_ARRAY_NAME), X_stats, ctx=CxgDataset.tiledb_ctx)
+    sys.stderr.write(f"Wrote {X_STATS_ARRAY_NAME} for {dataset_url} in {time.time() - t:.1f}s\n")
+
+
+# For S3 URLs, these env vars must be set appropriately: AWS_PROFILE, DEPLOYMENT_STAGE, AWS_REGION
+if __name__ == "__main__":
+    CxgDataset.set_tiledb_context({"vfs.s3.region": os.getenv("AWS_REGION", "us-west-2")})
+    cxg_X_stats()
@@ -1,5 +1,9 @@
+from contextlib import contextmanager
+from typing import Iterator
+
 from flask import current_app
 
+from server.dataset.dataset import Dataset
 from server.dataset.dataset_metadata import get_dataset_metadata
 from server.dataset.matrix_loader import DataLoader
 
@@ -11,5 +15,18 @@ def get_dataset_artifact_s3_uri(url_dataroot: str = None, dataset_id: str = None
     return dataset_artifact_s3_uri
 
 
-def get_data_adaptor(dataset_artifact_s3_uri: str) -> DataLoader:
-    return DataLoader(location=dataset_artifact_s3_uri, app_config=current_app.app_config).validate_and_open()
+def open_data_adaptor(dataset_artifact_s3_uri: str, app_config) -> Dataset:
+    return DataLoader(location=dataset_artifact_s3_uri, app_config=app_config).validate_and_open()
+
+
+@contextmanager
+def get_data_adaptor(dataset_artifact_s3_uri: str) -> Iterator[Dataset]:
+    """
+    Context manager returning the data adaptor for the dataset, shared via the server's dataset cache.
+    The adaptor remains open for the duration of the context.
+    """
+    app_config = current_app.app_config
+    with current_app.dataset_cache.data_adaptor(
+        dataset_artifact_s3_uri, lambda location: open_data_adaptor(location, app_config)
+    ) as data_adaptor:
+        yield data_adaptor
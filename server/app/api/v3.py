@@ -33,8 +33,8 @@ def rest_get_s3uri_data_adaptor(func):
     def wrapped_function(self, s3_uri=None):
         try:
             s3_uri = unquote(s3_uri) if s3_uri else s3_uri
-            data_adaptor = get_data_adaptor(s3_uri)
-            return func(self, data_adaptor)
+            with get_data_adaptor(s3_uri) as data_adaptor:
+                return func(self, data_adaptor)
         except (DatasetAccessError, DatasetNotFoundError, DatasetMetadataError) as e:
             return common_rest.abort_and_log(
                 e.status_code, f"Invalid s3_uri {s3_uri}: {e.message}", loglevel=logging.INFO, include_exc_info=True
@@ -130,7 +130,7 @@ class AnnotationsObsAPI(S3URIResource):
                 # If we can't determine, be safe and don't cache
                 includes_user_annotations = True
 
-        response = common_rest.annotations_obs_get(request, data_adaptor)
+        response = common_rest.annotations_obs_get(request, data_adaptor, cacheable=not includes_user_annotations)
 
         # Apply appropriate cache headers
         if includes_user_annotations:
@@ -197,6 +197,30 @@ class DiffExpObs2API(DatasetResource):
         return common_rest.diffex_binary_post(request, data_adaptor)
 
 
+class DiffExpBatchAPI(DatasetResource):
+    @cache_control(no_store=True)
+    @rest_get_s3uri_data_adaptor
+    def post(self, data_adaptor):
+        return common_rest.diffexp_batch_post(request, data_adaptor)
+
+
+class DiffExpJobsAPI(DatasetResource):
+    @cache_control(no_store=True)
+    @rest_get_s3uri_data_adaptor
+    def post(self, data_adaptor):
+        return common_rest.diffexp_job_post(request, data_adaptor)
+
+
+class DiffExpJobAPI(DatasetResource):
+    @cache_control(no_store=True)
+    def get(self, s3_uri, job_id):
+        return common_rest.diffexp_job_get(s3_uri, job_id)
+
+    @cache_control(no_store=True)
+    def delete(self, s3_uri, job_id):
+        return common_rest.diffexp_job_delete(s3_uri, job_id)
+
+
 class LayoutObsAPI(S3URIResource):
     @cache_control(immutable=True, max_age=ONE_YEAR)
     @rest_get_s3uri_data_adaptor
@@ -274,11 +298,11 @@ def rest_get_dataset_explorer_location_data_adaptor(func):
     def wrapped_function(self, dataset=None):
         try:
             s3_uri = get_dataset_artifact_s3_uri(self.url_dataroot, dataset)
-            data_adaptor = get_data_adaptor(s3_uri)
-            # HACK: Used *only* to pass the dataset_explorer_location to DatasetMeta.get_dataset_and_collection_
-            # metadata()
-            data_adaptor.dataset_id = dataset
-            return func(self, data_adaptor)
+            with get_data_adaptor(s3_uri) as data_adaptor:
+                # The data adaptor is shared between requests (see DatasetCache), so the dataset_explorer_location
+                # is passed to DatasetMeta.get_dataset_and_collection_metadata() as an argument, rather than being
+                # stashed on the adaptor.
+                return func(self, data_adaptor, dataset)
         except (DatasetAccessError, DatasetNotFoundError, DatasetMetadataError) as e:
             return common_rest.abort_and_log(
                 e.status_code, f"Invalid s3_uri {dataset}: {e.message}", loglevel=logging.INFO, include_exc_info=True
@@ -295,8 +319,8 @@ def rest_get_dataset_explorer_location_data_adaptor(func):
 class DatasetMetadataAPI(DatasetResource):
     @cache_control(public=True, no_store=True, max_age=0)
     @rest_get_dataset_explorer_location_data_adaptor
-    def get(self, data_adaptor):
-        return common_rest.dataset_metadata_get(current_app.app_config, self.url_dataroot, data_adaptor.dataset_id)
+    def get(self, data_adaptor, dataset):
+        return common_rest.dataset_metadata_get(current_app.app_config, self.url_dataroot, dataset)
 
 
 def get_api_dataroot_resources(bp_dataroot, url_dataroot=None):
@@ -338,6 +362,9 @@ def get_api_s3uri_resources(bp_dataroot, s3uri_path):
     # Computation routes
     add_resource(DiffExpObsAPI, "/diffexp/obs")
     add_resource(DiffExpObs2API, "/diffexp/obs2")
+    add_resource(DiffExpBatchAPI, "/diffexp/batch")
+    add_resource(DiffExpJobsAPI, "/diffexp/jobs")
+    add_resource(DiffExpJobAPI, "/diffexp/jobs/<string:job_id>")
     add_resource(LayoutObsAPI, "/layout/obs")
     # Uns/Spatial
     add_resource(UnsMetaAPI, "/uns/meta")
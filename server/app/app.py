@@ -26,7 +26,12 @@ from server.app.api.util import get_data_adaptor, get_dataset_artifact_s3_uri
 from server.app.api.v3 import register_api_v3
 from server.app.logging import configure_logging
 from server.app.request_id import generate_request_id, get_request_id
+from server.app.warmup import start_warmup
 from server.common.cache.atac_cache import preload_cytoband_data, preload_gene_data
+from server.common.cache.dataset_cache import DatasetCache
+from server.common.cache.response_cache import ResponseCache
+from server.common.cache.ttl_cache import TTLCache
+from server.common.compression import ResponseCompression
 from server.common.config.app_config import AppConfig
 from server.common.constants import CELLGUIDE_CXG_KEY_NAME, CUSTOM_CXG_KEY_NAME
 from server.common.errors import (
@@ -36,6 +41,7 @@ from server.common.errors import (
     TombstoneError,
 )
 from server.common.health import health_check
+from server.common.jobs import JobManager
 from server.common.utils.data_locator import DataLocator
 from server.common.utils.http_cache import cache_control, cache_control_always, webbp
 from server.common.utils.utils import Float32JSONEncoder, path_join
@@ -65,7 +71,8 @@ def dataset_index(url_dataroot=None, dataset=None):
     try:
         dataset_artifact_s3_uri = get_dataset_artifact_s3_uri(url_dataroot, dataset)
         # Attempt to load the dataset to see if it exists at all
-        get_data_adaptor(dataset_artifact_s3_uri=dataset_artifact_s3_uri)
+        with get_data_adaptor(dataset_artifact_s3_uri=dataset_artifact_s3_uri):
+            pass
     except (DatasetAccessError, DatasetNotFoundError) as e:
         return common_rest.abort_and_log(
             e.status_code, f"Invalid dataset {dataset}: {e.message}", loglevel=logging.INFO, include_exc_info=True
@@ -123,11 +130,26 @@ def dataroot_index():
         return redirect(config.server__multi_dataset__index)
 
 
+def cache_stats():
+    """Statistics of the server caches, reported by the health check"""
+    from server.dataset.cxg_dataset import CxgDataset
+
+    return {
+        "dataset_cache": {
+            "entries": len(current_app.dataset_cache),
+            "open_arrays": current_app.dataset_cache.open_array_count(),
+        },
+        "X_column_cache": CxgDataset.X_column_cache.stats(),
+        "diffexp_cache": CxgDataset.diffexp_cache.stats(),
+        "response_cache": current_app.response_cache.stats(),
+    }
+
+
 class HealthAPI(Resource):
     @cache_control(no_store=True)
     def get(self):
         config = current_app.app_config
-        return health_check(config)
+        return health_check(config, details=cache_stats())
 
 
 def get_api_base_resources(bp_base):
@@ -240,6 +262,31 @@ class Server:
                 )
 
         self.app.app_config = app_config
+        self.app.dataset_cache = DatasetCache(
+            max_datasets=app_config.server__adaptor__cxg_adaptor__dataset_cache__max_datasets,
+            max_open_arrays=app_config.server__adaptor__cxg_adaptor__dataset_cache__max_open_arrays,
+        )
+        self.app.data_portal_cache = TTLCache(
+            max_entries=app_config.server__data_locator__cache__max_entries,
+            stale_ttl=app_config.server__data_locator__cache__stale_ttl,
+        )
+        self.app.diffexp_jobs = JobManager(
+            max_workers=app_config.server__diffexp_jobs__max_workers,
+            max_jobs=app_config.server__diffexp_jobs__max_jobs,
+            result_ttl=app_config.server__diffexp_jobs__result_ttl,
+        )
+        self.app.response_cache = ResponseCache(
+            max_bytes=app_config.server__response_cache__max_bytes,
+            disk_dir=app_config.server__response_cache__disk_dir,
+            disk_max_bytes=app_config.server__response_cache__disk_max_bytes,
+        )
+        self.app.response_compression = ResponseCompression(
+            encodings=app_config.server__encoding__compression__encodings,
+            min_bytes=app_config.server__encoding__compression__min_bytes,
+            levels=app_config.server__encoding__compression__levels,
+            endpoint_levels=app_config.server__encoding__compression__endpoint_levels,
+        )
+        self.warmup_thread = start_warmup(self.app, app_config)
 
         @self.app.before_request
         def pre_request_logging():
@@ -0,0 +1,95 @@
+import logging
+import threading
+
+from server.app.api.util import open_data_adaptor
+from server.common.rest import annotations_var_prefill, data_var_prefill, layout_obs_prefill
+from server.common.utils.data_locator import DataLocator
+
+
+def get_warmup_datasets(app_config):
+    """
+    Return the locations of the datasets to warm up: server.warmup.datasets, followed by those
+    listed in server.warmup.file (one per line, blank lines and #-comments ignored).
+    """
+    locations = list(app_config.server__warmup__datasets or [])
+    manifest = app_config.server__warmup__file
+    if manifest:
+        locator = DataLocator(manifest, region_name=app_config.server__data_locator__s3_region_name)
+        with locator.open() as f:
+            for line in f.read().decode("utf-8").splitlines():
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    locations.append(line)
+
+    # dataset cache keys do not have a trailing slash, see get_dataset_artifact_s3_uri
+    return list(dict.fromkeys(location.rstrip("/") for location in locations))
+
+
+def _default_embedding(data_adaptor):
+    embedding = data_adaptor.get_default_embedding()
+    if embedding is None:
+        names = data_adaptor.get_embedding_names()
+        embedding = names[0] if names else None
+    return embedding
+
+
+def prefetch_dataset(data_adaptor):
+    """
+    Read the data needed to display a dataset when it is first loaded by the client: the group
+    metadata (read when the dataset is opened), schema, var index and default embedding.
+    """
+    schema = data_adaptor.get_schema()
+    data_adaptor.query_var_array(schema["annotations"]["var"]["index"])
+    embedding = _default_embedding(data_adaptor)
+    if embedding is not None:
+        data_adaptor.get_embedding_array(embedding)
+
+
+def prefill_responses(app, data_adaptor, genes):
+    """
+    Load into the response cache the responses requested when a dataset is first loaded by the client:
+    the default embedding (layout/obs) and the var index (annotations/var) - and the expression
+    (data/var) of each of the genes (values of the var index) which are present in the dataset.
+    """
+    var_index = data_adaptor.get_schema()["annotations"]["var"]["index"]
+    embedding = _default_embedding(data_adaptor)
+    if embedding is not None:
+        layout_obs_prefill(app, data_adaptor, [embedding])
+    annotations_var_prefill(app, data_adaptor, [var_index])
+    if genes:
+        present = set(data_adaptor.query_var_array(var_index))
+        data_var_prefill(app, data_adaptor, var_index, [gene for gene in genes if gene in present])
+
+
+def warm_datasets(app, app_config, locations):
+    dataset_cache = app.dataset_cache
+    genes = app_config.server__warmup__genes
+    for location in locations:
+        try:
+            with dataset_cache.data_adaptor(location, lambda loc: open_data_adaptor(loc, app_config)) as data_adaptor:
+                prefetch_dataset(data_adaptor)
+                prefill_responses(app, data_adaptor, genes)
+            logging.info(f"Warmed up dataset {location}")
+        except Exception:
+            logging.warning(f"Failed to warm up dataset {location}", exc_info=True)
+
+
+def start_warmup(app, app_config):
+    """
+    Open and prefetch the hot datasets into the app's dataset cache, and their initial responses into
+    the app's response cache, in a background thread so that server startup is not delayed.  Return
+    the thread, or None if there is nothing to warm up.
+    """
+    try:
+        locations = get_warmup_datasets(app_config)
+    except Exception:
+        logging.warning("Failed to read the warmup dataset list", exc_info=True)
+        return None
+    if not locations:
+        return None
+
+    thread = threading.Thread(
+        target=warm_datasets, args=(app, app_config, locations), name="dataset-warmup", daemon=True
+    )
+    thread.start()
+    return thread
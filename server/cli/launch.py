@@ -141,6 +141,20 @@ def launch_args(func):
         show_default=True,
         help="Location to yaml file with configuration settings",
     )
+    @click.option(
+        "--warmup-dataset",
+        "warmup_datasets",
+        multiple=True,
+        metavar="<dataset location>",
+        help="Dataset (path or URL of a CXG) to open and prefetch at startup. Repeat option for multiple datasets.",
+    )
+    @click.option(
+        "--warmup-file",
+        "warmup_file",
+        default=None,
+        metavar="<file>",
+        help="Location of a file listing datasets to open and prefetch at startup, one per line.",
+    )
     @click.option(
         "--dump-default-config",
         "dump_default_config",
@@ -194,6 +208,8 @@ def launch(
     scripts,
     disable_diffexp,
     config_file,
+    warmup_datasets,
+    warmup_file,
     dump_default_config,
 ):
     """Launch the cellxgene data viewer.
@@ -239,6 +255,10 @@ def launch(
             default_dataset__diffexp__enable=not disable_diffexp,
             default_dataset__diffexp__lfc_cutoff=diffexp_lfc_cutoff,
         )
+        if warmup_datasets:
+            updates["server__warmup__datasets"] = list(warmup_datasets)
+        if warmup_file:
+            updates["server__warmup__file"] = warmup_file
         # Use a default secret if one is not provided
         if not app_config.server__app__flask_secret_key:
             updates["app__flask_secret_key"] = "SparkleAndShine"
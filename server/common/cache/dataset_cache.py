@@ -0,0 +1,154 @@
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from server.common.singleflight import SingleFlight
+
+
+class _CacheEntry:
+    def __init__(self, data_adaptor):
+        self.data_adaptor = data_adaptor
+        self.in_use = 0  # number of requests currently holding the data adaptor
+        self.evicted = False  # True once removed from the cache; closed when no longer in use
+
+
+class DatasetCache:
+    """
+    Process-wide LRU cache of opened data adaptors, keyed by dataset location.
+
+    Opening a dataset validates the CXG structure, reads the group metadata and opens
+    TileDB array handles.  All of this is immutable, and expensive on S3, so the adaptor
+    is shared by every request for the same dataset.
+
+    The cache is bounded by:
+    * max_datasets: the number of datasets held open.
+    * max_open_arrays: the total number of TileDB array handles open across all cached datasets.
+
+    When either limit is exceeded, the least recently used datasets are evicted.  An evicted
+    adaptor is closed (`cleanup()`) once the last request using it has released it.
+
+    Cache state is guarded by a single lock, held only for bookkeeping - datasets are opened
+    outside of the lock.  Concurrent requests for a dataset which is not yet cached wait on a
+    single open, rather than each opening the dataset.  gevent monkey-patches the threading
+    primitives, so this is safe for both threaded and gevent workers.
+
+    Usage:
+        with dataset_cache.data_adaptor(location, factory) as data_adaptor:
+            ...
+    """
+
+    def __init__(self, max_datasets=32, max_open_arrays=512):
+        self.max_datasets = max_datasets
+        self.max_open_arrays = max_open_arrays
+        self.lock = threading.Lock()  # guards entries, and the in_use/evicted state of each entry
+        self.entries = OrderedDict()  # location -> _CacheEntry, least recently used first
+        self.opens = SingleFlight()  # coalesces concurrent opens of the same dataset
+
+    @contextmanager
+    def data_adaptor(self, location, factory):
+        """
+        Context manager returning the cached data adaptor for `location`, calling `factory(location)`
+        to open it on a cache miss.  The adaptor will not be closed while the context is active.
+        """
+        entry = self._acquire(location, factory)
+        try:
+            yield entry.data_adaptor
+        finally:
+            self._release(entry)
+
+    def __contains__(self, location):
+        return location in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def open_array_count(self):
+        with self.lock:
+            return self._open_array_count()
+
+    def evict(self, location):
+        """Remove a dataset from the cache, closing it once it is no longer in use"""
+        with self.lock:
+            entry = self.entries.pop(location, None)
+            to_close = self._mark_evicted([entry] if entry else [])
+        self._close(to_close)
+
+    def clear(self):
+        """Remove all datasets from the cache, closing each once it is no longer in use"""
+        with self.lock:
+            entries = list(self.entries.values())
+            self.entries.clear()
+            to_close = self._mark_evicted(entries)
+        self._close(to_close)
+
+    def _acquire(self, location, factory):
+        while True:
+            with self.lock:
+                entry = self.entries.get(location)
+                if entry is not None:
+                    self.entries.move_to_end(location)
+                    entry.in_use += 1
+                    return entry
+
+            # Cache miss.  Concurrent requests for the same dataset wait on a single open.  The
+            # opened dataset may, rarely, be evicted before this request can acquire it - if so, retry.
+            self.opens.do(location, lambda key: self._open(key, factory))
+
+    def _open(self, location, factory):
+        data_adaptor = factory(location)
+
+        with self.lock:
+            if location in self.entries:
+                # opened concurrently by a request which missed the in-progress open - keep the one already cached.
+                to_close = [_CacheEntry(data_adaptor)]
+            else:
+                entry = _CacheEntry(data_adaptor)
+                self.entries[location] = entry
+                to_close = self._evict_lru(keep=entry)
+
+        self._close(to_close)
+
+    def _release(self, entry):
+        with self.lock:
+            entry.in_use -= 1
+            # array handles are opened lazily while the adaptor is in use, so re-check the budget.
+            to_close = self._evict_lru(keep=None)
+            if entry.evicted and entry.in_use == 0 and entry not in to_close:
+                to_close.append(entry)
+        self._close(to_close)
+
+    def _open_array_count(self):
+        return sum(entry.data_adaptor.get_open_array_count() for entry in self.entries.values())
+
+    def _over_limit(self):
+        if self.max_datasets is not None and len(self.entries) > self.max_datasets:
+            return True
+        return self.max_open_arrays is not None and self._open_array_count() > self.max_open_arrays
+
+    def _evict_lru(self, keep):
+        """
+        Evict least recently used entries until the cache is within its limits.  Must be called
+        with the lock held.  Return the evicted entries which are no longer in use.
+        """
+        evicted = []
+        while self._over_limit():
+            candidates = [loc for loc, entry in self.entries.items() if entry is not keep]
+            if not candidates:
+                break
+            evicted.append(self.entries.pop(candidates[0]))
+        return self._mark_evicted(evicted)
+
+    @staticmethod
+    def _mark_evicted(entries):
+        for entry in entries:
+            entry.evicted = True
+        return [entry for entry in entries if entry.in_use == 0]
+
+    @staticmethod
+    def _close(entries):
+        for entry in entries:
+            try:
+                entry.data_adaptor.cleanup()
+            except Exception:
+                logging.warning("Failed to clean up evicted dataset", exc_info=True)
@@ -0,0 +1,81 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def _sizeof(value):
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class ByteBudgetLRUCache:
+    """
+    Thread-safe LRU cache bounded by the total size, in bytes, of the cached values.
+
+    The size of a value is computed by `sizeof` (by default, `nbytes` for numpy arrays, the sum of
+    the items for tuples, lists and dicts, else sys.getsizeof).  A value larger than the entire
+    budget is not cached.  Hit and miss counts are maintained for monitoring - see `stats()`.
+
+    Cached values are shared by all readers, and must not be modified.
+    """
+
+    def __init__(self, max_bytes, sizeof=_sizeof):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.lock = threading.Lock()  # guards all of the below
+        self.entries = OrderedDict()  # key -> (value, size), least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            self.entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.nbytes -= evicted_size
+
+    def __contains__(self, key):
+        """weak contains - does not affect recency or the hit/miss counts"""
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                entries=len(self.entries),
+                bytes=self.nbytes,
+                max_bytes=self.max_bytes,
+                hits=self.hits,
+                misses=self.misses,
+            )
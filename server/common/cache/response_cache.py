@@ -0,0 +1,121 @@
+import contextlib
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from server.common.cache.lru_cache import ByteBudgetLRUCache
+from server.common.singleflight import SingleFlight
+
+
+class ResponseCache:
+    """
+    Cache of encoded (eg, FBS) response payloads, for endpoints whose response is immutable for a
+    given dataset and request.  Keys are tuples of strings, numbers and None - typically
+    (dataset location, endpoint, canonical request args, nbins).
+
+    There are two tiers:
+    * an in-process LRU, bounded by max_bytes (0 disables it), and
+    * an optional directory of payload files, bounded by disk_max_bytes, which survives restarts and
+      is shared by all server processes using the same directory.  Files are written atomically
+      (write to a temporary file, then rename), and the least recently used files are removed when
+      the directory exceeds its budget.
+
+    Payloads are loaded with `get(key, encode)`.  On a miss, `encode()` is called - concurrent misses
+    for the same key wait on a single call - and its result is stored in both tiers.  Failures of
+    the disk tier are logged and otherwise ignored.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=0):
+        self.memory = ByteBudgetLRUCache(max_bytes=max_bytes, sizeof=len)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_lock = threading.Lock()  # guards the disk counters, and trimming
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.loads = SingleFlight()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key, encode):
+        payload = self.memory.get(key)
+        if payload is None:
+            payload = self.loads.do(key, lambda key: self._load(key, encode))
+        return payload
+
+    def stats(self):
+        stats = self.memory.stats()
+        if self.disk_dir:
+            with self.disk_lock:
+                stats.update(disk_hits=self.disk_hits, disk_misses=self.disk_misses)
+        return stats
+
+    def _load(self, key, encode):
+        payload = self._disk_get(key)
+        if payload is None:
+            payload = encode()
+            self._disk_put(key, payload)
+        self.memory.put(key, payload)
+        return payload
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha256(repr(key).encode("utf-8")).hexdigest())
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            payload = None
+        except OSError:
+            logging.warning(f"Failed to read response cache file {path}", exc_info=True)
+            payload = None
+        with self.disk_lock:
+            if payload is None:
+                self.disk_misses += 1
+            else:
+                self.disk_hits += 1
+        return payload
+
+    def _disk_put(self, key, payload):
+        if not self.disk_dir or len(payload) > self.disk_max_bytes:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp_path, self._disk_path(key))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._disk_trim()
+        except OSError:
+            logging.warning(f"Failed to write response cache file in {self.disk_dir}", exc_info=True)
+
+    def _disk_trim(self):
+        """Remove the least recently used files until the directory is within disk_max_bytes"""
+        with self.disk_lock:
+            files = []
+            for entry in os.scandir(self.disk_dir):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed by another process
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+            nbytes = sum(size for _, size, _ in files)
+            files.sort()
+            for _, size, path in files:
+                if nbytes <= self.disk_max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+                nbytes -= size
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+from server.common.singleflight import SingleFlight
+
+
+class _CacheEntry:
+    def __init__(self, value, expires_at, stale_until):
+        self.value = value
+        self.expires_at = expires_at  # fresh until this time
+        self.stale_until = stale_until  # may be served, if a reload fails, until this time
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after a time-to-live.
+
+    Values are loaded with `get(key, loader, ttl)`:
+    * Concurrent misses for the same key wait on a single call to `loader(key)`.
+    * `ttl` is either the time-to-live in seconds, or a function of the loaded value returning
+      the time-to-live.  This allows, for example, negative results to be cached for less time.
+      A time-to-live of zero (or less) means the value is not cached.
+    * If the loader raises an exception, and an expired value is still within `stale_ttl` seconds
+      of its expiry, the expired value is returned rather than the exception (stale-if-error).
+
+    The clock is injectable for testing.
+    """
+
+    def __init__(self, max_entries=1024, stale_ttl=0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.lock = threading.Lock()  # guards entries
+        self.entries = OrderedDict()  # key -> _CacheEntry, least recently used first
+        self.loads = SingleFlight()
+
+    def get(self, key, loader, ttl):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.clock() < entry.expires_at:
+                self.entries.move_to_end(key)
+                return entry.value
+
+        return self.loads.do(key, lambda k: self._load(k, loader, ttl))
+
+    def _load(self, key, loader, ttl):
+        try:
+            value = loader(key)
+        except Exception:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and self.clock() < entry.stale_until:
+                    return entry.value
+            raise
+
+        seconds = ttl(value) if callable(ttl) else ttl
+        with self.lock:
+            if seconds is None or seconds <= 0:
+                self.entries.pop(key, None)
+            else:
+                now = self.clock()
+                self.entries[key] = _CacheEntry(value, now + seconds, now + seconds + self.stale_ttl)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return value
+
+    def __contains__(self, key):
+        """True if there is an unexpired value for key"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and self.clock() < entry.expires_at
+
+    def __len__(self):
+        return len(self.entries)
+
+    def evict(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
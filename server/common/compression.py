@@ -0,0 +1,79 @@
+"""
+HTTP content encoding (compression) of binary responses.
+
+gzip is always available.  zstd and brotli require the zstandard and brotli modules, which are server
+requirements - but are not offered if they cannot be imported, eg, in a minimal install.
+"""
+
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _zstd_compress(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _brotli_compress(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _gzip_compress(data, level):
+    # mtime=0 so that the output is a function of the data only
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+# content-coding: (compress(data, level), default level)
+CODINGS = {
+    "zstd": (_zstd_compress, 3),
+    "br": (_brotli_compress, 4),
+    "gzip": (_gzip_compress, 6),
+}
+
+AVAILABLE_CODINGS = [
+    coding for coding, module in [("zstd", zstandard), ("br", brotli), ("gzip", gzip)] if module is not None
+]
+
+
+class ResponseCompression:
+    """
+    Negotiates and applies the content encoding of binary responses.
+
+    * encodings: the content codings offered, in order of server preference.  Those whose module is not
+      installed are ignored.
+    * min_bytes: payloads smaller than this are sent uncompressed.
+    * levels: {coding: level}, overriding the default level of each coding.
+    * endpoint_levels: {endpoint: {coding: level}}, overriding levels for an endpoint.  Eg, responses
+      which are cached are compressed once, and may use a slower, denser level.
+    """
+
+    def __init__(self, encodings, min_bytes=0, levels=None, endpoint_levels=None):
+        self.encodings = [coding for coding in encodings if coding in AVAILABLE_CODINGS]
+        self.min_bytes = min_bytes
+        self.levels = {coding: level for coding, (_, level) in CODINGS.items()}
+        self.levels.update(levels or {})
+        self.endpoint_levels = endpoint_levels or {}
+
+    def negotiate(self, accept_encodings, nbytes):
+        """
+        Return the content coding with which to send a payload of nbytes, given the request's
+        Accept-Encoding (a werkzeug Accept), or None if it should be sent uncompressed.
+        """
+        if nbytes < self.min_bytes:
+            return None
+        return accept_encodings.best_match(self.encodings)
+
+    def level(self, endpoint, coding):
+        return self.endpoint_levels.get(endpoint, {}).get(coding, self.levels[coding])
+
+    def compress(self, endpoint, coding, data):
+        compress, _ = CODINGS[coding]
+        return compress(data, self.level(endpoint, coding))
@@ -8,6 +8,7 @@ from flatten_dict import unflatten as _unflatten
 
 from server.common.config.config_model import AppConfigModel
 from server.common.errors import ConfigurationError
+from server.common.threadpool import compute_pool
 from server.default_config import get_default_config
 
 
@@ -138,6 +139,11 @@ class AppConfig(object):
         from server.dataset.cxg_dataset import CxgDataset
 
         CxgDataset.set_tiledb_context(self.server__adaptor__cxg_adaptor__tiledb_ctx)
+        CxgDataset.set_X_column_cache(self.server__adaptor__cxg_adaptor__X_column_cache_bytes)
+        CxgDataset.set_diffexp_cache(self.server__adaptor__cxg_adaptor__diffexp_cache_bytes)
+        CxgDataset.diffexp_memory_limit = self.server__adaptor__cxg_adaptor__diffexp_memory_limit
+        CxgDataset.diffexp_float32 = self.server__adaptor__cxg_adaptor__diffexp_float32
+        compute_pool.configure(self.server__adaptor__cxg_adaptor__compute_threads)
 
     def exceeds_limit(self, limit_name, value):
         limit_value = getattr(self, "server__limits__" + limit_name, None)
@@ -108,6 +108,7 @@ class ServerApp(BaseModel):
 class DatarootValue(BaseModel):
     base_url: str
     dataroot: str
+    trusted: bool = False
 
     @validator("base_url")
     def check_base_url(cls, base_url):
@@ -148,9 +149,30 @@ class MultiDataset(BaseModel):
         return values
 
 
+class DataPortalCache(BaseModel):
+    max_entries: int = 10000
+    ttl: float = 300
+    negative_ttl: float = 30
+    stale_ttl: float = 3600
+
+    @validator("max_entries")
+    def check_max_entries(cls, value):
+        if value < 1:
+            raise ValueError("max_entries must be positive")
+        return value
+
+    @validator("ttl", "negative_ttl", "stale_ttl")
+    def check_ttl(cls, value):
+        if value < 0:
+            raise ValueError("cache time-to-live must not be negative")
+        return value
+
+
 class DataLocator(BaseModel):
     api_base: Optional[str]
     s3_region_name: Union[bool, str, None]
+    timeout: Optional[float] = 10
+    cache: DataPortalCache = Field(default_factory=DataPortalCache)
 
 
 class GeneInfo(BaseModel):
@@ -163,8 +185,43 @@ class TiledbCtx(BaseModel):
     vfs_s3_region: Optional[str] = Field(default=None, alias="vfs.s3.region")
 
 
+class DatasetCache(BaseModel):
+    max_datasets: Optional[int] = 32
+    max_open_arrays: Optional[int] = 512
+
+    @validator("max_datasets", "max_open_arrays")
+    def check_positive(cls, value):
+        if value is not None and value < 1:
+            raise ValueError("dataset_cache limits must be positive")
+        return value
+
+
 class CxgAdaptor(BaseModel):
     tiledb_ctx: TiledbCtx
+    dataset_cache: DatasetCache = Field(default_factory=DatasetCache)
+    X_column_cache_bytes: int = 512 * 1024**2
+    diffexp_cache_bytes: int = 128 * 1024**2
+    diffexp_memory_limit: Optional[int] = 1024**3
+    diffexp_float32: bool = False
+    compute_threads: Optional[int] = None
+
+    @validator("X_column_cache_bytes", "diffexp_cache_bytes")
+    def check_cache_bytes(cls, value):
+        if value < 0:
+            raise ValueError("cache sizes must not be negative")
+        return value
+
+    @validator("diffexp_memory_limit")
+    def check_diffexp_memory_limit(cls, value):
+        if value is not None and value < 1:
+            raise ValueError("diffexp_memory_limit must be positive")
+        return value
+
+    @validator("compute_threads")
+    def check_compute_threads(cls, value):
+        if value is not None and value < 1:
+            raise ValueError("compute_threads must be at least 1")
+        return value
 
 
 class Adaptor(BaseModel):
@@ -174,6 +231,81 @@ class Adaptor(BaseModel):
 class Limits(BaseModel):
     column_request_max: Optional[int]
     diffexp_cellcount_max: Optional[int]
+    diffexp_batch_groups_max: Optional[int] = 100
+
+
+class Warmup(BaseModel):
+    datasets: List[str] = Field(default_factory=list)
+    file: Optional[str] = None
+    genes: List[str] = Field(default_factory=list)
+
+
+class DiffexpJobs(BaseModel):
+    max_workers: int = 2
+    max_jobs: int = 16
+    result_ttl: int = 300
+
+    @validator("max_workers", "max_jobs")
+    def check_positive(cls, value):
+        if value < 1:
+            raise ValueError("must be at least 1")
+        return value
+
+
+class ResponseCache(BaseModel):
+    max_bytes: int = 256 * 1024**2
+    disk_dir: Optional[str] = None
+    disk_max_bytes: int = 4 * 1024**3
+
+    @validator("max_bytes", "disk_max_bytes")
+    def check_cache_bytes(cls, value):
+        if value < 0:
+            raise ValueError("cache sizes must not be negative")
+        return value
+
+
+CONTENT_CODINGS = ["zstd", "br", "gzip"]
+
+
+def _check_content_codings(codings):
+    unknown = set(codings) - set(CONTENT_CODINGS)
+    if unknown:
+        raise ValueError(f"unsupported encodings {sorted(unknown)}, must be one of {CONTENT_CODINGS}")
+
+
+class Compression(BaseModel):
+    encodings: List[str] = Field(default_factory=lambda: list(CONTENT_CODINGS))
+    min_bytes: int = 1024
+    levels: Dict[str, int] = Field(default_factory=dict)
+    endpoint_levels: Dict[str, Dict[str, int]] = Field(default_factory=dict)
+
+    @validator("encodings", "levels")
+    def check_encodings(cls, value):
+        _check_content_codings(value)
+        return value
+
+    @validator("endpoint_levels")
+    def check_endpoint_levels(cls, value):
+        for levels in value.values():
+            _check_content_codings(levels)
+        return value
+
+    @validator("min_bytes")
+    def check_min_bytes(cls, value):
+        if value < 0:
+            raise ValueError("must not be negative")
+        return value
+
+
+class Encoding(BaseModel):
+    sparse_density_threshold: Optional[float] = 0.1
+    compression: Compression = Field(default_factory=Compression)
+
+    @validator("sparse_density_threshold")
+    def check_sparse_density_threshold(cls, value):
+        if value is not None and not 0 < value <= 1:
+            raise ValueError("must be in the range (0, 1]")
+        return value
 
 
 class Server(BaseModel):
@@ -183,6 +315,10 @@ class Server(BaseModel):
     gene_info: GeneInfo
     adaptor: Adaptor
     limits: Limits
+    warmup: Warmup = Field(default_factory=Warmup)
+    diffexp_jobs: DiffexpJobs = Field(default_factory=DiffexpJobs)
+    response_cache: ResponseCache = Field(default_factory=ResponseCache)
+    encoding: Encoding = Field(default_factory=Encoding)
 
     @root_validator(skip_on_failure=True)
     def check_data_locator(cls, values):
@@ -254,6 +390,14 @@ class Diffexp(BaseModel):
     lfc_cutoff: float
     top_n: int
     count: int = 15
+    approximate_sample_size: int = 20000
+    approximate_seed: int = 0
+
+    @validator("approximate_sample_size")
+    def check_approximate_sample_size(cls, value):
+        if value < 2:
+            raise ValueError("must be at least 2")
+        return value
 
 
 class XApproximateDistributionEnum(str, Enum):
@@ -24,6 +24,11 @@ class DiffExpMode(AugmentedEnum):
     VAR_FILTER = "varFilter"
 
 
+class DiffExpTest(AugmentedEnum):
+    TTEST = "ttest"
+    WILCOXON = "wilcoxon"
+
+
 class XApproximateDistribution(AugmentedEnum):
     NORMAL = "normal"
     COUNT = "count"
@@ -1,4 +1,4 @@
-from .diffexpdu import DiffExArguments
+from .diffexpdu import DiffExArguments, DiffExBatchArguments
 from .postingslist import deflate_postings_lists, inflate_postings_lists
 
-__all__ = ["deflate_postings_lists", "inflate_postings_lists", "DiffExArguments"]
+__all__ = ["deflate_postings_lists", "inflate_postings_lists", "DiffExArguments", "DiffExBatchArguments"]
@@ -1,13 +1,13 @@
 import struct
 from dataclasses import dataclass
 from enum import IntEnum
-from typing import ClassVar, Type, TypeVar, Union
+from typing import ClassVar, List, Type, TypeVar, Union
 
 import numpy as np
 
 from .postingslist import deflate_postings_lists, inflate_postings_lists
 
-__all__ = ["DiffExArguments"]
+__all__ = ["DiffExArguments", "DiffExBatchArguments"]
 
 # Pack/unpack support for various types
 # The format is documented in `dev_docs/diffexpdu.md`
@@ -48,6 +48,8 @@ class DiffExArguments:
     class DiffExMode(IntEnum):
         TopN = 0
         VarFilter = 1  # unsupported
+        OneVsRest = 2  # DiffExBatchArguments only
+        WilcoxonTopN = 3  # as TopN, using the Wilcoxon rank-sum test rather than Welch's t-test
 
     @dataclass
     class TopNParams:
@@ -62,6 +64,9 @@ class DiffExArguments:
         def pack(self) -> bytes:
             return topNParamsPacker.pack(self.N)
 
+    # modes which take TopNParams, and two cell sets
+    TOP_N_MODES: ClassVar = (DiffExMode.TopN, DiffExMode.WilcoxonTopN)
+
     mode: DiffExMode
     params: TopNParams
     set1: np.ndarray
@@ -74,7 +79,7 @@ class DiffExArguments:
         """
         (magic, mode) = headerPacker.unpack_from(buf, offset)
         assert magic == MAGIC_NUMBER
-        assert mode == DiffExArguments.DiffExMode.TopN
+        assert mode in DiffExArguments.TOP_N_MODES
         offset += headerPacker.size
 
         params = DiffExArguments.TopNParams.unpack_from(buf, offset)
@@ -85,7 +90,7 @@ class DiffExArguments:
 
     def pack(self):
         """Pack the instance of DiffExArguments into a buffer."""
-        assert self.mode == DiffExArguments.DiffExMode.TopN
+        assert self.mode in DiffExArguments.TOP_N_MODES
         return (
             headerPacker.pack(MAGIC_NUMBER, self.mode)
             + self.params.pack()
@@ -99,3 +104,47 @@ class DiffExArguments:
             and np.array_equal(self.set1, other.set1)
             and np.array_equal(self.set2, other.set2)
         )
+
+
+@dataclass
+class DiffExBatchArguments:
+    """
+    Encode arguments for the one-vs-rest batch differential expression (/diffexp/batch) REST API in
+    a binary format - as DiffExArguments, but with mode OneVsRest, and 1 to 8 cell sets, each of which
+    is compared with all other cells.  PDU format is documented in `dev_docs/diffexpdu.md`.
+
+    IMPORTANT: the cell sets *MUST* be disjoint and sorted (increasing).
+    """
+
+    mode: DiffExArguments.DiffExMode
+    params: DiffExArguments.TopNParams
+    sets: List[np.ndarray]
+
+    @classmethod
+    def unpack_from(cls: Type[T], buf: Union[bytes, bytearray, memoryview], offset=0) -> T:
+        """
+        Given a buffer containing encoded parameters, unpack and return an instance of DiffExBatchArguments.
+        """
+        (magic, mode) = headerPacker.unpack_from(buf, offset)
+        assert magic == MAGIC_NUMBER
+        assert mode == DiffExArguments.DiffExMode.OneVsRest
+        offset += headerPacker.size
+
+        params = DiffExArguments.TopNParams.unpack_from(buf, offset)
+        offset += DiffExArguments.TopNParams.packed_size
+        sets = inflate_postings_lists(buf, offset=offset)
+
+        return DiffExBatchArguments(mode=mode, params=params, sets=sets)
+
+    def pack(self):
+        """Pack the instance of DiffExBatchArguments into a buffer."""
+        assert self.mode == DiffExArguments.DiffExMode.OneVsRest
+        return headerPacker.pack(MAGIC_NUMBER, self.mode) + self.params.pack() + deflate_postings_lists(self.sets)
+
+    def __eq__(self, other) -> bool:
+        return (
+            self.mode == other.mode
+            and self.params == other.params
+            and len(self.sets) == len(other.sets)
+            and all(np.array_equal(a, b) for a, b in zip(self.sets, other.sets))
+        )
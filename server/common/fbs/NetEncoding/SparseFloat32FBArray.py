@@ -0,0 +1,156 @@
+# automatically generated by the FlatBuffers compiler, do not modify
+
+# namespace: NetEncoding
+
+import flatbuffers
+from flatbuffers.compat import import_numpy
+
+np = import_numpy()
+
+
+class SparseFloat32FBArray(object):
+    __slots__ = ["_tab"]
+
+    @classmethod
+    def GetRootAs(cls, buf, offset=0):
+        n = flatbuffers.encode.Get(flatbuffers.packer.uoffset, buf, offset)
+        x = SparseFloat32FBArray()
+        x.Init(buf, n + offset)
+        return x
+
+    @classmethod
+    def GetRootAsSparseFloat32FBArray(cls, buf, offset=0):
+        """This method is deprecated. Please switch to GetRootAs."""
+        return cls.GetRootAs(buf, offset)
+
+    # SparseFloat32FBArray
+    def Init(self, buf, pos):
+        self._tab = flatbuffers.table.Table(buf, pos)
+
+    # SparseFloat32FBArray
+    def Length(self):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(4))
+        if o != 0:
+            return self._tab.Get(flatbuffers.number_types.Uint32Flags, o + self._tab.Pos)
+        return 0
+
+    # SparseFloat32FBArray
+    def Indices(self, j):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(6))
+        if o != 0:
+            a = self._tab.Vector(o)
+            return self._tab.Get(
+                flatbuffers.number_types.Uint32Flags, a + flatbuffers.number_types.UOffsetTFlags.py_type(j * 4)
+            )
+        return 0
+
+    # SparseFloat32FBArray
+    def IndicesAsNumpy(self):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(6))
+        if o != 0:
+            return self._tab.GetVectorAsNumpy(flatbuffers.number_types.Uint32Flags, o)
+        return 0
+
+    # SparseFloat32FBArray
+    def IndicesLength(self):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(6))
+        if o != 0:
+            return self._tab.VectorLen(o)
+        return 0
+
+    # SparseFloat32FBArray
+    def IndicesIsNone(self):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(6))
+        return o == 0
+
+    # SparseFloat32FBArray
+    def Values(self, j):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(8))
+        if o != 0:
+            a = self._tab.Vector(o)
+            return self._tab.Get(
+                flatbuffers.number_types.Float32Flags, a + flatbuffers.number_types.UOffsetTFlags.py_type(j * 4)
+            )
+        return 0
+
+    # SparseFloat32FBArray
+    def ValuesAsNumpy(self):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(8))
+        if o != 0:
+            return self._tab.GetVectorAsNumpy(flatbuffers.number_types.Float32Flags, o)
+        return 0
+
+    # SparseFloat32FBArray
+    def ValuesLength(self):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(8))
+        if o != 0:
+            return self._tab.VectorLen(o)
+        return 0
+
+    # SparseFloat32FBArray
+    def ValuesIsNone(self):
+        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(8))
+        return o == 0
+
+
+def Start(builder):
+    builder.StartObject(3)
+
+
+def SparseFloat32FBArrayStart(builder):
+    """This method is deprecated. Please switch to Start."""
+    return Start(builder)
+
+
+def AddLength(builder, length):
+    builder.PrependUint32Slot(0, length, 0)
+
+
+def SparseFloat32FBArrayAddLength(builder, length):
+    """This method is deprecated. Please switch to AddLength."""
+    return AddLength(builder, length)
+
+
+def AddIndices(builder, indices):
+    builder.PrependUOffsetTRelativeSlot(1, flatbuffers.number_types.UOffsetTFlags.py_type(indices), 0)
+
+
+def SparseFloat32FBArrayAddIndices(builder, indices):
+    """This method is deprecated. Please switch to AddIndices."""
+    return AddIndices(builder, indices)
+
+
+def StartIndicesVector(builder, numElems):
+    return builder.StartVector(4, numElems, 4)
+
+
+def SparseFloat32FBArrayStartIndicesVector(builder, numElems):
+    """This method is deprecated. Please switch to Start."""
+    return StartIndicesVector(builder, numElems)
+
+
+def AddValues(builder, values):
+    builder.PrependUOffsetTRelativeSlot(2, flatbuffers.number_types.UOffsetTFlags.py_type(values), 0)
+
+
+def SparseFloat32FBArrayAddValues(builder, values):
+    """This method is deprecated. Please switch to AddValues."""
+    return AddValues(builder, values)
+
+
+def StartValuesVector(builder, numElems):
+    return builder.StartVector(4, numElems, 4)
+
+
+def SparseFloat32FBArrayStartValuesVector(builder, numElems):
+    """This method is deprecated. Please switch to Start."""
+    return StartValuesVector(builder, numElems)
+
+
+def End(builder):
+    return builder.EndObject()
+
+
+def SparseFloat32FBArrayEnd(builder):
+    """This method is deprecated. Please switch to End."""
+    return End(builder)
@@ -14,3 +14,4 @@ class TypedFBArray(object):
     DictEncoded16FBArray = 7
     DictEncoded32FBArray = 8
     Int16EncodedXFBArray = 9
+    SparseFloat32FBArray = 10
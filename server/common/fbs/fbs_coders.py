@@ -12,15 +12,17 @@ import server.common.fbs.NetEncoding.Float64FBArray as Float64FBArray
 import server.common.fbs.NetEncoding.Int16EncodedXFBArray as Int16EncodedXFBArray
 import server.common.fbs.NetEncoding.Int32FBArray as Int32FBArray
 import server.common.fbs.NetEncoding.JSONEncodedFBArray as JSONEncodedFBArray
+import server.common.fbs.NetEncoding.SparseFloat32FBArray as SparseFloat32FBArray
 import server.common.fbs.NetEncoding.TypedFBArray as TypedFBArray
 import server.common.fbs.NetEncoding.Uint32FBArray as Uint32FBArray
+from server.common.fbs.writer import Scalar, Table, Vector
 from server.common.utils.type_conversion_utils import get_encoding_dtype_of_array
 
 
 class DenseNumericIntCoder:
     n_slots = 4
 
-    def encode_array(self, array, builder, _dtype, num_bins=None):
+    def encode_array(self, array, _dtype, num_bins=None, **kwargs):
         if num_bins is None:
             raise ValueError("num_bins must be specified for DenseNumericIntCoder")
 
@@ -28,19 +30,22 @@ class DenseNumericIntCoder:
         if isinstance(array, pd.Series):
             array = array.to_numpy()
         elif sp.issparse(array):
-            array = array.A.flatten()
+            array = array.toarray().ravel()
 
         max_val = array.max().astype("float32")
         min_val = array.min().astype("float32")
-        int_coded = np.int16((array - min_val) / (max_val - min_val) * num_bins)
-        vec = builder.CreateNumpyVector(int_coded)
 
-        builder.StartObject(self.n_slots)
-        builder.PrependUOffsetTRelativeSlot(0, vec, 0)
-        builder.PrependFloat32Slot(1, max_val, 0)
-        builder.PrependFloat32Slot(2, min_val, 0)
-        builder.PrependInt32Slot(3, num_bins, 0)
-        return builder.EndObject()
+        def fill(dst):
+            dst[:] = (array - min_val) / (max_val - min_val) * num_bins
+
+        return Table(
+            [
+                Vector(np.int16, len(array), fill),
+                Scalar(np.float32, max_val),
+                Scalar(np.float32, min_val),
+                Scalar(np.int32, num_bins),
+            ]
+        )
 
     def decode_array(self, u, TarType):
         arr = TarType()
@@ -55,20 +60,18 @@ class DenseNumericIntCoder:
 class DenseNumericCoder:
     n_slots = 1
 
-    def encode_array(self, array, builder, dtype, **kwargs):
-        # convert pandas series to numpy array
-        if isinstance(array, pd.Series):
-            array = array.to_numpy()
-        elif sp.issparse(array):
-            array = array.A.flatten()
-        # convert to the specified dtype
-        if np.dtype(array.dtype).str != dtype:
-            array = array.astype(dtype)
+    def encode_array(self, array, dtype, **kwargs):
+        if sp.issparse(array):
+            # a single column: the vector is zero-initialized, so only the stored values are written
+            column = sp.csc_matrix(array)
+
+            def fill(dst):
+                dst[column.indices] = column.data
+
+            return Table([Vector(dtype, column.shape[0], fill)])
 
-        vec = builder.CreateNumpyVector(array)
-        builder.StartObject(self.n_slots)
-        builder.PrependUOffsetTRelativeSlot(0, vec, 0)
-        return builder.EndObject()
+        # converted to the specified dtype as it is written
+        return Table([Vector.from_array(dtype, array)])
 
     def decode_array(self, u, TarType):
         arr = TarType()
@@ -76,24 +79,85 @@ class DenseNumericCoder:
         return arr.DataAsNumpy()
 
 
+class SparseNumericCoder:
+    n_slots = 3
+
+    def encode_array(self, array, dtype, **kwargs):
+        if sp.issparse(array):
+            column = sp.csc_matrix(array)
+            column.sum_duplicates()  # sorts the indices
+            indices, values = column.indices, column.data
+            nonzero = values != 0
+            if not nonzero.all():  # explicitly stored zeros
+                indices, values = indices[nonzero], values[nonzero]
+        else:
+            if isinstance(array, pd.Series):
+                array = array.to_numpy()
+            indices = np.flatnonzero(array)
+            values = array[indices]
+
+        return Table(
+            [
+                Scalar(np.uint32, array.shape[0]),
+                Vector.from_array(np.uint32, indices),
+                Vector.from_array(dtype, values),
+            ]
+        )
+
+    def decode_array(self, u, TarType):
+        arr = TarType()
+        arr.Init(u.Bytes, u.Pos)
+        data = np.zeros(arr.Length(), dtype=np.float32)
+        if arr.IndicesLength() > 0:
+            data[arr.IndicesAsNumpy()] = arr.ValuesAsNumpy()
+        return data
+
+
+def encode_category_dictionary(categories):
+    """The code-to-value dictionary of the categories, JSON encoded in utf-8"""
+    return json.dumps(dict(enumerate(categories))).encode("utf-8")
+
+
+class CategoryDictionaryCache:
+    """
+    Memoized category dictionaries (see encode_category_dictionary) of the categorical columns of a
+    dataset, by column name.  For a large number of categories, encoding the dictionary is much more
+    expensive than encoding the codes.
+
+    A memoized dictionary is used only if its categories are those of the column, so the cache is
+    never stale.  Columns created with the same categories object - eg, with the dataset's interned
+    CategoricalDtype - are checked by identity, others by comparing the categories.
+    """
+
+    def __init__(self):
+        self.dictionaries = {}  # column name -> (categories, dictionary)
+
+    def get(self, name, categories):
+        entry = self.dictionaries.get(name)
+        if entry is not None and (entry[0] is categories or entry[0].equals(categories)):
+            return entry[1]
+        dictionary = encode_category_dictionary(categories)
+        self.dictionaries[name] = (categories, dictionary)
+        return dictionary
+
+
 class CategoricalCoder:
     n_slots = 2
 
-    def encode_array(self, array, builder, dtype, **kwargs):
+    def encode_array(self, array, dtype, category_dictionaries=None, **kwargs):
         if isinstance(array, pd.Series) and array.dtype.name == "category":
-            # create the code-to-value dictionary and encode in utf-8 as a byte array
-            dictionary = np.array(bytearray(json.dumps(dict(enumerate(array.cat.categories))), "utf-8"))
+            # the code-to-value dictionary, encoded in utf-8 as a byte array
+            categories = array.cat.categories
+            if category_dictionaries is not None and array.name is not None:
+                dictionary = category_dictionaries.get(array.name, categories)
+            else:
+                dictionary = encode_category_dictionary(categories)
             codes = array.cat.codes.values
 
             # ensure that the dtype is able to afford the number of categories
             assert len(array.cat.categories) <= np.iinfo(dtype).max + 1
 
-            vec_codes = builder.CreateNumpyVector(codes)
-            vec_dictionary = builder.CreateNumpyVector(dictionary)
-            builder.StartObject(self.n_slots)
-            builder.PrependUOffsetTRelativeSlot(0, vec_codes, 0)
-            builder.PrependUOffsetTRelativeSlot(1, vec_dictionary, 0)
-            return builder.EndObject()
+            return Table([Vector.from_array(dtype, codes), Vector.from_bytes(dictionary)])
         else:
             raise ValueError("Input array must be pandas Categorical.")
 
@@ -119,18 +183,13 @@ class CategoricalCoder:
 class PolymorphicCoder:
     n_slots = 1
 
-    def encode_array(self, array, builder, dtype=None, **kwargs):
+    def encode_array(self, array, dtype=None, **kwargs):
         # dtype is unused here as array is just getting slammed into a JSON
         if sp.issparse(array):
-            array = array.A.flatten()
+            array = array.toarray().ravel()
         array = pd.Series(array)
         as_json = array.to_json(orient="records")
-        json_array = np.array(bytearray(as_json, "utf-8"))
-
-        vec = builder.CreateNumpyVector(json_array)
-        builder.StartObject(self.n_slots)
-        builder.PrependUOffsetTRelativeSlot(0, vec, 0)
-        return builder.EndObject()
+        return Table([Vector.from_bytes(as_json.encode("utf-8"))])
 
     def decode_array(self, u, TarType):
         arr = TarType()
@@ -168,6 +227,15 @@ ARRAY_ENCODER = {
     },
 }
 
+# the element type of the numeric arrays, to which values are converted as they are encoded
+NUMERIC_ARRAY_DTYPE = {
+    TypedFBArray.TypedFBArray.Float32FBArray: np.dtype(np.float32).str,
+    TypedFBArray.TypedFBArray.Int32FBArray: np.dtype(np.int32).str,
+    TypedFBArray.TypedFBArray.Uint32FBArray: np.dtype(np.uint32).str,
+    TypedFBArray.TypedFBArray.Float64FBArray: np.dtype(np.float64).str,
+    TypedFBArray.TypedFBArray.SparseFloat32FBArray: np.dtype(np.float32).str,
+}
+
 TYPE_MAP = {
     TypedFBArray.TypedFBArray.NONE: (None, None),
     TypedFBArray.TypedFBArray.Uint32FBArray: (DenseNumericCoder, Uint32FBArray.Uint32FBArray),
@@ -175,6 +243,7 @@ TYPE_MAP = {
     TypedFBArray.TypedFBArray.Float32FBArray: (DenseNumericCoder, Float32FBArray.Float32FBArray),
     TypedFBArray.TypedFBArray.Float64FBArray: (DenseNumericCoder, Float64FBArray.Float64FBArray),
     TypedFBArray.TypedFBArray.Int16EncodedXFBArray: (DenseNumericIntCoder, Int16EncodedXFBArray.Int16EncodedXFBArray),
+    TypedFBArray.TypedFBArray.SparseFloat32FBArray: (SparseNumericCoder, SparseFloat32FBArray.SparseFloat32FBArray),
     TypedFBArray.TypedFBArray.JSONEncodedFBArray: (PolymorphicCoder, JSONEncodedFBArray.JSONEncodedFBArray),
     TypedFBArray.TypedFBArray.DictEncoded8FBArray: (CategoricalCoder, DictEncoded8FBArray.DictEncoded8FBArray),
     TypedFBArray.TypedFBArray.DictEncoded16FBArray: (CategoricalCoder, DictEncoded16FBArray.DictEncoded16FBArray),
@@ -197,7 +266,24 @@ def _get_array_class(array, num_bins=None):
         return array_class, dtype
 
 
-def serialize_typed_array(builder, source_array, num_bins=None):
+def _density(array):
+    """The fraction of the elements of the (1D, or single column) array which are non-zero"""
+    n = array.shape[0]
+    if n == 0:
+        return 1.0
+    nnz = array.count_nonzero() if sp.issparse(array) else np.count_nonzero(array)
+    return nnz / n
+
+
+def serialize_typed_array(source_array, num_bins=None, sparse_threshold=None, category_dictionaries=None):
+    """
+    Return the (TypedFBArray union type, Table) encoding the source array.
+
+    If sparse_threshold is specified, float arrays with a density (fraction of non-zero elements) below
+    the threshold are encoded as a SparseFloat32FBArray, unless num_bins requests lossy compression.
+    If category_dictionaries (a CategoryDictionaryCache) is specified, the dictionary of a named
+    categorical Series is taken from it.
+    """
     if isinstance(source_array, pd.Index):
         source_array = source_array.to_series()
 
@@ -205,11 +291,20 @@ def serialize_typed_array(builder, source_array, num_bins=None):
     # the default coder will assume the data is polymorphic and yield a JSON encoded array
     defaultCoder = (PolymorphicCoder, TypedFBArray.TypedFBArray.JSONEncodedFBArray)
     Coder, array_type = ARRAY_ENCODER[array_class].get(encoding_dtype, defaultCoder)
+    if (
+        sparse_threshold is not None
+        and array_type == TypedFBArray.TypedFBArray.Float32FBArray
+        and _density(source_array) < sparse_threshold
+    ):
+        Coder, array_type = SparseNumericCoder, TypedFBArray.TypedFBArray.SparseFloat32FBArray
 
     coder_obj = Coder()
-    # for encoding, we require the source array, flatbuffer builder, encoding data type, and
-    # number of bins for lossy integer compression
-    array_value = coder_obj.encode_array(source_array, builder, encoding_dtype, num_bins=num_bins)
+    # for encoding, we require the source array, encoding data type, and number of bins for lossy
+    # integer compression
+    encoding_dtype = NUMERIC_ARRAY_DTYPE.get(array_type, encoding_dtype)
+    array_value = coder_obj.encode_array(
+        source_array, encoding_dtype, num_bins=num_bins, category_dictionaries=category_dictionaries
+    )
     return (array_type, array_value)
 
 
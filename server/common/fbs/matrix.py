@@ -2,68 +2,69 @@ import json
 
 import numpy as np
 import pandas as pd
-from flatbuffers import Builder
 from scipy import sparse
 
-import server.common.fbs.NetEncoding.Column as Column
 import server.common.fbs.NetEncoding.Matrix as Matrix
 import server.common.fbs.NetEncoding.TypedFBArray as TypedFBArray
 from server.common.fbs.fbs_coders import deserialize_typed_array, serialize_typed_array
+from server.common.fbs.writer import Scalar, Table, TableVector, serialize
 
 # Serialization helper
 
 
-def serialize_column(builder, typed_arr):
+def serialize_column(typed_arr):
     """Serialize NetEncoding.Column"""
 
     (union_type, u_value) = typed_arr
-    Column.ColumnStart(builder)
-    Column.ColumnAddUType(builder, union_type)
-    Column.ColumnAddU(builder, u_value)
-    return Column.ColumnEnd(builder)
+    return Table([Scalar(np.uint8, union_type), u_value])
 
 
 # Serialization helper
-def serialize_matrix(builder, n_rows, n_cols, columns, col_idx):
+def serialize_matrix(n_rows, n_cols, columns, col_idx):
     """Serialize NetEncoding.Matrix"""
 
-    Matrix.MatrixStart(builder)
-    Matrix.MatrixAddNRows(builder, n_rows)
-    Matrix.MatrixAddNCols(builder, n_cols)
-    Matrix.MatrixAddColumns(builder, columns)
+    fields = [Scalar(np.uint32, n_rows), Scalar(np.uint32, n_cols), TableVector(columns)]
     if col_idx is not None:
         (union_type, u_val) = col_idx
-        Matrix.MatrixAddColIndexType(builder, union_type)
-        Matrix.MatrixAddColIndex(builder, u_val)
-    return Matrix.MatrixEnd(builder)
+        fields += [Scalar(np.uint8, union_type), u_val]
+    return Table(fields)
 
 
-def guess_at_mem_needed(matrix):
-    (n_rows, n_cols) = matrix.shape
-    if isinstance(matrix, np.ndarray) or sparse.issparse(matrix):
-        guess = (n_rows * n_cols * matrix.dtype.itemsize) + 1024
-    elif isinstance(matrix, pd.DataFrame):
-        guess = pd.DataFrame.memory_usage(matrix).values.sum()
-    elif isinstance(matrix, pd.Series):
-        guess = pd.Series.memory_usage(matrix)
-    elif isinstance(matrix, pd.Categorical):
-        guess = pd.Categorical.memory_usage(matrix)
+def iter_columns(matrix):
+    """
+    Yield the columns of the matrix, without copying: a Series (DataFrame), a strided view (ndarray)
+    or an (n_rows, 1) sparse matrix (scipy.sparse.csc_matrix).
+    """
+    if isinstance(matrix, pd.DataFrame):
+        for _, col in matrix.items():
+            yield col
+    elif sparse.issparse(matrix):
+        for cidx in range(matrix.shape[1]):
+            start, end = matrix.indptr[cidx], matrix.indptr[cidx + 1]
+            yield sparse.csc_matrix(
+                (matrix.data[start:end], matrix.indices[start:end], [0, end - start]), shape=(matrix.shape[0], 1)
+            )
     else:
-        guess = 1
-
-    # round up to nearest 1024 bytes
-    guess = (guess + 0x400) & (~0x3FF)
-    return guess
+        for cidx in range(matrix.shape[1]):
+            yield matrix[:, cidx]
 
 
-def encode_matrix_fbs(matrix, row_idx=None, col_idx=None, num_bins=None):
+def encode_matrix_fbs(
+    matrix, row_idx=None, col_idx=None, num_bins=None, sparse_threshold=None, category_dictionaries=None
+):
     """
     Given a 2D DataFrame, ndarray or sparse equivalent, create and return a Matrix flatbuffer.
 
+    The flatbuffer is returned as a bytearray, of exactly the encoded size, into which each column
+    has been written once, directly from the source matrix - see server.common.fbs.writer.
+
     :param matrix: 2D DataFrame, ndarray or sparse equivalent
     :param row_idx: array-like index for row dimension or pandas.Index (not supported)
     :param col_idx: array-like index for col dimension or pandas.Index
     :param num_bins: number of bins to use for lossy compression of float data. if unset, no compression.
+    :param sparse_threshold: float columns with a density (fraction of non-zero values) below this threshold
+        are sparse encoded. if unset, no columns are sparse encoded.
+    :param category_dictionaries: CategoryDictionaryCache memoizing the dictionaries of categorical columns.
 
     NOTE: row indices are (currently) unsupported and must be None
     """
@@ -77,46 +78,27 @@ def encode_matrix_fbs(matrix, row_idx=None, col_idx=None, num_bins=None):
         col_idx = matrix.columns
 
     if sparse.issparse(matrix):
-        matrix = matrix.toarray()
+        matrix = sparse.csc_matrix(matrix)
 
     (n_rows, n_cols) = matrix.shape
-    # estimate size needed, so we don't unnecessarily realloc.
-    builder = Builder(guess_at_mem_needed(matrix))
-
-    columns = []
-    for cidx in range(n_cols - 1, -1, -1):
-        # serialize the typed array
-
-        col = matrix.iloc[:, cidx] if isinstance(matrix, pd.DataFrame) else matrix[:, cidx]
-
-        typed_arr = serialize_typed_array(builder, col, num_bins=num_bins)
-
-        # serialize the Column union
-        columns.append(serialize_column(builder, typed_arr))
-
-    # Serialize Matrix.columns[]
-    Matrix.MatrixStartColumnsVector(builder, n_cols)
-    for c in columns:
-        builder.PrependUOffsetTRelative(c)
-    matrix_column_vec = builder.EndVector(n_cols)
+    columns = [
+        serialize_column(
+            serialize_typed_array(
+                col,
+                num_bins=num_bins,
+                sparse_threshold=sparse_threshold,
+                category_dictionaries=category_dictionaries,
+            )
+        )
+        for col in iter_columns(matrix)
+    ]
 
     # serialize the colIndex if provided
     cidx = None
     if col_idx is not None:
-        cidx = serialize_typed_array(builder, col_idx)
-
-    # Serialize Matrix
-    matrix = serialize_matrix(builder, n_rows, n_cols, matrix_column_vec, cidx)
-
-    builder.Finish(matrix)
-
-    output = builder.Output()
-
-    # Werkzeug has strict requirements that the response data must be in bytes
-    if isinstance(output, bytearray):
-        output = bytes(output)
+        cidx = serialize_typed_array(col_idx)
 
-    return output
+    return serialize(serialize_matrix(n_rows, n_cols, columns, cidx))
 
 
 def decode_matrix_fbs(fbs):
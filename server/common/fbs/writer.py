@@ -0,0 +1,156 @@
+"""
+Exact-size FlatBuffers serialization.
+
+The flatbuffers Builder serializes back-to-front into a buffer which it grows as needed, and each
+vector is copied at least twice (numpy.ndarray.tobytes(), then into the builder) before the finished
+buffer is copied out again.  For large matrices, those copies dominate the cost of encoding.
+
+Here, a message is first described as a tree of Table, Vector, TableVector and Scalar objects.  Its
+layout is then computed - front-to-back, parents before children, so that all offsets are forward as
+FlatBuffers requires - giving the exact size of the message.  Finally, each vector is written once,
+directly from its source array, into a single preallocated buffer.
+"""
+
+import numpy as np
+
+UOFFSET = np.dtype("<u4")
+SOFFSET = np.dtype("<i4")
+VOFFSET = np.dtype("<u2")
+
+
+def _align(pos, alignment):
+    return (pos + alignment - 1) & ~(alignment - 1)
+
+
+def _put(buf, dtype, pos, value):
+    np.frombuffer(buf, dtype=dtype, count=1, offset=pos)[0] = value
+
+
+class Scalar:
+    """A scalar table field"""
+
+    def __init__(self, dtype, value):
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.value = value
+
+    @property
+    def size(self):
+        return self.dtype.itemsize
+
+
+class Vector:
+    """
+    A vector of scalars.  `fill(dst)` is called, when the message is written, to write the `length`
+    elements into `dst`, a zero-initialized ndarray view of the message buffer.
+    """
+
+    size = UOFFSET.itemsize  # of the field referencing the vector
+
+    def __init__(self, dtype, length, fill):
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.length = length
+        self.fill = fill
+        self.pos = None
+
+    @classmethod
+    def from_array(cls, dtype, array):
+        """A vector of the elements of array, converted to dtype as they are written"""
+        return cls(dtype, len(array), lambda dst: np.copyto(dst, array, casting="unsafe"))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(np.uint8, len(data), lambda dst: np.copyto(dst, np.frombuffer(data, dtype=np.uint8)))
+
+    def layout(self, pos):
+        # the elements follow the uint32 length, and are aligned to their size
+        self.pos = _align(pos + UOFFSET.itemsize, max(self.dtype.itemsize, UOFFSET.itemsize)) - UOFFSET.itemsize
+        return self.pos + UOFFSET.itemsize + self.length * self.dtype.itemsize
+
+    def write(self, buf):
+        _put(buf, UOFFSET, self.pos, self.length)
+        self.fill(np.frombuffer(buf, dtype=self.dtype, count=self.length, offset=self.pos + UOFFSET.itemsize))
+
+
+class TableVector:
+    """A vector of tables"""
+
+    size = UOFFSET.itemsize
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.pos = None
+
+    def layout(self, pos):
+        self.pos = _align(pos, UOFFSET.itemsize)
+        end = self.pos + UOFFSET.itemsize * (1 + len(self.tables))
+        for table in self.tables:
+            end = table.layout(end)
+        return end
+
+    def write(self, buf):
+        _put(buf, UOFFSET, self.pos, len(self.tables))
+        for i, table in enumerate(self.tables):
+            element_pos = self.pos + UOFFSET.itemsize * (1 + i)
+            _put(buf, UOFFSET, element_pos, table.pos - element_pos)
+            table.write(buf)
+
+
+class Table:
+    """A table: fields is a list, indexed by slot, of Scalar, Vector, TableVector, Table or None (unset)"""
+
+    size = UOFFSET.itemsize
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.pos = None
+        self.vtable_pos = None
+        self.field_offsets = None
+        self.table_size = None
+
+    def layout(self, pos):
+        # fields are placed largest first, so that each is aligned to its size without padding
+        self.field_offsets = [0] * len(self.fields)
+        offset = SOFFSET.itemsize
+        slots = [slot for slot, field in enumerate(self.fields) if field is not None]
+        for slot in sorted(slots, key=lambda slot: self.fields[slot].size, reverse=True):
+            offset = _align(offset, self.fields[slot].size)
+            self.field_offsets[slot] = offset
+            offset += self.fields[slot].size
+        self.table_size = offset
+
+        # the table is aligned to its largest field, so that the fields are aligned in the buffer.  Any padding
+        # follows the vtable, which is located by the (signed) offset at the start of the table.
+        self.vtable_pos = _align(pos, VOFFSET.itemsize)
+        vtable_size = VOFFSET.itemsize * (2 + len(self.fields))
+        alignment = max([SOFFSET.itemsize] + [self.fields[slot].size for slot in slots])
+        self.pos = _align(self.vtable_pos + vtable_size, alignment)
+        end = self.pos + self.table_size
+        for field in self.fields:
+            if field is not None and not isinstance(field, Scalar):
+                end = field.layout(end)
+        return end
+
+    def write(self, buf):
+        _put(buf, VOFFSET, self.vtable_pos, VOFFSET.itemsize * (2 + len(self.fields)))
+        _put(buf, VOFFSET, self.vtable_pos + VOFFSET.itemsize, self.table_size)
+        for slot, offset in enumerate(self.field_offsets):
+            _put(buf, VOFFSET, self.vtable_pos + VOFFSET.itemsize * (2 + slot), offset)
+
+        _put(buf, SOFFSET, self.pos, self.pos - self.vtable_pos)
+        for field, offset in zip(self.fields, self.field_offsets):
+            if field is None:
+                continue
+            if isinstance(field, Scalar):
+                _put(buf, field.dtype, self.pos + offset, field.value)
+            else:
+                _put(buf, UOFFSET, self.pos + offset, field.pos - (self.pos + offset))
+                field.write(buf)
+
+
+def serialize(root):
+    """Serialize the root Table, and return the message as a bytearray of exactly the required size"""
+    end = root.layout(UOFFSET.itemsize)
+    buf = bytearray(end)
+    _put(buf, UOFFSET, 0, root.pos)
+    root.write(buf)
+    return buf
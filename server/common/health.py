@@ -14,12 +14,14 @@ def _is_accessible(path, config):
         return False
 
 
-def health_check(config):
+def health_check(config, details=None):
     """
     simple health check - return HTTP response.
     See https://tools.ietf.org/id/draft-inadarei-api-health-check-01.html
     """
     health = {"status": None, "version": "1", "releaseID": cellxgene_version}
+    if details:
+        health["details"] = details
 
     dataroot_paths: list[str] = [
         dataroot_value["dataroot"] for dataroot_value in config.server__multi_dataset__dataroots.values()
@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+import uuid
+
+from server.common.errors import ExceedsLimitError
+from server.common.threadpool import native_thread_pool
+
+
+class JobCancelledError(Exception):
+    """Raised, by Job.check_cancelled(), within a job which has been cancelled"""
+
+
+class Job:
+    """
+    A unit of work run in the background by a JobManager.
+
+    The job function is passed the Job, and may report progress (`set_total()`, `advance()`) and
+    should periodically call `check_cancelled()`, which raises JobCancelledError once the job has
+    been cancelled.  Cancellation is cooperative: a running job stops at its next check.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, owner=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.owner = owner  # opaque - eg, the dataset the job was submitted for
+        self.status = Job.PENDING
+        self.result = None
+        self.error = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self.lock = threading.Lock()  # guards the progress counters
+        self.done = 0
+        self.total = 0
+
+    def is_finished(self):
+        return self.status in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    def check_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelledError(f"job {self.id} cancelled")
+
+    def set_total(self, total):
+        with self.lock:
+            self.total = total
+
+    def advance(self, n):
+        with self.lock:
+            self.done += n
+
+    def to_dict(self):
+        """The job status, progress and, if done, the result - suitable for a JSON response"""
+        status = dict(id=self.id, status=self.status, progress=dict(done=self.done, total=self.total))
+        if self.status == Job.DONE:
+            status["result"] = self.result
+        elif self.status == Job.FAILED:
+            status["error"] = self.error
+        return status
+
+
+class JobManager:
+    """
+    Runs long computations (eg, differential expression over very large cell sets) in the background,
+    on a bounded pool of native threads, so that they do not tie up the request handlers.
+
+    * max_workers: the number of jobs run concurrently.  Others wait, pending, for a worker.
+    * max_jobs: the number of unfinished (pending or running) jobs.  Further submissions are rejected.
+    * result_ttl: seconds for which a finished job, and its result, are retained.
+
+    Jobs are held in memory, so are only known to the process which ran submit().  Job ids are prefixed
+    with the instance_id of the JobManager, so that `is_local()` can tell a job which is unknown, or has
+    expired, from one held by another process - eg, when a poll is routed to another server.
+
+    Usage:
+        job = job_manager.submit(fn, *args)  # calls fn(job, *args) on a worker thread
+        job = job_manager.get(job.id)
+        job_manager.cancel(job.id)
+    """
+
+    def __init__(self, max_workers=2, max_jobs=16, result_ttl=300, clock=time.monotonic):
+        self.max_jobs = max_jobs
+        self.result_ttl = result_ttl
+        self.clock = clock
+        self.lock = threading.Lock()  # guards jobs, and job status changes
+        self.jobs = {}  # id -> Job
+        self.executor = native_thread_pool(max_workers)
+        self.instance_id = uuid.uuid4().hex[:12]  # prefixes the ids of its jobs
+
+    def submit(self, fn, *args, owner=None):
+        """
+        Queue fn(job, *args) to run on a worker, and return the Job.  Raises ExceedsLimitError if
+        there are already max_jobs unfinished jobs.
+        """
+        job = Job(owner=owner, job_id=f"{self.instance_id}-{uuid.uuid4().hex}")
+        with self.lock:
+            self._expire()
+            if sum(not j.is_finished() for j in self.jobs.values()) >= self.max_jobs:
+                raise ExceedsLimitError("Too many background jobs, try again later")
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, fn, args)
+        return job
+
+    def get(self, job_id):
+        """Return the Job, or None if it is unknown or has expired"""
+        with self.lock:
+            self._expire()
+            return self.jobs.get(job_id)
+
+    def is_local(self, job_id):
+        """False if the job id is that of a job submitted to another JobManager, eg, in another process"""
+        instance_id, sep, _ = job_id.partition("-")
+        return not sep or instance_id == self.instance_id
+
+    def cancel(self, job_id):
+        """Request cancellation of the job, and return it - or None if it is unknown or has expired"""
+        with self.lock:
+            self._expire()
+            job = self.jobs.get(job_id)
+            if job is not None and not job.is_finished():
+                job.cancel_requested = True
+                if job.status == Job.PENDING:
+                    self._finish(job, Job.CANCELLED)
+            return job
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def shutdown(self):
+        """Cancel all unfinished jobs, and wait for the workers to exit"""
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            self.cancel(job.id)
+        self.executor.shutdown(wait=True)
+
+    def _run(self, job, fn, args):
+        with self.lock:
+            if job.cancel_requested or job.is_finished():
+                return
+            job.status = Job.RUNNING
+        result = error = None
+        try:
+            result = fn(job, *args)
+            status = Job.DONE
+        except JobCancelledError:
+            status = Job.CANCELLED
+        except Exception as e:
+            logging.warning(f"Background job {job.id} failed", exc_info=True)
+            error = str(e)
+            status = Job.FAILED
+        with self.lock:
+            self._finish(job, status, result=result, error=error)
+
+    def _finish(self, job, status, result=None, error=None):
+        """
+        Record the outcome of the job, unless it has already finished (eg, was cancelled while
+        pending).  Must be called with the lock held.
+        """
+        if job.is_finished():
+            return
+        job.result = result
+        job.error = error
+        job.finished_at = self.clock()
+        job.status = status
+
+    def _expire(self):
+        """Drop finished jobs older than result_ttl.  Must be called with the lock held."""
+        now = self.clock()
+        expired = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.is_finished() and job.finished_at is not None and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
@@ -7,21 +7,24 @@ import sys
 import zlib
 from http import HTTPStatus
 from typing import Optional
+from urllib.parse import quote as url_quote
 from urllib.parse import unquote as url_unquote
 
 import requests
 from flask import abort, current_app, jsonify, make_response, redirect, request
+from werkzeug.datastructures import MultiDict
 
-from server.app.api.util import get_dataset_artifact_s3_uri
+from server.app.api.util import get_dataset_artifact_s3_uri, open_data_adaptor
 from server.common.config.client_config import get_client_config
 from server.common.constants import (
     CELLGUIDE_CXG_KEY_NAME,
     CUSTOM_CXG_KEY_NAME,
     Axis,
     DiffExpMode,
+    DiffExpTest,
     JSON_NaN_to_num_warning_msg,
 )
-from server.common.diffexpdu import DiffExArguments
+from server.common.diffexpdu import DiffExArguments, DiffExBatchArguments
 from server.common.errors import (
     ColorFormatException,
     DatasetAccessError,
@@ -40,6 +43,7 @@ from server.common.utils.cell_type_info import (
     get_latest_snapshot_identifier,
 )
 from server.common.utils.uns import spatial_metadata_get
+from server.common.utils.utils import jsonify_numpy
 from server.dataset import dataset_metadata
 
 LOCAL_DEV_USER_PREFIX = "test-user-"
@@ -148,6 +152,11 @@ def abort_and_log(code, logmsg, loglevel=logging.DEBUG, include_exc_info=False):
     return abort(code)
 
 
+def _encode_uri_component(value):
+    """As javascript's encodeURIComponent"""
+    return url_quote(value, safe="!'()*-._~")
+
+
 def _query_parameter_to_filter(args):
     """
     Convert an annotation value filter, if present in the query args,
@@ -329,7 +338,78 @@ def config_get(app_config, data_adaptor):
     return make_response(jsonify(config), HTTPStatus.OK)
 
 
-def annotations_obs_get(request, data_adaptor):
+def _octet_stream_response(endpoint, payload, cache_key=None):
+    """
+    Return a response of the binary payload, compressed with the content encoding negotiated with the
+    client's Accept-Encoding.  If cache_key is specified, the compressed payload is served from, or
+    stored in, the response cache under cache_key + (content encoding,), alongside the raw payload.
+    """
+    compression = current_app.response_compression
+    content_encoding = compression.negotiate(request.accept_encodings, len(payload))
+    if content_encoding is not None:
+
+        def compress():
+            return compression.compress(endpoint, content_encoding, payload)
+
+        if cache_key is None:
+            payload = compress()
+        else:
+            payload = current_app.response_cache.get(cache_key + (content_encoding,), compress)
+
+    response = make_response(payload, HTTPStatus.OK, {"Content-Type": "application/octet-stream"})
+    response.vary.add("Accept-Encoding")
+    if content_encoding is not None:
+        response.content_encoding = content_encoding
+    return response
+
+
+def _response_cache_key(data_adaptor, endpoint, args, nbins):
+    """
+    Return the response cache key of a request.  The key includes the last modification time of the
+    dataset, as a dataset may be replaced at the same location (and the disk tier of the cache survives
+    restarts).  Returns None, and the response is not cached, if the modification time is unavailable.
+    """
+    lastmod = data_adaptor.get_last_mod_time()
+    if lastmod is None:
+        return None
+    return (data_adaptor.get_location(), lastmod.isoformat(), endpoint, args, nbins)
+
+
+def _cached_response(data_adaptor, endpoint, args, nbins, encode):
+    """
+    Return the response of an endpoint which is immutable for the dataset, with the encoded payload
+    from the response cache, or by calling encode() and caching the result.  args must be the
+    canonical (hashable) form of the request arguments, excluding nbins.
+    """
+    key = _response_cache_key(data_adaptor, endpoint, args, nbins)
+    if key is None:
+        return _octet_stream_response(endpoint, encode())
+    return _octet_stream_response(endpoint, current_app.response_cache.get(key, encode), cache_key=key)
+
+
+def _prefill_cached_response(app, data_adaptor, endpoint, args, nbins, encode):
+    """
+    Load the response of an endpoint which is immutable for the dataset (see _cached_response) into the
+    app's response cache, as a request would: the encoded payload, and the payload compressed with the
+    server's preferred content encoding.  Used to warm up datasets, outside of a request.
+    """
+    key = _response_cache_key(data_adaptor, endpoint, args, nbins)
+    if key is None:
+        return
+    payload = app.response_cache.get(key, encode)
+    compression = app.response_compression
+    if compression.encodings and len(payload) >= compression.min_bytes:
+        content_encoding = compression.encodings[0]
+        app.response_cache.get(
+            key + (content_encoding,), lambda: compression.compress(endpoint, content_encoding, payload)
+        )
+
+
+def annotations_obs_get(request, data_adaptor, cacheable=False):
+    """
+    Return the requested obs annotations.  If cacheable, the request must not include user annotations,
+    and the response is served from the response cache.
+    """
     fields = request.args.getlist("annotation-name", None)
     nBins = request.args.get("nbins", None)
     if nBins is not None:
@@ -344,14 +424,18 @@ def annotations_obs_get(request, data_adaptor):
 
     user_id = _resolve_request_user_id(request)
 
-    try:
-        fbs = data_adaptor.annotation_to_fbs_matrix(
+    def encode():
+        return data_adaptor.annotation_to_fbs_matrix(
             Axis.OBS,
             fields,
             num_bins=nBins,
             user_id=user_id,
         )
-        return make_response(fbs, HTTPStatus.OK, {"Content-Type": "application/octet-stream"})
+
+    try:
+        if cacheable:
+            return _cached_response(data_adaptor, "annotations/obs", tuple(fields), nBins, encode)
+        return _octet_stream_response("annotations/obs", encode())
     except KeyError as e:
         return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
 
@@ -484,15 +568,29 @@ def annotations_var_get(request, data_adaptor):
         return abort(HTTPStatus.NOT_ACCEPTABLE)
 
     try:
-        return make_response(
-            data_adaptor.annotation_to_fbs_matrix(Axis.VAR, fields, num_bins=nBins),
-            HTTPStatus.OK,
-            {"Content-Type": "application/octet-stream"},
+        return _cached_response(
+            data_adaptor,
+            "annotations/var",
+            tuple(fields),
+            nBins,
+            lambda: data_adaptor.annotation_to_fbs_matrix(Axis.VAR, fields, num_bins=nBins),
         )
     except KeyError as e:
         return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
 
 
+def annotations_var_prefill(app, data_adaptor, fields, nbins=None):
+    """Load the annotations/var response of the fields into the response cache"""
+    _prefill_cached_response(
+        app,
+        data_adaptor,
+        "annotations/var",
+        tuple(fields),
+        nbins,
+        lambda: data_adaptor.annotation_to_fbs_matrix(Axis.VAR, fields, num_bins=nbins),
+    )
+
+
 def data_var_put(request, data_adaptor):
     preferred_mimetype = request.accept_mimetypes.best_match(["application/octet-stream"])
     if preferred_mimetype != "application/octet-stream":
@@ -505,10 +603,8 @@ def data_var_put(request, data_adaptor):
         nBins = int(nBins)
 
     try:
-        return make_response(
-            data_adaptor.data_frame_to_fbs_matrix(filter, axis=Axis.VAR, num_bins=nBins),
-            HTTPStatus.OK,
-            {"Content-Type": "application/octet-stream"},
+        return _octet_stream_response(
+            "data/var", data_adaptor.data_frame_to_fbs_matrix(filter, axis=Axis.VAR, num_bins=nBins)
         )
     except (FilterError, ValueError, ExceedsLimitError) as e:
         return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
@@ -526,15 +622,35 @@ def data_var_get(request, data_adaptor):
         args_filter_only = request.args.copy()
         args_filter_only.poplist("nbins")
         filter = _query_parameter_to_filter(args_filter_only)
-        return make_response(
-            data_adaptor.data_frame_to_fbs_matrix(filter, axis=Axis.VAR, num_bins=nBins),
-            HTTPStatus.OK,
-            {"Content-Type": "application/octet-stream"},
+        return _cached_response(
+            data_adaptor,
+            "data/var",
+            tuple(sorted(args_filter_only.items(multi=True))),
+            nBins,
+            lambda: data_adaptor.data_frame_to_fbs_matrix(filter, axis=Axis.VAR, num_bins=nBins),
         )
     except (FilterError, ValueError, ExceedsLimitError) as e:
         return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
 
 
+def data_var_prefill(app, data_adaptor, var_field, values, nbins=None):
+    """
+    Load the data/var response of the var filter var_field=value, for each of the values, into the
+    response cache - with the query args escaped as the client escapes them.
+    """
+    for value in values:
+        args = MultiDict([(f"var:{_encode_uri_component(var_field)}", _encode_uri_component(value))])
+        filter = _query_parameter_to_filter(args)
+        _prefill_cached_response(
+            app,
+            data_adaptor,
+            "data/var",
+            tuple(sorted(args.items(multi=True))),
+            nbins,
+            lambda filter=filter: data_adaptor.data_frame_to_fbs_matrix(filter, axis=Axis.VAR, num_bins=nbins),
+        )
+
+
 def colors_get(data_adaptor):
     if not data_adaptor.app_config.default_dataset__presentation__custom_colors:
         return make_response(jsonify({}), HTTPStatus.OK)
@@ -626,6 +742,11 @@ def get_deployed_version(request):
     return make_response(jsonify(version_info), 200)
 
 
+def _diffexp_approximate(request):
+    """True if approximate differential expression was requested, with `?approximate=true`"""
+    return request.args.get("approximate", "false").lower() == "true"
+
+
 def diffexp_obs_post(request, data_adaptor):
     if not data_adaptor.app_config.default_dataset__diffexp__enable:
         return abort(HTTPStatus.NOT_IMPLEMENTED)
@@ -650,7 +771,7 @@ def diffexp_obs_post(request, data_adaptor):
         return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
 
     try:
-        diffexp = data_adaptor.diffexp_topN(set1_filter, set2_filter, count)
+        diffexp = data_adaptor.diffexp_topN(set1_filter, set2_filter, count, approximate=_diffexp_approximate(request))
         return make_response(diffexp, HTTPStatus.OK, {"Content-Type": "application/json"})
     except (ValueError, DisabledFeatureError, FilterError, ExceedsLimitError) as e:
         return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
@@ -675,14 +796,53 @@ def diffex_binary_post(request, data_adaptor):
     try:
         buf = request.get_data()
         diffex_args = DiffExArguments.unpack_from(buf)
+        result = data_adaptor.diffexp_topN_from_list(
+            diffex_args.set1,
+            diffex_args.set2,
+            diffex_args.params.N,
+            test=_diffexp_test(diffex_args.mode),
+            approximate=_diffexp_approximate(request),
+        )
+        return make_response(result, HTTPStatus.OK, {"Content-Type": "application/json"})
 
-        if diffex_args.mode != DiffExArguments.DiffExMode.TopN:
-            return abort_and_log(HTTPStatus.NOT_IMPLEMENTED, "Unsupported diffex mode")
+    except (KeyError, TypeError, AssertionError, struct.error, FilterError, ExceedsLimitError) as e:
+        return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
+    except JSONEncodingValueError:
+        # JSON encoding failure, usually due to bad data. Just let it ripple up
+        # to default exception handler.
+        current_app.logger.warning(JSON_NaN_to_num_warning_msg)
+        raise
+
+
+def diffexp_batch_post(request, data_adaptor):
+    """
+    One-vs-rest differential expression for several groups of cells.  The groups are specified either
+    by a JSON body naming a categorical obs annotation, eg, {"field": "cell_type", "count": 10}, or by
+    a binary DiffExBatchArguments body containing up to 8 postings lists.
+    """
+    MAX_CONTENT_LENGTH = 100 * 1024**2
+    if not data_adaptor.app_config.default_dataset__diffexp__enable:
+        return abort(HTTPStatus.NOT_IMPLEMENTED)
+    if not request.content_type:
+        return abort(HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+    if request.content_length and request.content_length > MAX_CONTENT_LENGTH:
+        return abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
 
-        result = data_adaptor.diffexp_topN_from_list(diffex_args.set1, diffex_args.set2, diffex_args.params.N)
+    try:
+        if "application/octet-stream" in request.content_type:
+            diffex_args = DiffExBatchArguments.unpack_from(request.get_data())
+            result = data_adaptor.diffexp_one_vs_rest_from_lists(diffex_args.sets, diffex_args.params.N)
+        elif "application/json" in request.content_type:
+            args = request.get_json()
+            top_n = args.get("count")
+            if top_n is not None and (not isinstance(top_n, int) or top_n < 1):
+                return abort_and_log(HTTPStatus.BAD_REQUEST, "count must be a positive integer")
+            result = data_adaptor.diffexp_one_vs_rest_by_category(args["field"], top_n)
+        else:
+            return abort(HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
         return make_response(result, HTTPStatus.OK, {"Content-Type": "application/json"})
 
-    except (KeyError, TypeError, AssertionError, struct.error) as e:
+    except (KeyError, TypeError, AssertionError, struct.error, FilterError, ExceedsLimitError) as e:
         return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
     except JSONEncodingValueError:
         # JSON encoding failure, usually due to bad data. Just let it ripple up
@@ -691,6 +851,106 @@ def diffex_binary_post(request, data_adaptor):
         raise
 
 
+def _diffexp_test(mode):
+    """The statistical test requested by a DiffExArguments mode"""
+    return DiffExpTest.WILCOXON if mode == DiffExArguments.DiffExMode.WilcoxonTopN else DiffExpTest.TTEST
+
+
+def _prepare_diffexp(data_adaptor, diffex_args, approximate):
+    """Validate a DiffExArguments request, returning the function which computes it"""
+    return data_adaptor.prepare_diffexp_topN_from_list(
+        diffex_args.set1,
+        diffex_args.set2,
+        diffex_args.params.N,
+        test=_diffexp_test(diffex_args.mode),
+        approximate=approximate,
+    )
+
+
+def _diffexp_job(job, location, app_config, dataset_cache, diffex_args, approximate):
+    """Compute a DiffExArguments request, on a background worker"""
+    # the dataset is re-acquired from the cache, as the request which submitted the job will have released it.
+    with dataset_cache.data_adaptor(location, lambda loc: open_data_adaptor(loc, app_config)) as data_adaptor:
+        return _prepare_diffexp(data_adaptor, diffex_args, approximate)(job=job)
+
+
+def _diffexp_job_response(job, status_code=HTTPStatus.OK):
+    try:
+        return make_response(jsonify_numpy(job.to_dict()), status_code, {"Content-Type": "application/json"})
+    except ValueError:
+        raise JSONEncodingValueError("Error encoding differential expression to JSON") from None
+
+
+def diffexp_job_post(request, data_adaptor):
+    """
+    Submit a binary DiffExArguments request (see diffex_binary_post) to be computed in the background.
+    Responds with the job status, including the job id, to be polled via diffexp_job_get.
+    """
+    MAX_CONTENT_LENGTH = 100 * 1024**2
+    if not data_adaptor.app_config.default_dataset__diffexp__enable:
+        return abort(HTTPStatus.NOT_IMPLEMENTED)
+    if not request.content_type or "application/octet-stream" not in request.content_type:
+        return abort(HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+    if not request.content_length:
+        return abort(HTTPStatus.LENGTH_REQUIRED)
+    if request.content_length > MAX_CONTENT_LENGTH:
+        return abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+    try:
+        diffex_args = DiffExArguments.unpack_from(request.get_data())
+        approximate = _diffexp_approximate(request)
+        # validated here, so that a bad request is refused rather than becoming a failed job
+        _prepare_diffexp(data_adaptor, diffex_args, approximate)
+    except (KeyError, TypeError, AssertionError, struct.error, FilterError, ExceedsLimitError) as e:
+        return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
+
+    try:
+        location = url_unquote(request.view_args["s3_uri"])
+        job = current_app.diffexp_jobs.submit(
+            _diffexp_job,
+            location,
+            data_adaptor.app_config,
+            current_app.dataset_cache,
+            diffex_args,
+            approximate,
+            owner=location,
+        )
+        return _diffexp_job_response(job, HTTPStatus.ACCEPTED)
+    except ExceedsLimitError as e:
+        return abort_and_log(HTTPStatus.TOO_MANY_REQUESTS, str(e), include_exc_info=True)
+
+
+def _get_diffexp_job(s3_uri, job_id):
+    """
+    Return the job, aborting with 421 if it is held by another server process - jobs are only known to
+    the process which accepted them - or with 404 if it is unknown, has expired or is of another dataset.
+    """
+    if not current_app.diffexp_jobs.is_local(job_id):
+        # werkzeug has no exception for 421, so abort with the response
+        message = "The job is held by another server process, to which requests for it must be routed"
+        return abort(make_response(jsonify(message=message), HTTPStatus.MISDIRECTED_REQUEST))
+    job = current_app.diffexp_jobs.get(job_id)
+    if job is None or job.owner != url_unquote(s3_uri):
+        return abort(HTTPStatus.NOT_FOUND)
+    return job
+
+
+def diffexp_job_get(s3_uri, job_id):
+    """
+    Respond with the status and progress of a background diffexp job and, once done, the result -
+    in the same format as diffex_binary_post.
+    """
+    job = _get_diffexp_job(s3_uri, job_id)
+    return _diffexp_job_response(job)
+
+
+def diffexp_job_delete(s3_uri, job_id):
+    """Cancel a background diffexp job"""
+    job = _get_diffexp_job(s3_uri, job_id)
+    current_app.diffexp_jobs.cancel(job.id)
+    return _diffexp_job_response(job)
+
+
 def layout_obs_get(request, data_adaptor):
     fields = request.args.getlist("layout-name", None)
     nBins = request.args.get("nbins", None)
@@ -702,19 +962,12 @@ def layout_obs_get(request, data_adaptor):
         return abort(HTTPStatus.BAD_REQUEST)
 
     preferred_mimetype = request.accept_mimetypes.best_match(["application/octet-stream"])
-    try:
-        spatial = data_adaptor.get_uns("spatial")
-    except KeyError:
-        spatial = None
-
     if preferred_mimetype != "application/octet-stream":
         return abort(HTTPStatus.NOT_ACCEPTABLE)
 
     try:
-        return make_response(
-            data_adaptor.layout_to_fbs_matrix(fields, num_bins=nBins, spatial=spatial),
-            HTTPStatus.OK,
-            {"Content-Type": "application/octet-stream"},
+        return _cached_response(
+            data_adaptor, "layout/obs", tuple(fields), nBins, lambda: _encode_layout_obs(data_adaptor, fields, nBins)
         )
     except (KeyError, DatasetAccessError) as e:
         return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
@@ -727,6 +980,21 @@ def layout_obs_get(request, data_adaptor):
         )
 
 
+def _encode_layout_obs(data_adaptor, fields, nbins):
+    try:
+        spatial = data_adaptor.get_uns("spatial")
+    except KeyError:
+        spatial = None
+    return data_adaptor.layout_to_fbs_matrix(fields, num_bins=nbins, spatial=spatial)
+
+
+def layout_obs_prefill(app, data_adaptor, fields, nbins=None):
+    """Load the layout/obs response of the embeddings named by fields into the response cache"""
+    _prefill_cached_response(
+        app, data_adaptor, "layout/obs", tuple(fields), nbins, lambda: _encode_layout_obs(data_adaptor, fields, nbins)
+    )
+
+
 def summarize_var_helper(request, data_adaptor, key, raw_query):
     preferred_mimetype = request.accept_mimetypes.best_match(["application/octet-stream"])
     if preferred_mimetype != "application/octet-stream":
@@ -752,10 +1020,8 @@ def summarize_var_helper(request, data_adaptor, key, raw_query):
 
     try:
         filter = _query_parameter_to_filter(args_filter_only)
-        return make_response(
-            data_adaptor.summarize_var(summary_method, filter, query_hash, num_bins=nBins),
-            HTTPStatus.OK,
-            {"Content-Type": "application/octet-stream"},
+        return _octet_stream_response(
+            "summarize/var", data_adaptor.summarize_var(summary_method, filter, query_hash, num_bins=nBins)
         )
     except ValueError as e:
         return abort(HTTPStatus.NOT_FOUND, description=str(e))
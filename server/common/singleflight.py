@@ -0,0 +1,47 @@
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key: while a call for a key is in progress,
+    other callers for that key wait for, and share, its result (or exception) rather than
+    repeating the work.  Results are not retained once the call completes - see
+    ImmutableKVCache for the caching equivalent.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()  # guards calls
+        self.calls = {}  # per-key in-progress calls
+
+    def do(self, key, fn):
+        """Call fn(key), or wait for the in-progress call for the same key, and return its result"""
+        leader = False
+        with self.lock:
+            if key not in self.calls:
+                leader = True
+                self.calls[key] = {"cv": threading.Condition(), "is_done": False, "result": None, "error": None}
+            call = self.calls[key]
+
+        cv = call["cv"]
+        with cv:
+            if leader:
+                try:
+                    call["result"] = fn(key)
+                except Exception as e:
+                    call["error"] = e
+                finally:
+                    with self.lock:
+                        del self.calls[key]
+                    call["is_done"] = True
+                    cv.notify_all()
+            else:
+                while not call["is_done"]:
+                    cv.wait()
+
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+
+    def __contains__(self, key):
+        """True if a call for key is in progress"""
+        return key in self.calls
@@ -0,0 +1,98 @@
+"""
+Native thread pools, for work which releases the GIL: TileDB reads, and numpy / numba computation.
+
+Under a gevent worker (see hosted/start.sh), threading is monkey-patched, so a standard
+concurrent.futures.ThreadPoolExecutor would run its tasks as greenlets on the worker's single thread -
+serially, and blocking all other requests while they run.
+"""
+
+import concurrent.futures
+import os
+import threading
+
+
+def native_thread_pool(max_workers):
+    """Return an executor which runs on native threads, under a gevent worker or not"""
+    try:
+        from gevent import monkey
+
+        if monkey.is_module_patched("threading"):
+            from gevent.threadpool import ThreadPoolExecutor
+
+            return ThreadPoolExecutor(max_workers=max_workers)
+    except ImportError:
+        pass
+    return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+
+def default_max_workers():
+    """min(8, the number of CPUs this process may run on)"""
+    try:
+        n_cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on all platforms
+        n_cpus = os.cpu_count() or 1
+    return min(8, n_cpus)
+
+
+class ComputePool:
+    """
+    A bounded pool of native threads, shared by all requests handled by a server process, on which
+    X is read and diffexp statistics computed concurrently.  The size of the pool, rather than of
+    each request's fan-out, bounds the number of concurrent TileDB queries (and their buffers) and
+    the number of cores used.
+
+    The pool is created on first use.  Work mapped from a task already running on the pool is run
+    inline, in that task's thread, as waiting on the bounded pool from within it could deadlock.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or default_max_workers()
+        self.lock = threading.Lock()  # guards executor
+        self.executor = None
+        self.local = threading.local()  # in_pool: True while a thread runs a task of the pool
+
+    def configure(self, max_workers=None):
+        """Set the size of the pool: max_workers, or if None, default_max_workers()"""
+        max_workers = max_workers or default_max_workers()
+        with self.lock:
+            if max_workers != self.max_workers:
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                    self.executor = None
+                self.max_workers = max_workers
+
+    def map(self, fn, items):
+        """
+        Return the list of fn(item) for each of the items, computed concurrently.  If any raises, the
+        calls not yet started are cancelled, and the first (in order of items) exception is raised.
+        """
+        items = list(items)
+        if len(items) <= 1 or self.max_workers <= 1 or getattr(self.local, "in_pool", False):
+            return [fn(item) for item in items]
+
+        executor = self._get_executor()
+        futures = [executor.submit(self._run, fn, item) for item in items]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = native_thread_pool(self.max_workers)
+            return self.executor
+
+    def _run(self, fn, item):
+        self.local.in_pool = True
+        try:
+            return fn(item)
+        finally:
+            self.local.in_pool = False
+
+
+# The pool shared by the server.  Its size is set by the config variable:
+# server.adaptor.cxg_adaptor.compute_threads
+compute_pool = ComputePool()
@@ -41,6 +41,7 @@ class DataLocator:
             self.protocol, self.path = DataLocator._get_protocol_and_path(uri_or_path)  # type: ignore
             # work-around for LocalFileSystem not treating file: and None as the same scheme/protocol
             self.cname = self.path if self.protocol == "file" else self.uri_or_path
+        self.region_name = region_name
 
         # fsspec.filesystem will throw RuntimeError if the protocol is unsupported
         if self.protocol == "s3":
@@ -80,7 +81,7 @@ class DataLocator:
         if self.islocal() and info is not None:  # type: ignore
             return datetime.fromtimestamp(info["mtime"])
         else:
-            return getattr(info, "LastModified", None)
+            return info.get("LastModified") if info is not None else None
 
     def abspath(self):  # type: ignore
         """
@@ -1,4 +1,5 @@
-import concurrent.futures
+import hashlib
+from functools import partial, reduce
 
 import numpy as np
 from numba import jit
@@ -6,9 +7,21 @@ from scipy import stats
 
 from server.common.constants import XApproximateDistribution
 from server.common.errors import ComputeError
+from server.common.jobs import JobCancelledError
+from server.common.threadpool import compute_pool
+from server.compute.sufficient_stats import XStats
+from server.dataset.cxg_util import MIN_COVERING_DENSITY, choose_selector_from_indices
 
+# Sparse mean/variance accumulation reads and accumulates chunks of at least this many rows, concurrently
+# on the compute_pool.
+SPARSE_MIN_CHUNK_ROWS = 16384
 
-def diffexp_ttest(adaptor, setA, setB, top_n=8, diffexp_lfc_cutoff=0.01, selector_lists=False):
+# Wilcoxon rank-sum membership flags of the rows of a sparse X: a row may be in both sets.
+IN_A = 1
+IN_B = 2
+
+
+def diffexp_ttest(adaptor, setA, setB, top_n=8, diffexp_lfc_cutoff=0.01, selector_lists=False, job=None):
     """
     Return differential expression statistics for top N variables.
 
@@ -32,47 +45,301 @@ def diffexp_ttest(adaptor, setA, setB, top_n=8, diffexp_lfc_cutoff=0.01, selecto
     :param top_n: number of variables to return stats for
     :param diffexp_lfc_cutoff: minimum
     :param selector_lists: if True, the selectors are presumed to be masks of length n_obs; else, lists of obs indices
+    :param job: optional Job, to which progress (in rows read) is reported, and which is checked for cancellation
     absolute value returning [ varindex, logfoldchange, pval, pval_adj ] for top N genes
     :return:  for top N genes, {"positive": for top N genes, [ varindex, foldchange, pval, pval_adj ],
               "negative": for top N genes, [ varindex, foldchange, pval, pval_adj ]}
     """
     matrix = adaptor.open_X_array()
-    dtype = matrix.attr(0).dtype
-    n_obs, cols = adaptor.get_shape()
-    is_sparse = matrix.schema.sparse
+    dtype = adaptor.get_X_array_dtype()
+    row_selector_A, row_selector_B = _row_selectors(setA, setB, adaptor.get_shape()[0], selector_lists)
+
+    # Results, and the statistics of each cell set, are cached by the content of the cell sets, so
+    # that repeated requests, and new comparisons which re-use one of the sets, are not re-computed.
+    cache = adaptor.diffexp_cache
+    fingerprints = [fingerprint_rows(row_selector_A), fingerprint_rows(row_selector_B)]
+    result_key = (adaptor.url, "diffexp_ttest", *fingerprints, top_n, diffexp_lfc_cutoff)
+    result = cache.get(result_key)
+    if result is not None:
+        return result
+
+    (meanA, varA, nA), (meanB, varB, nB) = mean_var_cnt_of_sets(
+        adaptor, matrix, [row_selector_A, row_selector_B], fingerprints, job=job
+    )
+    result = diffexp_ttest_from_mean_var(
+        meanA=meanA.astype(dtype),
+        varA=varA.astype(dtype),
+        nA=nA,
+        meanB=meanB.astype(dtype),
+        varB=varB.astype(dtype),
+        nB=nB,
+        top_n=top_n,
+        diffexp_lfc_cutoff=diffexp_lfc_cutoff,
+    )
+    cache.put(result_key, result)
+    return result
+
+
+def diffexp_ttest_approximate(
+    adaptor, setA, setB, sample_size, seed=0, top_n=8, diffexp_lfc_cutoff=0.01, selector_lists=False, job=None
+):
+    """
+    Approximate diffexp_ttest, for very large cell sets.  Each set larger than sample_size is replaced
+    by a stratified random sample of sample_size cells (see stratified_sample), and the t-test run on
+    the samples.
+
+    The result is that of diffexp_ttest, plus:
+    * set_sizes: the sizes of the two cell sets
+    * sample_sizes: the sizes of the two samples
+    * stability: an estimate of the stability of the top N ranking, in [0, 1].  Each sample is split
+      in two, the t-test run on each half, and the stability is the mean fraction of the top N (positive
+      and negative) genes that the halves have in common.  As the halves are half the size of the
+      samples, this under-estimates the stability of the full sample's ranking.  1 if not sampled.
+    """
+    n_obs, n_var = adaptor.get_shape()
+    rowsA, rowsB = _row_selectors(setA, setB, n_obs, selector_lists)
+    set_sizes = [len(rowsA), len(rowsB)]
+    if max(set_sizes) <= sample_size:
+        result = diffexp_ttest(adaptor, rowsA, rowsB, top_n, diffexp_lfc_cutoff, selector_lists=True, job=job)
+        return dict(result, set_sizes=set_sizes, sample_sizes=set_sizes, stability=1.0)
+
+    cache = adaptor.diffexp_cache
+    fingerprints = [fingerprint_rows(rowsA), fingerprint_rows(rowsB)]
+    result_key = (adaptor.url, "diffexp_ttest_approximate", *fingerprints, top_n, diffexp_lfc_cutoff, sample_size, seed)
+    result = cache.get(result_key)
+    if result is not None:
+        return result
+
+    # the samples are split into halves, whose statistics are merged to give those of the samples
+    samples = [stratified_sample(rows, sample_size, seed) for rows in (rowsA, rowsB)]
+    halves = [half for sample in samples for half in (sample[0::2], sample[1::2])]
+    A0, A1, B0, B1 = mean_var_cnt_of_sets(
+        adaptor, adaptor.open_X_array(), halves, [fingerprint_rows(half) for half in halves], job=job
+    )
+
+    dtype = adaptor.get_X_array_dtype()
+
+    def ttest(statsA, statsB):
+        (meanA, varA, nA), (meanB, varB, nB) = statsA, statsB
+        return diffexp_ttest_from_mean_var(
+            meanA=meanA.astype(dtype),
+            varA=varA.astype(dtype),
+            nA=nA,
+            meanB=meanB.astype(dtype),
+            varB=varB.astype(dtype),
+            nB=nB,
+            top_n=top_n,
+            diffexp_lfc_cutoff=diffexp_lfc_cutoff,
+        )
+
+    result = ttest(merge_mean_var_cnt(A0, A1), merge_mean_var_cnt(B0, B1))
+    result["set_sizes"] = set_sizes
+    result["sample_sizes"] = [len(sample) for sample in samples]
+    result["stability"] = _top_n_overlap(ttest(A0, B0), ttest(A1, B1))
+    cache.put(result_key, result)
+    return result
 
+
+def stratified_sample(rows, sample_size, seed=0):
+    """
+    Return a stratified random sample of sample_size of the (sorted) obs indices: the list is divided
+    into sample_size strata of (nearly) equal length, and one obs drawn from each, so that the sample
+    spans the entire list.  The sample is sorted, and determined by the seed and the content of the list.
+    """
+    n = len(rows)
+    if n <= sample_size:
+        return rows
+    rng = np.random.default_rng([seed, int(fingerprint_rows(rows), 16)])
+    bounds = (np.arange(sample_size + 1, dtype=np.int64) * n) // sample_size
+    offsets = (rng.random(sample_size) * np.diff(bounds)).astype(np.int64)
+    return rows[bounds[:-1] + offsets]
+
+
+def merge_mean_var_cnt(a, b):
+    """
+    Return the (mean, variance, count) of the union of two disjoint sets, given those of each, using
+    Chan's parallel adaptation of Welford's.
+    """
+    (mean_a, var_a, n_a), (mean_b, var_b, n_b) = a, b
+    if n_a == 0 or n_b == 0:
+        return b if n_a == 0 else a
+    n = n_a + n_b
+    delta = mean_b.astype(np.float64) - mean_a
+    mean = mean_a + delta * (n_b / n)
+    M2 = var_a * max(n_a - 1, 0) + var_b * max(n_b - 1, 0) + delta**2 * (n_a * n_b / n)
+    return mean, M2 / max(1, n - 1), n
+
+
+def _top_n_overlap(resultA, resultB):
+    """Return the mean fraction of the positive and negative top N variables that two results share"""
+    overlaps = []
+    for key in ("positive", "negative"):
+        varsA = {row[0] for row in resultA[key]}
+        varsB = {row[0] for row in resultB[key]}
+        overlaps.append(len(varsA & varsB) / max(len(varsA), 1))
+    return sum(overlaps) / len(overlaps)
+
+
+def _row_selectors(setA, setB, n_obs, selector_lists):
+    """Return the two cell sets, each as a list of obs indices"""
     if selector_lists:
         assert 0 <= setA[0] < n_obs
         assert 0 <= setA[-1] < n_obs
         assert 0 <= setB[0] < n_obs
         assert 0 <= setB[-1] < n_obs
-        row_selector_A = setA
-        row_selector_B = setB
+        return np.asarray(setA), np.asarray(setB)
+    assert len(setA) == len(setB) == n_obs
+    return setA.nonzero()[0], setB.nonzero()[0]
+
+
+def fingerprint_rows(rows):
+    """
+    Return a content hash of a list of obs indices.
+    """
+    return hashlib.blake2b(np.ascontiguousarray(rows, dtype=np.int64).tobytes(), digest_size=16).hexdigest()
+
+
+def mean_var_cnt_of_sets(adaptor, matrix, rows, fingerprints, job=None):
+    """
+    Return the per-gene (mean, variance, count) of each of the cell sets (lists of obs indices).
+
+    The statistics of each set are read from, and added to, the adaptor's diffexp cache.  Sets which
+    are not cached are scanned in turn, each fanned out in chunks on the compute_pool - except that if
+    there are two sets, which are complements, and the dataset has precomputed X statistics, only one
+    of them (the smaller, if neither is cached) is scanned, and the statistics of the other are derived
+    from it.
+    """
+    n_obs, n_var = adaptor.get_shape()
+    float32 = adaptor.diffexp_float32 and adaptor.get_X_array_dtype() == np.float32
+    if adaptor.is_sparse:
+        mean_var_cnt_fn = partial(mean_var_cnt_sparse, float32=float32)
     else:
-        assert len(setA) == len(setB) == n_obs
-        row_selector_A = setA.nonzero()[0]
-        row_selector_B = setB.nonzero()[0]
-
-    mean_var_cnt_fn = mean_var_cnt_sparse if is_sparse else mean_var_cnt_dense
-    with concurrent.futures.ThreadPoolExecutor() as tp:
-        A = tp.submit(mean_var_cnt_fn, matrix, cols, row_selector_A)
-        B = tp.submit(mean_var_cnt_fn, matrix, cols, row_selector_B)
+        mean_var_cnt_fn = partial(mean_var_cnt_dense, max_chunk_bytes=adaptor.diffexp_memory_limit, float32=float32)
+    cache = adaptor.diffexp_cache
+    keys = [(adaptor.url, "mean_var_cnt", fingerprint) for fingerprint in fingerprints]
+    accumulators = [cache.get(key) for key in keys]
+
+    X_stats = adaptor.get_X_stats()
+    if X_stats is not None and len(rows) == 2 and is_complement(rows[0], rows[1], n_obs):
+        # Selection vs. rest: derive the statistics of one set from those of the other, and of all of X.
+        if accumulators[0] is None and accumulators[1] is None:
+            smaller = 0 if len(rows[0]) <= len(rows[1]) else 1
+            if job is not None:
+                job.set_total(len(rows[smaller]))
+            try:
+                accumulators[smaller] = mean_var_cnt_fn(matrix, n_var, rows[smaller], job=job)
+            except JobCancelledError:
+                raise
+            except Exception as e:
+                raise ComputeError(str(e)) from None
+        known = 0 if accumulators[0] is not None else 1
+        if accumulators[1 - known] is None:
+            accumulators[1 - known] = X_stats.complement_mean_var(*accumulators[known])
+
+    missing = [i for i, accumulator in enumerate(accumulators) if accumulator is None]
+    if missing:
+        if job is not None:
+            job.set_total(sum(len(rows[i]) for i in missing))
         try:
-            meanA, varA, nA = A.result()
-            meanB, varB, nB = B.result()
+            for i in missing:
+                accumulators[i] = mean_var_cnt_fn(matrix, n_var, rows[i], job=job)
+        except JobCancelledError:
+            raise
         except Exception as e:
             raise ComputeError(str(e)) from None
 
-    return diffexp_ttest_from_mean_var(
-        meanA=meanA.astype(dtype),
-        varA=varA.astype(dtype),
-        nA=nA,
-        meanB=meanB.astype(dtype),
-        varB=varB.astype(dtype),
-        nB=nB,
-        top_n=top_n,
-        diffexp_lfc_cutoff=diffexp_lfc_cutoff,
-    )
+    for key, accumulator in zip(keys, accumulators):
+        cache.put(key, accumulator)
+    return accumulators
+
+
+def diffexp_ttest_one_vs_rest(adaptor, labels, n_groups, top_n=8, diffexp_lfc_cutoff=0.01):
+    """
+    Return differential expression statistics for the top N variables of each group of cells,
+    compared with all other cells.  See diffexp_ttest.
+
+    The per-group statistics are accumulated in a single pass over X, and the statistics of the rest
+    of the cells derived by subtraction from those of all cells.
+
+    :param adaptor: DataAdaptor instance
+    :param labels: array of length n_obs, the group (0 <= label < n_groups) of each obs, or -1 for none
+    :param n_groups: number of groups
+    :return: list, for each group, of the diffexp_ttest result - or None if the group is empty or
+        contains every cell.
+    """
+    dtype = adaptor.get_X_array_dtype()
+    n_obs, n_var = adaptor.get_shape()
+    assert len(labels) == n_obs
+
+    # unlabelled cells are accumulated as an extra group, so that they count towards the rest
+    labels = np.where(labels < 0, n_groups, labels).astype(np.int64)
+    try:
+        total, sumsq = _sum_sumsq_by_group(adaptor.open_X_array(), labels, n_groups + 1, n_var)
+    except Exception as e:
+        raise ComputeError(str(e)) from None
+    counts = np.bincount(labels, minlength=n_groups + 1)
+    X_stats = XStats(n_obs=n_obs, sum=total.sum(axis=0), sumsq=sumsq.sum(axis=0), nnz=None)
+
+    results = []
+    for group in range(n_groups):
+        n = int(counts[group])
+        if n == 0 or n == n_obs:
+            results.append(None)
+            continue
+        mean = total[group] / n
+        var = np.maximum(sumsq[group] - mean * total[group], 0) / max(n - 1, 1)
+        mean_rest, var_rest, n_rest = X_stats.complement_mean_var(mean, var, n)
+        results.append(
+            diffexp_ttest_from_mean_var(
+                meanA=mean.astype(dtype),
+                varA=var.astype(dtype),
+                nA=n,
+                meanB=mean_rest.astype(dtype),
+                varB=var_rest.astype(dtype),
+                nB=n_rest,
+                top_n=top_n,
+                diffexp_lfc_cutoff=diffexp_lfc_cutoff,
+            )
+        )
+    return results
+
+
+def _sum_sumsq_by_group(matrix, labels, n_groups, n_var, chunk_rows=16384):
+    """
+    Return the per-group, per-gene sum and sum of squares of the (row-wise) X matrix, each an array
+    of shape (n_groups, n_var), in one streaming pass over X.
+    """
+    total = np.zeros((n_groups * n_var,), dtype=np.float64)
+    sumsq = np.zeros((n_groups * n_var,), dtype=np.float64)
+    if matrix.schema.sparse:
+        for slc in matrix.query(order="U", return_incomplete=True).multi_index[:]:
+            bins = labels[slc["obs"]] * n_var + slc["var"]
+            val = slc[""].astype(np.float64)
+            total += np.bincount(bins, weights=val, minlength=n_groups * n_var)
+            sumsq += np.bincount(bins, weights=val**2, minlength=n_groups * n_var)
+    else:
+        n_obs = len(labels)
+        for start in range(0, n_obs, chunk_rows):
+            stop = min(start + chunk_rows, n_obs)
+            X = matrix.multi_index[start : stop - 1, :][""].astype(np.float64)
+            for group in np.unique(labels[start:stop]):
+                rows = labels[start:stop] == group
+                total[group * n_var : (group + 1) * n_var] += X[rows].sum(axis=0)
+                sumsq[group * n_var : (group + 1) * n_var] += np.square(X[rows]).sum(axis=0)
+
+    return total.reshape((n_groups, n_var)), sumsq.reshape((n_groups, n_var))
+
+
+def is_complement(rowsA, rowsB, n_obs):
+    """
+    Return True if the two lists of obs indices are disjoint, and together select every obs.
+    """
+    if len(rowsA) + len(rowsB) != n_obs or len(rowsA) == 0 or len(rowsB) == 0:
+        return False
+    selected = np.zeros((n_obs,), dtype=bool)
+    selected[rowsA] = True
+    selected[rowsB] = True
+    return bool(selected.all())
 
 
 def diffexp_ttest_from_mean_var(meanA, varA, nA, meanB, varB, nB, top_n, diffexp_lfc_cutoff):
@@ -80,6 +347,50 @@ def diffexp_ttest_from_mean_var(meanA, varA, nA, meanB, varB, nB, top_n, diffexp
     n_var = meanA.shape[0]
     top_n = min(top_n, n_var)
 
+    tscores, dof = _welch_ttest(meanA, varA, nA, meanB, varB, nB)
+
+    # log fold change. The data is normally distributed/logged, so just subtract the means.
+    logfoldchanges = meanA - meanB
+
+    sort_order = _top_n_sort_order(tscores, logfoldchanges, top_n, diffexp_lfc_cutoff)
+
+    # p-values are only required for the top N, which are ranked by t-score
+    pvals_top_n, pvals_adj_top_n = _ttest_pvals(tscores[sort_order], dof[sort_order], n_var)
+
+    return _top_n_result(sort_order, logfoldchanges, pvals_top_n, pvals_adj_top_n, top_n)
+
+
+def _top_n_result(sort_order, logfoldchanges, pvals_top_n, pvals_adj_top_n, top_n):
+    """
+    Return the {"positive", "negative"} result, given the sort order of the top and bottom N variables,
+    and their p-values.
+    """
+    # varIndex, logfoldchange, pval, pval_adj
+    rows = [
+        list(row)
+        for row in zip(
+            sort_order.tolist(), logfoldchanges[sort_order].tolist(), pvals_top_n.tolist(), pvals_adj_top_n.tolist()
+        )
+    ]
+    return {
+        "positive": rows[:top_n],
+        "negative": rows[::-1][:top_n],
+    }
+
+
+def diffexp_ttest_all_from_mean_var(meanA, varA, nA, meanB, varB, nB):
+    """
+    Return the differential expression statistics of every variable, as arrays indexed by var:
+    {"logfoldchanges", "tscores", "pvals", "pvals_adj"}.  Unlike diffexp_ttest_from_mean_var,
+    which only computes p-values for the top N, this is suitable for exporting complete results.
+    """
+    tscores, dof = _welch_ttest(meanA, varA, nA, meanB, varB, nB)
+    pvals, pvals_adj = _ttest_pvals(tscores, dof, meanA.shape[0])
+    return dict(logfoldchanges=meanA - meanB, tscores=tscores, pvals=pvals, pvals_adj=pvals_adj)
+
+
+def _welch_ttest(meanA, varA, nA, meanB, varB, nB):
+    """Return the Welch's t-test scores and degrees of freedom"""
     # variance / N
     vnA = varA / min(nA, nB)  # overestimate variance, would normally be nA
     vnB = varB / min(nA, nB)  # overestimate variance, would normally be nB
@@ -95,15 +406,21 @@ def diffexp_ttest_from_mean_var(meanA, varA, nA, meanB, varB, nB, top_n, diffexp
         tscores = (meanA - meanB) / np.sqrt(sum_vn)
     tscores[np.isnan(tscores)] = 0
 
-    # p-value
+    return tscores, dof
+
+
+def _ttest_pvals(tscores, dof, n_var):
+    """Return the two-sided p-values, and the p-values with Bonferroni correction for n_var tests"""
     pvals = stats.t.sf(np.abs(tscores), dof) * 2
     pvals_adj = pvals * n_var
     pvals_adj[pvals_adj > 1] = 1  # cap adjusted p-value at 1
+    return pvals, pvals_adj
 
-    # log fold change. The data is normally distributed/logged, so just subtract the means.
-    logfoldchanges = meanA - meanB
 
-    stats_to_sort = tscores
+def _top_n_sort_order(stats_to_sort, logfoldchanges, top_n, diffexp_lfc_cutoff):
+    """
+    Return the indices of the top N and bottom N variables, by stats_to_sort, in descending order.
+    """
     # find all with lfc > cutoff
     lfc_above_cutoff_idx = np.nonzero(np.abs(logfoldchanges) > diffexp_lfc_cutoff)[0]
 
@@ -125,23 +442,7 @@ def diffexp_ttest_from_mean_var(meanA, varA, nA, meanB, varB, nB, top_n, diffexp
         indices = np.indices(stats_to_sort.shape)[0]
         sort_order = indices[partition_top_n][rel_sort_order]
 
-    # top n slice based upon sort order
-    logfoldchanges_top_n = logfoldchanges[sort_order]
-    pvals_top_n = pvals[sort_order]
-    pvals_adj_top_n = pvals_adj[sort_order]
-
-    # varIndex, logfoldchange, pval, pval_adj
-    result = {
-        "positive": [
-            [sort_order[i], logfoldchanges_top_n[i], pvals_top_n[i], pvals_adj_top_n[i]] for i in range(top_n)
-        ],
-        "negative": [
-            [sort_order[i], logfoldchanges_top_n[i], pvals_top_n[i], pvals_adj_top_n[i]]
-            for i in range(-1, -1 - top_n, -1)
-        ],
-    }
-
-    return result
+    return sort_order
 
 
 def mean_var_n(X, X_approximate_distribution=XApproximateDistribution.NORMAL):
@@ -179,9 +480,100 @@ def mean_var_n(X, X_approximate_distribution=XApproximateDistribution.NORMAL):
     return mean, v, n
 
 
-def mean_var_cnt_dense(matrix, _, rows):
-    xslc = matrix.multi_index[rows]
-    return mean_var_n(xslc[""])
+def _read_dense_rows(matrix, rows):
+    items, covering = choose_selector_from_indices(rows)
+    X = matrix.multi_index[items][""]
+    if covering:
+        X = X[rows - items[0].start]
+    return X
+
+
+def mean_var_n_float32(X):
+    """
+    As mean_var_n, for a float32 X, but accumulated in float32 with compensated summation, and without
+    allocating any temporaries the size of X.
+    """
+    mean, M2 = _mean_M2_dense_kahan(np.ascontiguousarray(X, dtype=np.float32))
+    n = X.shape[0]
+    v = M2 / np.float32(max(n - 1, 1))
+    mean[~np.isfinite(mean)] = 0
+    v[~np.isfinite(v)] = 0
+    return mean, v, n
+
+
+@jit(nopython=True, nogil=True)
+def _mean_M2_dense_kahan(X):
+    """
+    Two-pass per-column mean and sum of squares of differences from the mean, accumulated in float32
+    using Kahan summation.  NB: must not be compiled with fastmath, which would optimize away the
+    compensation.
+    """
+    n, n_var = X.shape
+    total = np.zeros((n_var,), dtype=np.float32)
+    c = np.zeros((n_var,), dtype=np.float32)
+    for i in range(n):
+        for j in range(n_var):
+            y = X[i, j] - c[j]
+            t = total[j] + y
+            c[j] = (t - total[j]) - y
+            total[j] = t
+    mean = (total / np.float32(max(n, 1))).astype(np.float32)
+
+    M2 = np.zeros((n_var,), dtype=np.float32)
+    c[:] = 0
+    for i in range(n):
+        for j in range(n_var):
+            d = X[i, j] - mean[j]
+            y = d * d - c[j]
+            t = M2[j] + y
+            c[j] = (t - M2[j]) - y
+            M2[j] = t
+    return mean, M2
+
+
+def _mean_var_dense_chunk(matrix, rows, job=None, float32=False):
+    if job is not None:
+        job.check_cancelled()
+    X = _read_dense_rows(matrix, rows)
+    result = mean_var_n_float32(X) if float32 else mean_var_n(X)
+    if job is not None:
+        job.advance(len(rows))
+    return result
+
+
+def _dense_row_bytes(n_var, itemsize, float32=False):
+    """
+    Return the peak memory used by _mean_var_dense_chunk per selected row: the read, which may cover
+    up to 1 / MIN_COVERING_DENSITY rows per selected row, the copy gathering the selected rows from it,
+    and unless float32, the float64 difference from the mean and its square allocated by mean_var_n.
+    """
+    read_bytes = itemsize * (1 / MIN_COVERING_DENSITY + 1)
+    temporary_bytes = 0 if float32 else 2 * np.dtype(np.float64).itemsize
+    return max(1, int(np.ceil(n_var * (read_bytes + temporary_bytes))))
+
+
+def mean_var_cnt_dense(matrix, n_var, rows, max_chunk_bytes=None, job=None, float32=False):
+    """
+    Return the per-gene (mean, variance, count) of the rows of a dense X.
+
+    If max_chunk_bytes is specified, the rows are read in chunks, so that no more than max_chunk_bytes
+    is used at once to read and reduce them (see _dense_row_bytes).  The chunks are read and reduced
+    concurrently on the compute_pool, and the partial results merged with merge_mean_var_cnt.
+
+    If a job is specified, it is checked for cancellation before each chunk is read.  If float32 is
+    True, see mean_var_n_float32.
+    """
+    n_rows = len(rows)
+    row_bytes = _dense_row_bytes(n_var, matrix.schema.attr(0).dtype.itemsize, float32)
+    if max_chunk_bytes is None or n_rows * row_bytes <= max_chunk_bytes:
+        return _mean_var_dense_chunk(matrix, rows, job, float32)
+
+    chunk_rows = max(1, max_chunk_bytes // (row_bytes * compute_pool.max_workers))
+    chunks = [rows[start : start + chunk_rows] for start in range(0, n_rows, chunk_rows)]
+    partials = compute_pool.map(lambda chunk: _mean_var_dense_chunk(matrix, chunk, job, float32), chunks)
+    # merged in float64, whatever the precision of the chunks
+    mean, var, n = partials[0]
+    return reduce(merge_mean_var_cnt, partials[1:], (mean.astype(np.float64), var.astype(np.float64), n))
 
 
 @jit(nopython=True, nogil=True, fastmath=True)
@@ -198,6 +590,26 @@ def _mean_var_sparse_accumulate(col_arr, val_arr, n, u, M2):
         M2[col] = M2_prev + (val - u_prev) * (val - u[col])
 
 
+@jit(nopython=True, nogil=True)
+def _mean_var_sparse_accumulate_kahan(col_arr, val_arr, n, u, u_c, M2, M2_c):
+    """
+    As _mean_var_sparse_accumulate, for float32 accumulators, with Kahan-compensated updates of the
+    mean and M2.  NB: must not be compiled with fastmath, which would optimize away the compensation.
+    """
+    for col, val in zip(col_arr, val_arr):
+        v = np.float32(val)
+        n[col] += 1
+        u_prev = u[col]
+        y = (v - u_prev) / np.float32(n[col]) - u_c[col]
+        t = u_prev + y
+        u_c[col] = (t - u_prev) - y
+        u[col] = t
+        y = (v - u_prev) * (v - t) - M2_c[col]
+        t = M2[col] + y
+        M2_c[col] = (t - M2[col]) - y
+        M2[col] = t
+
+
 @jit(nopython=True, nogil=True, fastmath=True)
 def _mean_var_sparse_finalize(n_rows, n_a, u_a, M2_a):
     """
@@ -212,16 +624,80 @@ def _mean_var_sparse_finalize(n_rows, n_a, u_a, M2_a):
     return u, M2
 
 
-def mean_var_cnt_sparse(matrix, n_var, rows):
-    query_iterator = matrix.query(order="U", return_incomplete=True).multi_index[rows]
+@jit(nopython=True, nogil=True, fastmath=True)
+def _mean_var_sparse_merge(n_a, u_a, M2_a, n_b, u_b, M2_b):
+    """
+    Merge the accumulators of two disjoint row chunks into the first, using Chan's parallel
+    adaptation of Welford's.
+    """
+    for col in range(n_a.shape[0]):
+        if n_b[col] == 0:
+            continue
+        na = np.float64(n_a[col])
+        nb = np.float64(n_b[col])
+        n = na + nb
+        delta = u_b[col] - u_a[col]
+        u_a[col] = u_a[col] + delta * nb / n
+        M2_a[col] = M2_a[col] + M2_b[col] + delta**2 * na * nb / n
+        n_a[col] += n_b[col]
+
+
+def _mean_var_sparse_chunk(matrix, n_var, rows, job=None, float32=False):
+    """
+    Accumulate the per-gene (n, mean, M2) of the stored (non-zero) elements of the rows.  If a job is
+    specified, it is checked for cancellation between TileDB result batches.  If float32 is True, the
+    mean and M2 are accumulated in float32, with compensated summation.
+    """
+    items, covering = choose_selector_from_indices(rows)
+    query_iterator = matrix.query(order="U", return_incomplete=True).multi_index[items]
+    if covering:
+        first = items[0].start
+        selected = np.zeros(items[0].stop - first + 1, dtype=bool)
+        selected[rows - first] = True
 
     # accumulators, by gene (var) for n, u (mean) and M (sum of squares of difference from mean)
-    n_rows = len(rows)
+    dtype = np.float32 if float32 else np.float64
     n_a = np.zeros((n_var,), dtype=np.uint32)
-    u_a = np.zeros((n_var,), dtype=np.float64)
-    M2_a = np.zeros((n_var,), dtype=np.float64)
+    u_a = np.zeros((n_var,), dtype=dtype)
+    M2_a = np.zeros((n_var,), dtype=dtype)
+    if float32:
+        # compensation (lost low-order bits) of u_a and M2_a
+        u_c = np.zeros((n_var,), dtype=dtype)
+        M2_c = np.zeros((n_var,), dtype=dtype)
     for slc in query_iterator:
-        _mean_var_sparse_accumulate(slc["var"], slc[""], n_a, u_a, M2_a)
+        if job is not None:
+            job.check_cancelled()
+        var, val = slc["var"], slc[""]
+        if covering:
+            keep = selected[slc["obs"] - first]
+            var, val = var[keep], val[keep]
+        if float32:
+            _mean_var_sparse_accumulate_kahan(var, val, n_a, u_a, u_c, M2_a, M2_c)
+        else:
+            _mean_var_sparse_accumulate(var, val, n_a, u_a, M2_a)
+    if float32:
+        u_a -= u_c
+        M2_a -= M2_c
+
+    if job is not None:
+        job.advance(len(rows))
+    return n_a, u_a, M2_a
+
+
+def mean_var_cnt_sparse(matrix, n_var, rows, job=None, float32=False):
+    """
+    The rows are partitioned into chunks, which are read and accumulated concurrently on the
+    compute_pool (the TileDB reads and accumulation release the GIL), and the partial results merged.
+    """
+    n_rows = len(rows)
+    n_chunks = max(1, min(compute_pool.max_workers, n_rows // SPARSE_MIN_CHUNK_ROWS))
+    chunks = np.array_split(rows, n_chunks)
+    chunk_accumulators = compute_pool.map(
+        lambda chunk: _mean_var_sparse_chunk(matrix, n_var, chunk, job, float32), chunks
+    )
+    n_a, u_a, M2_a = chunk_accumulators[0]
+    for n_b, u_b, M2_b in chunk_accumulators[1:]:
+        _mean_var_sparse_merge(n_a, u_a, M2_a, n_b, u_b, M2_b)
 
     u, M2 = _mean_var_sparse_finalize(n_rows, n_a, u_a, M2_a)
 
@@ -229,3 +705,221 @@ def mean_var_cnt_sparse(matrix, n_var, rows):
     var = M2 / max(1, (n_rows - 1))
 
     return u, var, n_rows
+
+
+def diffexp_wilcoxon(adaptor, setA, setB, top_n=8, diffexp_lfc_cutoff=0.01, selector_lists=False, job=None):
+    """
+    Return differential expression statistics for top N variables, using the Wilcoxon rank-sum
+    (Mann-Whitney U) test.  Parameters and result are as for diffexp_ttest, but the variables are
+    ranked by the rank-sum z-score, and the p-values are those of its normal approximation, with tie
+    correction (and Bonferroni correction).
+
+    The ranks are computed gene by gene, reading X by column.  The unstored elements of a sparse X
+    are all zero, and share a single tied rank, so only the stored values need be sorted.
+    """
+    n_obs, n_var = adaptor.get_shape()
+    row_selector_A, row_selector_B = _row_selectors(setA, setB, n_obs, selector_lists)
+
+    cache = adaptor.diffexp_cache
+    fingerprints = [fingerprint_rows(row_selector_A), fingerprint_rows(row_selector_B)]
+    result_key = (adaptor.url, "diffexp_wilcoxon", *fingerprints, top_n, diffexp_lfc_cutoff)
+    result = cache.get(result_key)
+    if result is not None:
+        return result
+
+    try:
+        rank_sum, tie_sum, sum_A, sum_B = rank_sum_by_gene(adaptor, row_selector_A, row_selector_B, job=job)
+    except JobCancelledError:
+        raise
+    except Exception as e:
+        raise ComputeError(str(e)) from None
+
+    nA, nB = len(row_selector_A), len(row_selector_B)
+    top_n = min(top_n, n_var)
+    scores = _rank_sum_zscores(rank_sum, tie_sum, nA, nB)
+    logfoldchanges = (sum_A / max(nA, 1) - sum_B / max(nB, 1)).astype(adaptor.get_X_array_dtype())
+    sort_order = _top_n_sort_order(scores, logfoldchanges, top_n, diffexp_lfc_cutoff)
+
+    pvals_top_n = stats.norm.sf(np.abs(scores[sort_order])) * 2
+    pvals_adj_top_n = np.minimum(pvals_top_n * n_var, 1)
+    result = _top_n_result(sort_order, logfoldchanges, pvals_top_n, pvals_adj_top_n, top_n)
+    cache.put(result_key, result)
+    return result
+
+
+def _rank_sum_zscores(rank_sum, tie_sum, nA, nB):
+    """Return the z-scores of the rank sums of set A, with the variance corrected for ties"""
+    n = nA + nB
+    U = rank_sum - nA * (nA + 1) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.sqrt(nA * nB / 12 * ((n + 1) - tie_sum / (n * (n - 1))))
+        scores = (U - nA * nB / 2) / sigma
+    scores[~np.isfinite(scores)] = 0
+    return scores
+
+
+def rank_sum_by_gene(adaptor, rowsA, rowsB, job=None):
+    """
+    Return, for each gene: the sum of the ranks of the values of rowsA among all values of rowsA and
+    rowsB, the tie correction term, sum(t**3 - t) over each group of t tied values, and the sum of the
+    values of rowsA and of rowsB.  Rows in both sets are ranked as a member of each.
+
+    The genes are read (from Xc, if the dataset is sparse) and ranked in chunks, concurrently on the
+    compute_pool.  If a job is specified, progress is reported in genes, and it is checked for
+    cancellation between chunks.
+    """
+    n_obs, n_var = adaptor.get_shape()
+    nA, nB = len(rowsA), len(rowsB)
+    matrix = adaptor.open_X_array(col_wise=True)
+    if adaptor.is_sparse:
+        membership = np.zeros((n_obs,), dtype=np.int8)
+        membership[rowsA] |= IN_A
+        membership[rowsB] |= IN_B
+        read_columns = partial(_read_sparse_columns, matrix, membership, adaptor.is_1d)
+    else:
+        rows = np.union1d(rowsA, rowsB)
+        if len(rows) == nA + nB:
+            index, in_A = None, np.isin(rows, rowsA)
+        else:
+            # the positions in rows of the values of rowsA, then of rowsB
+            index = np.concatenate([np.searchsorted(rows, rowsA), np.searchsorted(rows, rowsB)])
+            in_A = np.arange(nA + nB) < nA
+        read_columns = partial(_read_dense_columns, matrix, rows, index, in_A)
+
+    chunk_cols = _rank_sum_chunk_cols(adaptor, nA + nB)
+    chunks = [(start, min(start + chunk_cols, n_var)) for start in range(0, n_var, chunk_cols)]
+    if job is not None:
+        job.set_total(n_var)
+
+    def rank_chunk(chunk):
+        if job is not None:
+            job.check_cancelled()
+        result = _rank_sum_columns(*read_columns(*chunk), nA, nB)
+        if job is not None:
+            job.advance(chunk[1] - chunk[0])
+        return result
+
+    results = compute_pool.map(rank_chunk, chunks)
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+def _rank_sum_chunk_cols(adaptor, n_rows):
+    """
+    Return the number of genes per chunk, such that the chunks read concurrently fit within the
+    diffexp memory limit, and there are enough chunks to occupy the workers.
+    """
+    n_obs, n_var = adaptor.get_shape()
+    itemsize = adaptor.get_X_array_dtype().itemsize
+    if adaptor.is_sparse:
+        # each stored element is read with its (obs, var) coordinates
+        nnz = adaptor.X_descriptor.nnz or n_obs * n_var
+        col_bytes = (nnz / max(n_var, 1)) * (16 + itemsize)
+    else:
+        col_bytes = n_rows * itemsize
+    n_workers = compute_pool.max_workers
+    chunk_cols = -(-n_var // n_workers)
+    if adaptor.diffexp_memory_limit is not None:
+        chunk_cols = min(chunk_cols, int(adaptor.diffexp_memory_limit // (n_workers * max(col_bytes, 1))))
+    return max(1, chunk_cols)
+
+
+def _read_sparse_columns(matrix, membership, is_1d, start, stop):
+    """
+    Read the stored elements of the genes [start, stop) of the rows in set A or B (membership IN_A and/or
+    IN_B), and return them as (indptr, values, in_A) in compressed sparse column order.  The elements
+    of rows in both sets are returned twice, as a member of each.
+    """
+    if is_1d:
+        data = matrix.query(order="U").multi_index[start : stop - 1]
+    else:
+        data = matrix.query(order="U").multi_index[:, start : stop - 1]
+    coords = data.get("coords", data)
+    group = membership[coords["obs"]]
+    var = coords["var"].astype(np.int64) - start
+    selected_A = (group & IN_A) != 0
+    selected_B = (group & IN_B) != 0
+    var = np.concatenate([var[selected_A], var[selected_B]])
+    values = np.concatenate([data[""][selected_A], data[""][selected_B]])
+    in_A = np.arange(len(var)) < np.count_nonzero(selected_A)
+    order = np.argsort(var, kind="stable")
+    indptr = np.zeros((stop - start + 1,), dtype=np.int64)
+    np.cumsum(np.bincount(var, minlength=stop - start), out=indptr[1:])
+    return indptr, values[order], in_A[order]
+
+
+def _read_dense_columns(matrix, rows, index, in_A, start, stop):
+    """
+    Read the genes [start, stop) of the rows, and return those of rows[index] (or all of the rows, if
+    index is None) as (indptr, values, in_A) in compressed sparse column order.
+    """
+    items, covering = choose_selector_from_indices(rows)
+    X = matrix.multi_index[items, start : stop - 1][""]
+    if covering:
+        positions = rows - items[0].start
+        X = X[positions if index is None else positions[index]]
+    elif index is not None:
+        X = X[index]
+    indptr = np.arange(stop - start + 1, dtype=np.int64) * X.shape[0]
+    return indptr, np.ascontiguousarray(X.T).ravel(), np.tile(in_A, stop - start)
+
+
+@jit(nopython=True, nogil=True)
+def _rank_sum_columns(indptr, values, in_A, nA, nB):
+    """
+    For each column of the compressed sparse column matrix, return the rank sum of the set A values,
+    the tie correction term and the sums of the set A and set B values.  The (nA + nB) - stored
+    elements of each column are zero.
+    """
+    n_cols = indptr.shape[0] - 1
+    rank_sum = np.zeros((n_cols,), dtype=np.float64)
+    tie_sum = np.zeros((n_cols,), dtype=np.float64)
+    sum_A = np.zeros((n_cols,), dtype=np.float64)
+    sum_B = np.zeros((n_cols,), dtype=np.float64)
+
+    for j in range(n_cols):
+        vals = values[indptr[j] : indptr[j + 1]]
+        col_in_A = in_A[indptr[j] : indptr[j + 1]]
+        nonzero = vals != 0
+        nz_vals = vals[nonzero]
+        nz_in_A = col_in_A[nonzero]
+        for i in range(nz_vals.shape[0]):
+            if nz_in_A[i]:
+                sum_A[j] += nz_vals[i]
+            else:
+                sum_B[j] += nz_vals[i]
+
+        # zeros are a single group of tied values, ranked after the negative and before the positive values
+        n_zeros = nA + nB - nz_vals.shape[0]
+        n_zeros_A = nA - np.count_nonzero(nz_in_A)
+        zeros_ranked = n_zeros == 0
+        order = np.argsort(nz_vals)
+        ranked = 0.0
+        R = 0.0
+        T = 0.0
+        i = 0
+        while i < order.shape[0]:
+            value = nz_vals[order[i]]
+            if not zeros_ranked and value > 0:
+                R += (ranked + (n_zeros + 1) / 2) * n_zeros_A
+                T += np.float64(n_zeros) ** 3 - n_zeros
+                ranked += n_zeros
+                zeros_ranked = True
+            k = i
+            t_A = 0
+            while k < order.shape[0] and nz_vals[order[k]] == value:
+                if nz_in_A[order[k]]:
+                    t_A += 1
+                k += 1
+            t = k - i
+            R += (ranked + (t + 1) / 2) * t_A
+            T += np.float64(t) ** 3 - t
+            ranked += t
+            i = k
+        if not zeros_ranked:
+            R += (ranked + (n_zeros + 1) / 2) * n_zeros_A
+            T += np.float64(n_zeros) ** 3 - n_zeros
+
+        rank_sum[j] = R
+        tie_sum[j] = T
+
+    return rank_sum, tie_sum, sum_A, sum_B
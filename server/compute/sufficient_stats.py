@@ -0,0 +1,96 @@
+from dataclasses import dataclass
+
+import numpy as np
+import tiledb
+
+# Name of the optional sidecar array, in the CXG group, holding the per-gene statistics.
+X_STATS_ARRAY_NAME = "X_stats"
+
+
+@dataclass(frozen=True)
+class XStats:
+    """
+    Per-gene sufficient statistics of the entire X matrix: the sum, sum of squares and number of
+    non-zero values of each var (gene), over all n_obs rows.
+
+    From these, the mean and variance of any row subset can be derived from those of its
+    complement, without reading the subset from X.
+    """
+
+    n_obs: int
+    sum: np.ndarray
+    sumsq: np.ndarray
+    nnz: np.ndarray
+
+    @property
+    def n_var(self):
+        return self.sum.shape[0]
+
+    def complement_mean_var(self, mean, var, n):
+        """
+        Given the per-gene mean and (sample) variance of n rows, return the mean, variance and count
+        of all other rows.
+        """
+        n_rest = self.n_obs - n
+        mean = mean.astype(np.float64)
+        var = var.astype(np.float64)
+        sum_rest = self.sum - mean * n
+        sumsq_rest = self.sumsq - (var * max(n - 1, 0) + mean**2 * n)
+        mean_rest = sum_rest / max(n_rest, 1)
+        M2_rest = np.maximum(sumsq_rest - mean_rest * sum_rest, 0)
+        var_rest = M2_rest / max(n_rest - 1, 1)
+        return mean_rest, var_rest, n_rest
+
+
+def compute_X_stats(X, shape, chunk_rows=65536):
+    """
+    Compute XStats by scanning the (row-wise) X array, which may be sparse or dense.
+    """
+    n_obs, n_var = shape
+    total = np.zeros((n_var,), dtype=np.float64)
+    sumsq = np.zeros((n_var,), dtype=np.float64)
+    nnz = np.zeros((n_var,), dtype=np.uint64)
+
+    if X.schema.sparse:
+        for slc in X.query(order="U", return_incomplete=True).multi_index[:]:
+            var, val = slc["var"], slc[""].astype(np.float64)
+            total += np.bincount(var, weights=val, minlength=n_var)
+            sumsq += np.bincount(var, weights=val**2, minlength=n_var)
+            nnz += np.bincount(var[val != 0], minlength=n_var).astype(np.uint64)
+    else:
+        for start in range(0, n_obs, chunk_rows):
+            stop = min(start + chunk_rows, n_obs) - 1  # inclusive
+            val = X.multi_index[start:stop, :][""].astype(np.float64)
+            total += val.sum(axis=0)
+            sumsq += np.square(val).sum(axis=0)
+            nnz += np.count_nonzero(val, axis=0).astype(np.uint64)
+
+    return XStats(n_obs=n_obs, sum=total, sumsq=sumsq, nnz=nnz)
+
+
+def write_X_stats(uri, X_stats, ctx=None):
+    """
+    Write the XStats to a new dense array at uri.
+    """
+    dom = tiledb.Domain(tiledb.Dim(name="var", domain=(0, X_stats.n_var - 1), tile=X_stats.n_var, dtype=np.uint32))
+    schema = tiledb.ArraySchema(
+        domain=dom,
+        sparse=False,
+        attrs=[
+            tiledb.Attr(name="sum", dtype=np.float64),
+            tiledb.Attr(name="sumsq", dtype=np.float64),
+            tiledb.Attr(name="nnz", dtype=np.uint64),
+        ],
+    )
+    tiledb.DenseArray.create(uri, schema, ctx=ctx)
+    with tiledb.open(uri, mode="w", ctx=ctx) as A:
+        A[:] = {"sum": X_stats.sum, "sumsq": X_stats.sumsq, "nnz": X_stats.nnz}
+        A.meta["n_obs"] = X_stats.n_obs
+
+
+def read_X_stats(array):
+    """
+    Read the XStats from an open sidecar array.
+    """
+    data = array[:]
+    return XStats(n_obs=int(array.meta["n_obs"]), sum=data["sum"], sumsq=data["sumsq"], nnz=data["nnz"])
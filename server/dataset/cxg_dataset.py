@@ -4,8 +4,10 @@ import logging
 import os
 import pickle  # TODO: remove this after 5.3.0 migration
 import threading
+from collections import OrderedDict
 from copy import deepcopy
-from typing import Any, Dict, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
 from urllib.parse import quote, unquote
 
 import numpy as np
@@ -13,21 +15,50 @@ import pandas as pd
 import tiledb
 from packaging import version
 from pandas.api.types import is_categorical_dtype
+from scipy import sparse
 from server_timing import Timing as ServerTiming
 from tiledb import TileDBError
 
 from server.common.cache.atac_cache import CYTOBAND_DATA_CACHE, GENE_DATA_CACHE
+from server.common.cache.lru_cache import ByteBudgetLRUCache
 from server.common.constants import ATAC_BIN_SIZE, ATAC_RANGE_BUFFER, XApproximateDistribution
 from server.common.errors import ConfigurationError, DatasetAccessError
+from server.common.fbs.fbs_coders import CategoryDictionaryCache
 from server.common.fbs.matrix import encode_matrix_fbs
 from server.common.immutable_kvcache import ImmutableKVCache
+from server.common.threadpool import compute_pool
+from server.common.utils.data_locator import DataLocator
 from server.common.utils.type_conversion_utils import get_schema_type_hint_from_dtype
 from server.common.utils.utils import path_join
 from server.compute import diffexp_cxg
-from server.dataset.cxg_util import pack_selector_from_mask
+from server.compute.sufficient_stats import X_STATS_ARRAY_NAME, read_X_stats
+from server.dataset.cxg_util import (
+    choose_selector_from_mask,
+    pack_selector_from_indices,
+    pack_selector_from_mask,
+    partition_indices_by_tile,
+)
 from server.dataset.dataset import Dataset
 
 
+@dataclass(frozen=True)
+class XDescriptor:
+    """Immutable properties of a CXG's X matrix, captured when the dataset is opened"""
+
+    shape: Tuple[int, int]  # (n_obs, n_vars)
+    dtype: np.dtype
+    is_sparse: bool
+    is_1d: bool  # True if stored as row-wise and column-wise 1D arrays (Xr and Xc), else a 2D array (X)
+    nnz: Optional[int]  # estimated number of stored cells (sparse only) - the sum of the fragment cell counts
+    tile_extents: Tuple[Optional[int], ...]  # per-dimension tile extents of the row-wise array
+    var_tile_extent: Optional[int]  # tile extent of the var dimension of the array read by column (Xc or X)
+
+
+def _tile_extent(dim):
+    # sparse arrays need not specify a tile extent
+    return None if dim.tile is None else int(dim.tile)
+
+
 class CxgDataset(Dataset):
     # These defaults are overridden by the config variable: server.adaptor.cxg_adaptor.tiledb_cxt
     tiledb_ctx = tiledb.Ctx(
@@ -38,6 +69,35 @@ class CxgDataset(Dataset):
         }
     )
 
+    # Decoded X columns, shared by all datasets: (dataset url, var index) -> dense column.
+    # The size is set by the config variable: server.adaptor.cxg_adaptor.X_column_cache_bytes
+    X_column_cache = ByteBudgetLRUCache(max_bytes=0)
+
+    # Diffexp results and per-cell-set (mean, variance, count) accumulators, shared by all datasets.
+    # See diffexp_cxg.diffexp_ttest.  The size is set by the config variable:
+    # server.adaptor.cxg_adaptor.diffexp_cache_bytes
+    diffexp_cache = ByteBudgetLRUCache(max_bytes=0)
+
+    # Maximum size, in bytes, of the X rows held in memory while computing the statistics of a cell set
+    # of a dense X, or None for no limit.  Set by the config variable:
+    # server.adaptor.cxg_adaptor.diffexp_memory_limit
+    diffexp_memory_limit = None
+
+    # If True, diffexp statistics are accumulated in float32 with compensated summation.  Set by the
+    # config variable: server.adaptor.cxg_adaptor.diffexp_float32
+    diffexp_float32 = False
+
+    # Large X reads are split into at most this many partitions, of at least this many vars, which
+    # are read concurrently on the compute_pool.
+    X_read_max_partitions = min(8, os.cpu_count() or 1)
+    X_read_min_partition_size = 16
+
+    # Memoized results of successful structural validation (see pre_load_validation), least recently
+    # used first: location -> last modification time of the CXG group, when validated.
+    validated_locations = OrderedDict()
+    validated_locations_lock = threading.Lock()
+    max_validated_locations = 4096
+
     def __init__(self, data_locator, app_config=None):
         super().__init__(data_locator, app_config)
         self.lock = threading.Lock()
@@ -53,8 +113,13 @@ class CxgDataset(Dataset):
         self.lsuri_results = ImmutableKVCache(lambda key: self._lsuri(uri=key, tiledb_ctx=self.tiledb_ctx))
         self.arrays = ImmutableKVCache(lambda key: self._open_array(uri=key, tiledb_ctx=self.tiledb_ctx))
         self.schema = None
+        self.category_dtypes = None  # set with the schema - see _get_schema
+        self.category_dictionaries = CategoryDictionaryCache()
         self.genesets = None
         self.X_approximate_distribution = None
+        self.X_stats = None  # loaded on first use - see get_X_stats
+        self.X_stats_loaded = False
+        self.lastmodtime = CxgDataset._validated_lastmodtime(data_locator)
 
         self._validate_and_initialize()
 
@@ -372,6 +437,9 @@ class CxgDataset(Dataset):
             array.close()
         self.arrays.clear()
 
+    def get_open_array_count(self):
+        return len(self.arrays)
+
     def save_obs_annotations(
         self,
         dataframe: pd.DataFrame,
@@ -543,16 +611,81 @@ class CxgDataset(Dataset):
                 raise ConfigurationError(f"Invalid tiledb context: {str(e)}") from None
 
     @staticmethod
-    def pre_load_validation(data_locator):
+    def set_X_column_cache(max_bytes):
+        if CxgDataset.X_column_cache.max_bytes != max_bytes:
+            CxgDataset.X_column_cache = ByteBudgetLRUCache(max_bytes=max_bytes)
+
+    @staticmethod
+    def set_diffexp_cache(max_bytes):
+        if CxgDataset.diffexp_cache.max_bytes != max_bytes:
+            CxgDataset.diffexp_cache = ByteBudgetLRUCache(max_bytes=max_bytes)
+
+    @staticmethod
+    def pre_load_validation(data_locator, trusted=False):
+        """
+        Validate the CXG structure (see isvalid), which requires several requests to the storage service.
+
+        A successful validation is memoized per location, and re-used until the last modification time of
+        the CXG group changes.  If the dataset is trusted to be immutable, the memoized result is re-used
+        without checking the modification time.
+        """
         location = data_locator.uri_or_path
+        with CxgDataset.validated_locations_lock:
+            memoized = location in CxgDataset.validated_locations
+            validated_lastmod = CxgDataset.validated_locations.get(location)
+            if memoized:
+                CxgDataset.validated_locations.move_to_end(location)
+        if memoized and trusted:
+            return
+
+        lastmod = CxgDataset._group_lastmodtime(data_locator)
+        if memoized and lastmod is not None and lastmod == validated_lastmod:
+            return
+
         if not CxgDataset.isvalid(location):
+            with CxgDataset.validated_locations_lock:
+                CxgDataset.validated_locations.pop(location, None)
             logging.error(f"cxg matrix is not valid: {location}")
             raise DatasetAccessError("cxg matrix is not valid")
 
+        with CxgDataset.validated_locations_lock:
+            CxgDataset.validated_locations[location] = lastmod
+            CxgDataset.validated_locations.move_to_end(location)
+            while len(CxgDataset.validated_locations) > CxgDataset.max_validated_locations:
+                CxgDataset.validated_locations.popitem(last=False)
+
+    @staticmethod
+    def _validated_lastmodtime(data_locator):
+        """
+        Return the last modification time of the CXG group, as memoized by pre_load_validation when the
+        dataset was validated, or None if unavailable.
+        """
+        with CxgDataset.validated_locations_lock:
+            lastmod = CxgDataset.validated_locations.get(data_locator.uri_or_path)
+        return lastmod if lastmod is not None else CxgDataset._group_lastmodtime(data_locator)
+
+    @staticmethod
+    def _group_lastmodtime(data_locator):
+        """
+        Return the last modification time of the CXG group, or None if unavailable.  TileDB writes the
+        group marker object when the group is created, so it changes when the CXG is replaced.
+        """
+        marker = DataLocator(
+            path_join(data_locator.uri_or_path, "__tiledb_group.tdb"), region_name=data_locator.region_name
+        )
+        try:
+            return marker.lastmodtime()
+        except Exception:
+            return None
+
     @staticmethod
     def file_size(data_locator):
         return 0
 
+    def get_last_mod_time(self):
+        """The last modification time of the CXG group when the dataset was opened, or None if unavailable"""
+        return self.lastmodtime
+
     @staticmethod
     def open(data_locator, app_config):
         return CxgDataset(data_locator, app_config)
@@ -575,15 +708,71 @@ class CxgDataset(Dataset):
     def get_path(self, *urls):
         return path_join(self.url, *urls)
 
-    def _init_sparsity_and_format(self):
+    def _init_X_descriptor(self):
+        """
+        Capture the immutable properties of the X matrix, so that they are not re-read from the
+        array schemas on each request.
+        """
         try:
             X = self.open_array("Xr")
-            self.is_1d = True
+            is_1d = True
         except Exception:
             X = self.open_array("X")
-            self.is_1d = False
+            is_1d = False
+        if is_1d:
+            Xc = self.open_array("Xc")
+            shape = (X.shape[0], Xc.shape[0])
+            var_dim = Xc.schema.domain.dim(0)
+        else:
+            shape = X.shape
+            var_dim = X.schema.domain.dim(1)
+
+        nnz = None
+        if X.schema.sparse:
+            try:
+                fragments = tiledb.array_fragments(X.uri, ctx=self.tiledb_ctx)
+                nnz = int(sum(fragment.cell_num for fragment in fragments))
+            except Exception:
+                logging.warning(f"Unable to estimate nnz for {self.url}", exc_info=True)
+
+        self.X_descriptor = XDescriptor(
+            shape=tuple(int(n) for n in shape),
+            dtype=X.attr(0).dtype,
+            is_sparse=X.schema.sparse,
+            is_1d=is_1d,
+            nnz=nnz,
+            tile_extents=tuple(_tile_extent(dim) for dim in X.schema.domain),
+            var_tile_extent=_tile_extent(var_dim),
+        )
+        self.is_1d = is_1d
         self.is_sparse = X.schema.sparse
 
+    def _load_X_stats(self):
+        """
+        Return the optional per-gene X statistics sidecar (see scripts/cxg_X_stats.py), or None.  A
+        sidecar which does not match the shape of X is ignored.
+        """
+        if not self.has_array(X_STATS_ARRAY_NAME):
+            return None
+        try:
+            X_stats = read_X_stats(self.open_array(X_STATS_ARRAY_NAME))
+        except Exception:
+            logging.warning(f"Unable to read {X_STATS_ARRAY_NAME} for {self.url}", exc_info=True)
+            return None
+        if (X_stats.n_obs, X_stats.n_var) != self.get_shape():
+            logging.warning(f"Ignoring {X_STATS_ARRAY_NAME} for {self.url}, which does not match the X shape")
+            return None
+        return X_stats
+
+    def get_X_stats(self):
+        # loaded lazily, as it is only used by diffexp, which most opens of a dataset never run
+        if not self.X_stats_loaded:
+            with self.lock:
+                if not self.X_stats_loaded:
+                    self.X_stats = self._load_X_stats()
+                    self.X_stats_loaded = True
+        return self.X_stats
+
     @staticmethod
     def _lsuri(uri, tiledb_ctx):
         def _cleanpath(p):
@@ -673,7 +862,7 @@ class CxgDataset(Dataset):
         self.about = about
         self.cxg_version = cxg_version
         self.corpora_props = corpora_props
-        self._init_sparsity_and_format()
+        self._init_X_descriptor()
 
     @staticmethod
     def _open_array(uri, tiledb_ctx):
@@ -704,11 +893,25 @@ class CxgDataset(Dataset):
         array = self.open_array(f"emb/{ename}")
         return array[:, 0:dims]
 
-    def compute_diffexp_ttest(self, setA, setB, top_n=None, lfc_cutoff=None, selector_lists=False):
+    def compute_diffexp_ttest(
+        self, setA, setB, top_n=None, lfc_cutoff=None, selector_lists=False, job=None, sample_size=None
+    ):
         if top_n is None:
             top_n = self.app_config.default_dataset__diffexp__top_n
         if lfc_cutoff is None:
             lfc_cutoff = self.app_config.default_dataset__diffexp__lfc_cutoff
+        if sample_size is not None:
+            return diffexp_cxg.diffexp_ttest_approximate(
+                adaptor=self,
+                setA=setA,
+                setB=setB,
+                sample_size=sample_size,
+                seed=self.app_config.default_dataset__diffexp__approximate_seed,
+                top_n=top_n,
+                diffexp_lfc_cutoff=lfc_cutoff,
+                selector_lists=selector_lists,
+                job=job,
+            )
         return diffexp_cxg.diffexp_ttest(
             adaptor=self,
             setA=setA,
@@ -716,6 +919,35 @@ class CxgDataset(Dataset):
             top_n=top_n,
             diffexp_lfc_cutoff=lfc_cutoff,
             selector_lists=selector_lists,
+            job=job,
+        )
+
+    def compute_diffexp_wilcoxon(self, setA, setB, top_n=None, lfc_cutoff=None, selector_lists=False, job=None):
+        if top_n is None:
+            top_n = self.app_config.default_dataset__diffexp__top_n
+        if lfc_cutoff is None:
+            lfc_cutoff = self.app_config.default_dataset__diffexp__lfc_cutoff
+        return diffexp_cxg.diffexp_wilcoxon(
+            adaptor=self,
+            setA=setA,
+            setB=setB,
+            top_n=top_n,
+            diffexp_lfc_cutoff=lfc_cutoff,
+            selector_lists=selector_lists,
+            job=job,
+        )
+
+    def compute_diffexp_ttest_one_vs_rest(self, labels, n_groups, top_n=None, lfc_cutoff=None):
+        if top_n is None:
+            top_n = self.app_config.default_dataset__diffexp__top_n
+        if lfc_cutoff is None:
+            lfc_cutoff = self.app_config.default_dataset__diffexp__lfc_cutoff
+        return diffexp_cxg.diffexp_ttest_one_vs_rest(
+            adaptor=self,
+            labels=labels,
+            n_groups=n_groups,
+            top_n=top_n,
+            diffexp_lfc_cutoff=lfc_cutoff,
         )
 
     def get_colors(self):
@@ -731,6 +963,7 @@ class CxgDataset(Dataset):
         coord_range is the maxinum size of the range (e.g. get_shape()[0] or get_shape()[1])
         coord_mask is a mask passed into the get_X_array, of size coord_range
         coord_data are indices representing locations of non-zero values, in the range [0,coord_range).
+        Every index in coord_data must be selected by coord_mask.
 
         For example, say
         coord_mask = [1,0,1,0,0,1]
@@ -739,23 +972,25 @@ class CxgDataset(Dataset):
         The function computes the following:
         indices = [0,2,5]
         ncoord = 3
-        maprange = [0,1,2]
-        mapindex = [0,0,1,0,0,2]
-        coordindices = [1,0,1,1,2]
+        coordindices = [1,0,1,1,2], ie, the position of each coord_data element in indices
         """
         if coord_mask is None:
             return coord_range, coord_data
 
         indices = coord_mask.nonzero()[0]
         ncoord = indices.shape[0]
-        maprange = np.arange(ncoord)
-        mapindex = np.zeros(indices[-1] + 1, dtype=int)
-        mapindex[indices] = maprange
-        coordindices = mapindex[coord_data]
+        coordindices = np.searchsorted(indices, coord_data)
         return ncoord, coordindices
 
-    def get_X_array(self, obs_mask=None, var_mask=None):
-        obs_items = pack_selector_from_mask(obs_mask)
+    def get_X_array(self, obs_mask=None, var_mask=None, allow_sparse=False):
+        """
+        Return the X array, possibly filtered by obs_mask and/or var_mask.  If allow_sparse is True,
+        and the CXG is sparse, a scipy.sparse.csc_matrix may be returned rather than a dense ndarray.
+
+        Dense column reads (obs_mask None) are served through the X column cache - except sparse reads,
+        which bypass it, as it holds dense columns.
+        """
+        obs_items, obs_covering = choose_selector_from_mask(obs_mask)
         var_items = pack_selector_from_mask(var_mask)
         shape = self.get_shape()
         if obs_items is None or var_items is None:
@@ -764,36 +999,117 @@ class CxgDataset(Dataset):
             var_size = 0 if var_items is None else shape[1] if var_mask is None else np.count_nonzero(var_mask)
             return np.ndarray((obs_size, var_size))
 
+        use_column_cache = CxgDataset.X_column_cache.max_bytes > 0 and not (allow_sparse and self.is_sparse)
+        if obs_mask is None and var_mask is not None and use_column_cache:
+            return self._get_X_columns(var_mask.nonzero()[0])
+
+        return self._query_X_array(
+            obs_mask, var_mask, obs_items, var_items, allow_sparse=allow_sparse, obs_covering=obs_covering
+        )
+
+    def _get_X_columns(self, var_indices):
+        """
+        Return the (dense) X columns for var_indices, reading through the X column cache.  Only the
+        columns which are not cached are read from the X array.
+        """
+        n_obs, n_vars = self.get_shape()
+        X = np.empty((n_obs, len(var_indices)), dtype=self.get_X_array_dtype())
+        missing = []
+        for i, var_index in enumerate(var_indices):
+            column = CxgDataset.X_column_cache.get((self.url, var_index))
+            if column is None:
+                missing.append(i)
+            else:
+                X[:, i] = column
+
+        if missing:
+            var_mask = np.zeros(n_vars, dtype=bool)
+            var_mask[var_indices[missing]] = True
+            data = self._query_X_array(None, var_mask, slice(None), pack_selector_from_mask(var_mask))
+            # var_indices are in ascending order, as are the columns of data
+            for j, i in enumerate(missing):
+                column = np.ascontiguousarray(data[:, j])
+                column.flags.writeable = False  # shared by all readers of the cache
+                CxgDataset.X_column_cache.put((self.url, var_indices[i]), column)
+                X[:, i] = column
+
+        return X
+
+    def _query_X_array(self, obs_mask, var_mask, obs_items, var_items, allow_sparse=False, obs_covering=False):
+        """
+        Read X.  Large var selections are partitioned at tile boundaries and read concurrently, on the
+        compute_pool (TileDB releases the GIL while reading), and the partial results stitched back
+        together.
+
+        If obs_covering is True, obs_items is a range covering the obs_mask selection (see
+        choose_selector_from_mask), and the rows read are filtered to those selected.
+        """
+        partitions = []
+        if var_mask is not None:
+            partitions = partition_indices_by_tile(
+                var_mask.nonzero()[0],
+                self.X_descriptor.var_tile_extent,
+                max_partitions=CxgDataset.X_read_max_partitions,
+                min_partition_size=CxgDataset.X_read_min_partition_size,
+            )
+        if len(partitions) <= 1:
+            return self._query_X_partition(obs_mask, var_mask, obs_items, var_items, allow_sparse, obs_covering)
+
+        def query_partition(var_indices):
+            partition_mask = np.zeros_like(var_mask)
+            partition_mask[var_indices] = True
+            return self._query_X_partition(
+                obs_mask,
+                partition_mask,
+                obs_items,
+                pack_selector_from_indices(var_indices),
+                allow_sparse,
+                obs_covering,
+            )
+
+        results = compute_pool.map(query_partition, partitions)
+
+        if any(sparse.issparse(result) for result in results):
+            return sparse.hstack(results, format="csc")
+        return np.hstack(results)
+
+    def _query_X_partition(self, obs_mask, var_mask, obs_items, var_items, allow_sparse, obs_covering):
+        shape = self.get_shape()
         if self.is_sparse:
             X = self.open_X_array(col_wise=True)
             if self.is_1d:
                 data = X.query(order="U").multi_index[var_items]
             else:
                 data = X.query(order="U").multi_index[obs_items, var_items]
-            nrows, obsindices = self.__remap_indices(shape[0], obs_mask, data.get("coords", data)["obs"])
-            ncols, varindices = self.__remap_indices(shape[1], var_mask, data.get("coords", data)["var"])
+            coords = data.get("coords", data)
+            obs, var, values = coords["obs"], coords["var"], data[""]
+            if (self.is_1d or obs_covering) and obs_mask is not None:
+                # the column-wise 1D array can only be sliced on the var dimension, and a covering obs
+                # range includes unselected rows
+                selected = obs_mask[obs]
+                obs, var, values = obs[selected], var[selected], values[selected]
+            nrows, obsindices = self.__remap_indices(shape[0], obs_mask, obs)
+            ncols, varindices = self.__remap_indices(shape[1], var_mask, var)
+            if allow_sparse:
+                return sparse.csc_matrix((values, (obsindices, varindices)), shape=(nrows, ncols))
             densedata = np.zeros((nrows, ncols), dtype=self.get_X_array_dtype())
-            densedata[obsindices, varindices] = data[""]
+            densedata[obsindices, varindices] = values
             return densedata
         else:
             X = self.open_X_array()
             data = X.multi_index[obs_items, var_items][""]
+            if obs_covering:
+                data = data[obs_mask[obs_items[0].start : obs_items[0].stop + 1]]
             return data
 
     def get_X_approximate_distribution(self) -> XApproximateDistribution:
         return self.X_approximate_distribution
 
     def get_shape(self):
-        X = self.open_X_array()
-        if self.is_1d:
-            Xc = self.open_X_array(col_wise=True)
-            return (X.shape[0], Xc.shape[0])
-        else:
-            return X.shape
+        return self.X_descriptor.shape
 
     def get_X_array_dtype(self):
-        X = self.open_X_array()
-        return X.attr(0).dtype
+        return self.X_descriptor.dtype
 
     def query_var_array(self, term_name):
         var = self.open_array("var")
@@ -1041,6 +1357,10 @@ class CxgDataset(Dataset):
             **get_schema_type_hint_from_dtype(dtype=dtype, allow_int64=True),
         }
 
+        # The categories of the categorical obs annotations are interned, as a CategoricalDtype, for the
+        # life of the dataset.  The schema and the annotation columns (see annotation_to_fbs_matrix) share
+        # them, and memoized category dictionaries of the columns are looked up by their identity.
+        category_dtypes = {}
         annotations = {}
         for ax in ("obs", "var"):
             A = self.open_array(ax)
@@ -1068,6 +1388,8 @@ class CxgDataset(Dataset):
                         schema["categories"] = [str(cat) for cat in schema["categories"]]
                     elif schema["type"] == "categorical" and "categories" in type_hint:
                         schema["categories"] = type_hint["categories"]
+                    if ax == "obs" and schema["type"] == "categorical" and schema.get("categories"):
+                        category_dtypes[attr.name] = pd.CategoricalDtype(schema["categories"])
                 else:
                     schema.update(get_schema_type_hint_from_dtype(dtype=attr.dtype))
                 cols.append(schema)
@@ -1084,6 +1406,7 @@ class CxgDataset(Dataset):
             obs_layout.append({"name": ename, "type": "float32", "dims": [f"{ename}_{d}" for d in range(0, A.ndim)]})
 
         schema = {"dataframe": dataframe, "annotations": annotations, "layout": {"obs": obs_layout}}
+        self.category_dtypes = category_dtypes
         return schema
 
     def _augment_schema_with_user_annotations(self, schema: Dict[str, Any], annotations_df: pd.DataFrame) -> None:
@@ -1116,13 +1439,15 @@ class CxgDataset(Dataset):
                 }
             )
 
-    def get_schema(self, user_id: Optional[str] = None):
+    def _load_schema(self):
         if self.schema is None:
             with self.lock:
                 if self.schema is None:
                     self.schema = self._get_schema()
+        return self.schema
 
-        schema = deepcopy(self.schema)
+    def get_schema(self, user_id: Optional[str] = None):
+        schema = deepcopy(self._load_schema())
         if user_id:
             user_annotations = self.get_saved_obs_annotations(user_id=user_id)
             self._augment_schema_with_user_annotations(schema, user_annotations)
@@ -1183,7 +1508,8 @@ class CxgDataset(Dataset):
 
         if self.genesets is None:
             with self.lock:
-                self.genesets = self._get_genesets()
+                if self.genesets is None:
+                    self.genesets = self._get_genesets()
         if isinstance(self.genesets, dict):
             geneset_entries = self.genesets.get("genesets", [])
             normalized_genesets = self._normalize_genesets(geneset_entries)
@@ -1206,9 +1532,7 @@ class CxgDataset(Dataset):
             A = self.open_array(str(axis))
 
             try:
-                schema = self.get_schema(user_id=user_id) if axis == "obs" else self.get_schema()
-                obs_schema_columns = schema["annotations"]["obs"]["columns"] if axis == "obs" else []
-
+                self._load_schema()
                 obs_column_names = {attr.name for attr in A.schema}
                 requested_fields = list(fields) if fields else None
                 base_fields: Optional[list[str]] = None
@@ -1229,22 +1553,13 @@ class CxgDataset(Dataset):
                     df = pd.DataFrame(index=range(n_obs))
 
                 if axis == "obs":
-                    categorical_dtypes = []
-                    for column_schema in obs_schema_columns:
-                        column_name = column_schema.get("name")
-                        if fields and column_name not in fields:
-                            continue
-                        if column_schema.get("type") == "categorical":
-                            categories = column_schema.get("categories", [])
-                            if categories:
-                                categorical_dtypes.append((column_name, categories))
-
-                    for name, categories in categorical_dtypes:
+                    # saved user annotations, which may also be categorical, replace these below
+                    for name, dtype in self.category_dtypes.items():
                         if name in df.columns:
                             if str(df[name].dtype).startswith("int") or str(df[name].dtype).startswith("uint"):
-                                df[name] = pd.Categorical.from_codes(df[name], categories=categories)
+                                df[name] = pd.Categorical.from_codes(df[name], dtype=dtype)
                             else:
-                                df[name] = pd.Categorical(df[name], categories=categories)
+                                df[name] = pd.Categorical(df[name], dtype=dtype)
 
                 saved_annotations = None
                 if axis == "obs":
@@ -1271,6 +1586,8 @@ class CxgDataset(Dataset):
                 raise KeyError(e) from None
 
         with ServerTiming.time(f"annotations.{axis}.encode"):
-            fbs = encode_matrix_fbs(df, col_idx=df.columns, num_bins=num_bins)
+            fbs = encode_matrix_fbs(
+                df, col_idx=df.columns, num_bins=num_bins, category_dictionaries=self.category_dictionaries
+            )
 
         return fbs
@@ -1,5 +1,11 @@
 import numpy as np
 
+# A fragmented selection with more than this many runs, and at least this dense, is read as a single
+# covering range and post-filtered.  TileDB range handling cost grows with the number of ranges, and
+# at this density the covering range reads no more than a few times the cells actually selected.
+MAX_SELECTOR_RANGES = 1024
+MIN_COVERING_DENSITY = 0.25
+
 
 def pack_selector_from_mask(boolarray):
     """
@@ -17,20 +23,88 @@ def pack_selector_from_mask(boolarray):
     return pack_selector_from_indices(selector)
 
 
+def selector_runs(selector):
+    """
+    Return the (inclusive) start and stop of each run of consecutive values in the sorted indices.
+    """
+    selector = np.asarray(selector)
+    breaks = np.flatnonzero(np.diff(selector) != 1)
+    starts = selector[np.concatenate(([0], breaks + 1))]
+    stops = selector[np.concatenate((breaks, [len(selector) - 1]))]
+    return starts, stops
+
+
+def _pack_runs(starts, stops):
+    return [start if start == stop else slice(start, stop) for start, stop in zip(starts.tolist(), stops.tolist())]
+
+
 def pack_selector_from_indices(selector):
+    """
+    pack sorted indices into a list of slices (runs) and scalars (isolated points).  Remember
+    that tiledb multi_index requires INCLUSIVE indices.
+    """
     if len(selector) == 0:
         return None
 
-    result = []
-    current = slice(selector[0], selector[0])
-    for sel in selector[1:]:
-        if sel == current.stop + 1:
-            current = slice(current.start, sel)
-        else:
-            result.append(current if current.start != current.stop else current.start)
-            current = slice(sel, sel)
+    return _pack_runs(*selector_runs(selector))
+
+
+def choose_selector_from_mask(boolarray, **kwargs):
+    """
+    As choose_selector_from_indices(), for a mask.  A mask of None selects everything.
+    """
+    if boolarray is None:
+        return slice(None), False
+
+    assert isinstance(boolarray, np.ndarray)
+    assert boolarray.dtype == bool
+
+    return choose_selector_from_indices(np.nonzero(boolarray)[0], **kwargs)
+
+
+def choose_selector_from_indices(selector, max_ranges=MAX_SELECTOR_RANGES, min_density=MIN_COVERING_DENSITY):
+    """
+    Choose how to read the indices, based on the density of the selection.  Return a tuple
+    (items, covering):
+
+    * sparse or clustered selections are packed into a list of scalars and slices, as
+      pack_selector_from_indices(), and covering is False.
+    * dense but fragmented selections (many runs) are read as a single slice covering all of the
+      indices, and covering is True - the caller must post-filter the result to the selection.
+
+    items is None if the selection is empty.
+    """
+    if len(selector) == 0:
+        return None, False
+
+    starts, stops = selector_runs(selector)
+    if len(starts) > max_ranges:
+        first, last = int(selector.min()), int(selector.max())
+        if len(selector) / (last - first + 1) >= min_density:
+            return [slice(first, last)], True
+
+    return _pack_runs(starts, stops), False
+
+
+def partition_indices_by_tile(indices, tile_extent, max_partitions, min_partition_size=1):
+    """
+    Partition sorted indices into at most max_partitions contiguous runs of roughly equal size,
+    splitting only at tile boundaries, so that no tile is read by more than one partition.
+    Partitions smaller than min_partition_size are avoided.  Return a list of index arrays.
+    """
+    n = len(indices)
+    n_partitions = min(max_partitions, n // max(min_partition_size, 1))
+    if n_partitions <= 1:
+        return [indices]
 
-    if len(result) == 0 or result[-1] != current:
-        result.append(current if current.start != current.stop else current.start)
+    tiles = indices // (tile_extent or 1)
+    # candidate split points: the first index of each tile
+    tile_starts = np.flatnonzero(np.diff(tiles)) + 1
+    if len(tile_starts) == 0:
+        return [indices]
 
-    return result
+    # for each ideal (equal size) split point, use the nearest tile boundary
+    ideal = np.arange(1, n_partitions) * n / n_partitions
+    nearest = np.abs(tile_starts[:, None] - ideal[None, :]).argmin(axis=0)
+    splits = np.unique(tile_starts[nearest])
+    return np.split(indices, splits)
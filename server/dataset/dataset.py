@@ -1,13 +1,15 @@
 from abc import ABCMeta, abstractmethod
+from functools import partial
 from os.path import basename, splitext
 from typing import Any, Dict, Optional
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from server_timing import Timing as ServerTiming
 
 from server.common.config.app_config import AppConfig
-from server.common.constants import Axis, XApproximateDistribution
+from server.common.constants import Axis, DiffExpTest, XApproximateDistribution
 from server.common.errors import (
     DatasetAccessError,
     ExceedsLimitError,
@@ -76,7 +78,7 @@ class Dataset(metaclass=ABCMeta):
 
     @staticmethod
     @abstractmethod
-    def pre_load_validation(data_locator):
+    def pre_load_validation(data_locator, trusted=False):
         pass
 
     @staticmethod
@@ -110,9 +112,9 @@ class Dataset(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def get_X_array(self, obs_mask=None, var_mask=None):
+    def get_X_array(self, obs_mask=None, var_mask=None, allow_sparse=False):
         """return the X array, possibly filtered by obs_mask or var_mask.
-        the return type is ndarray."""
+        the return type is ndarray, or if allow_sparse is True, optionally a scipy.sparse matrix."""
         pass
 
     @abstractmethod
@@ -164,6 +166,10 @@ class Dataset(metaclass=ABCMeta):
     def cleanup(self):
         pass
 
+    def get_open_array_count(self):
+        """return the number of underlying array handles currently held open by this adaptor"""
+        return 0
+
     def get_data_locator(self):
         return self.data_locator
 
@@ -183,6 +189,22 @@ class Dataset(metaclass=ABCMeta):
     def get_corpora_props(self):
         return None
 
+    def get_X_stats(self):
+        """Return the precomputed per-gene statistics of X (an XStats), or None if not available"""
+        return None
+
+    def get_default_embedding(self):
+        """Return the name of the default embedding specified by the dataset, or None"""
+        corpora_props = self.get_corpora_props()
+        if not corpora_props or "default_embedding" not in corpora_props:
+            return None
+        default_embedding = corpora_props["default_embedding"]
+        if isinstance(default_embedding, str) and default_embedding.startswith("X_"):
+            default_embedding = default_embedding[2:]  # drop X_ prefix
+        if default_embedding in self.get_embedding_names():
+            return default_embedding
+        return None
+
     @abstractmethod
     def get_schema(self, user_id: Optional[str] = None):
         """
@@ -307,14 +329,17 @@ class Dataset(metaclass=ABCMeta):
             if self.app_config.exceeds_limit("column_request_max", num_columns):
                 raise ExceedsLimitError("Requested dataframe columns exceed column request limit")
 
-            X = self.get_X_array(obs_selector, var_selector)
+            X = self.get_X_array(obs_selector, var_selector, allow_sparse=True)
         with ServerTiming.time("where.encode"):
             col_idx = np.nonzero([] if var_selector is None else var_selector)[0]
-            fbs = encode_matrix_fbs(X, col_idx=col_idx, row_idx=None, num_bins=num_bins)
+            sparse_threshold = self.app_config.server__encoding__sparse_density_threshold
+            fbs = encode_matrix_fbs(
+                X, col_idx=col_idx, row_idx=None, num_bins=num_bins, sparse_threshold=sparse_threshold
+            )
 
         return fbs
 
-    def diffexp_topN(self, obsFilterA, obsFilterB, top_n=None):
+    def diffexp_topN(self, obsFilterA, obsFilterB, top_n=None, approximate=False):
         """
         Computes the top N differentially expressed variables between two observation sets. If mode
         is "TOP_N", then stats for the top N
@@ -324,6 +349,8 @@ class Dataset(metaclass=ABCMeta):
         :param obsFilterA: filter: dictionary with filter params for first set of observations
         :param obsFilterB: filter: dictionary with filter params for second set of observations
         :param top_n: Limit results to top N (Top var mode only)
+        :param approximate: if True, compute the statistics of a sample of each large set (see
+            diffexp_cxg.diffexp_ttest_approximate)
         :return: top N genes and corresponding stats
         """
         if Axis.VAR in obsFilterA or Axis.VAR in obsFilterB:
@@ -337,9 +364,12 @@ class Dataset(metaclass=ABCMeta):
         if top_n is None:
             top_n = self.app_config.default_dataset__diffexp__top_n
 
-        if self.app_config.exceeds_limit(
-            "diffexp_cellcount_max", np.count_nonzero(obs_mask_A) + np.count_nonzero(obs_mask_B)
-        ):
+        sample_size = self.app_config.default_dataset__diffexp__approximate_sample_size if approximate else None
+        cellcount = sum(
+            np.count_nonzero(mask) if sample_size is None else min(np.count_nonzero(mask), sample_size)
+            for mask in (obs_mask_A, obs_mask_B)
+        )
+        if self.app_config.exceeds_limit("diffexp_cellcount_max", cellcount):
             raise ExceedsLimitError("Diffexp request exceeds max cell count limit")
 
         result = self.compute_diffexp_ttest(
@@ -348,6 +378,7 @@ class Dataset(metaclass=ABCMeta):
             top_n=top_n,
             lfc_cutoff=self.app_config.default_dataset__diffexp__lfc_cutoff,
             selector_lists=False,
+            sample_size=sample_size,
         )
 
         try:
@@ -355,29 +386,129 @@ class Dataset(metaclass=ABCMeta):
         except ValueError:
             raise JSONEncodingValueError("Error encoding differential expression to JSON") from None
 
-    def diffexp_topN_from_list(self, listA: np.ndarray, listB: np.ndarray, top_n: int = None):
+    def diffexp_topN_from_list(
+        self,
+        listA: np.ndarray,
+        listB: np.ndarray,
+        top_n: int = None,
+        test: DiffExpTest = DiffExpTest.TTEST,
+        approximate: bool = False,
+    ):
         """
         Compute differential expression - same as diffexp_topN() - but specifying the
-        two cell sets as lists of obs indices (postings lists).
+        two cell sets as lists of obs indices (postings lists).  The test may be either Welch's
+        t-test or the Wilcoxon rank-sum test.  Only the t-test may be approximate.
+        """
+        result = self.prepare_diffexp_topN_from_list(listA, listB, top_n, test, approximate)()
+        try:
+            return jsonify_numpy(result)
+        except ValueError:
+            raise JSONEncodingValueError("Error encoding differential expression to JSON") from None
+
+    def prepare_diffexp_topN_from_list(
+        self,
+        listA: np.ndarray,
+        listB: np.ndarray,
+        top_n: int = None,
+        test: DiffExpTest = DiffExpTest.TTEST,
+        approximate: bool = False,
+    ):
+        """
+        Validate a diffexp_topN_from_list() request, and return a function computing its (unencoded)
+        result, which accepts an optional job - eg, to compute it in the background.  Raises FilterError
+        if either list is empty or contains an out of range obs index, and ExceedsLimitError if the
+        request exceeds the diffexp cell count limit.
         """
+        n_obs = self.get_shape()[0]
+        for obs_list in (listA, listB):
+            if len(obs_list) == 0:
+                raise FilterError("Diffexp cell sets may not be empty")
+            if np.min(obs_list) < 0 or np.max(obs_list) >= n_obs:
+                raise FilterError("obs index out of range")
         if top_n is None:
             top_n = self.app_config.default_dataset__diffexp__top_n
+        lfc_cutoff = self.app_config.default_dataset__diffexp__lfc_cutoff
 
-        result = self.compute_diffexp_ttest(
+        sample_size = None
+        if test != DiffExpTest.WILCOXON and approximate:
+            sample_size = self.app_config.default_dataset__diffexp__approximate_sample_size
+        cellcount = sum(
+            len(obs_list) if sample_size is None else min(len(obs_list), sample_size) for obs_list in (listA, listB)
+        )
+        if self.app_config.exceeds_limit("diffexp_cellcount_max", cellcount):
+            raise ExceedsLimitError("Diffexp request exceeds max cell count limit")
+
+        if test == DiffExpTest.WILCOXON:
+            return partial(
+                self.compute_diffexp_wilcoxon, listA, listB, top_n=top_n, lfc_cutoff=lfc_cutoff, selector_lists=True
+            )
+        return partial(
+            self.compute_diffexp_ttest,
             listA,
             listB,
             top_n=top_n,
-            lfc_cutoff=self.app_config.default_dataset__diffexp__lfc_cutoff,
+            lfc_cutoff=lfc_cutoff,
             selector_lists=True,
+            sample_size=sample_size,
         )
 
+    @abstractmethod
+    def compute_diffexp_ttest(self, maskA, maskB, top_n, lfc_cutoff, selector_lists=False, job=None, sample_size=None):
+        pass
+
+    @abstractmethod
+    def compute_diffexp_wilcoxon(self, maskA, maskB, top_n, lfc_cutoff, selector_lists=False, job=None):
+        pass
+
+    def diffexp_one_vs_rest_by_category(self, field: str, top_n: int = None):
+        """
+        Compute differential expression of the cells with each value of the categorical obs
+        annotation `field`, compared with all other cells.
+        """
+        columns = self.get_schema()["annotations"]["obs"]["columns"]
+        column = next((column for column in columns if column["name"] == field), None)
+        if column is None or column["type"] != "categorical":
+            raise FilterError(f"{field} is not a categorical obs annotation")
+
+        values = pd.Categorical(self.query_obs_array(field))
+        return self._diffexp_one_vs_rest(values.codes, [str(category) for category in values.categories], top_n)
+
+    def diffexp_one_vs_rest_from_lists(self, lists, top_n: int = None):
+        """
+        Compute differential expression of each of the (disjoint) lists of obs indices (postings
+        lists), compared with all other cells.
+        """
+        n_obs = self.get_shape()[0]
+        labels = np.full((n_obs,), -1, dtype=np.int32)
+        for group, obs_list in enumerate(lists):
+            obs_list = np.asarray(obs_list)
+            if len(obs_list) > 0 and (obs_list.min() < 0 or obs_list.max() >= n_obs):
+                raise FilterError(f"obs index out of range in group {group}")
+            if np.any(labels[obs_list] != -1):
+                raise FilterError(f"group {group} overlaps a previous group")
+            labels[obs_list] = group
+        return self._diffexp_one_vs_rest(labels, list(range(len(lists))), top_n)
+
+    def _diffexp_one_vs_rest(self, labels, groups, top_n):
+        if top_n is None:
+            top_n = self.app_config.default_dataset__diffexp__top_n
+        if self.app_config.exceeds_limit("diffexp_batch_groups_max", len(groups)):
+            raise ExceedsLimitError("Diffexp request exceeds max group count limit")
+        if self.app_config.exceeds_limit("diffexp_cellcount_max", self.get_shape()[0]):
+            raise ExceedsLimitError("Diffexp request exceeds max cell count limit")
+
+        results = self.compute_diffexp_ttest_one_vs_rest(
+            labels, len(groups), top_n=top_n, lfc_cutoff=self.app_config.default_dataset__diffexp__lfc_cutoff
+        )
+        response = [dict(group=group, **result) for group, result in zip(groups, results) if result is not None]
+
         try:
-            return jsonify_numpy(result)
+            return jsonify_numpy(response)
         except ValueError:
             raise JSONEncodingValueError("Error encoding differential expression to JSON") from None
 
     @abstractmethod
-    def compute_diffexp_ttest(self, maskA, maskB, top_n, lfc_cutoff, selector_lists=False):
+    def compute_diffexp_ttest_one_vs_rest(self, labels, n_groups, top_n, lfc_cutoff):
         pass
 
     @staticmethod
@@ -472,8 +603,8 @@ class Dataset(metaclass=ABCMeta):
             if var_selector is None or np.count_nonzero(var_selector) == 0:
                 mean = np.zeros((self.get_shape()[0], 1), dtype=np.float32)
             else:
-                X = self.get_X_array(obs_selector, var_selector)
-                mean = X.mean(axis=1, keepdims=True)
+                X = self.get_X_array(obs_selector, var_selector, allow_sparse=True)
+                mean = np.asarray(X.mean(axis=1)) if sparse.issparse(X) else X.mean(axis=1, keepdims=True)
         with ServerTiming.time("summarize.encode"):
             col_idx = pd.Index([query_hash])
             fbs = encode_matrix_fbs(mean, col_idx=col_idx, row_idx=None, num_bins=num_bins)
@@ -4,36 +4,102 @@ from typing import Union
 
 import requests
 from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from server.common.config.app_config import AppConfig
 from server.common.errors import DatasetAccessError, DatasetMetadataError, TombstoneError
 from server.common.utils.utils import path_join
 
 
+def create_data_portal_session() -> requests.Session:
+    """
+    Session used for all data portal requests, so that connections are pooled and re-used
+    rather than established per request.  Idempotent requests are retried on connection errors
+    and gateway errors.
+    """
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.1, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+data_portal_session = create_data_portal_session()
+
+
+class DataPortalUnavailableError(Exception):
+    """The data portal could not be reached, or returned a server error"""
+
+
 def log_error_response_from_data_portal(res: requests.Response) -> None:
-    logging.ERROR(
+    logging.error(
         "Error response from Data Portal.",
         extra=dict(type="PORTAL", response=dict(url=res.url, headers=res.headers, status_code=res.status_code)),
     )
 
 
-def request_dataset_metadata_from_data_portal(data_portal_api_base: str, explorer_url: str):
+def get_data_portal_cached(key, loader, app_config: AppConfig):
+    """
+    Return the result of a data portal request from the server's data portal cache, calling loader(key)
+    on a cache miss.  A loader returns None for "not found", which is cached for a shorter time.
+    """
+    return current_app.data_portal_cache.get(
+        key,
+        loader,
+        ttl=lambda value: (
+            app_config.server__data_locator__cache__negative_ttl
+            if value is None
+            else app_config.server__data_locator__cache__ttl
+        ),
+    )
+
+
+def request_dataset_metadata_from_data_portal(data_portal_api_base: str, explorer_url: str, timeout: float = None):
     """
     Check the data portal metadata api for datasets stored under the given url_path
-    If present return dataset metadata object else return None
+    If present return dataset metadata object else return None.
+    Raise DataPortalUnavailableError if the data portal could not answer.
     """
     headers = {"Content-Type": "application/json", "Accept": "application/json"}
     try:
-        res = requests.get(url=f"{data_portal_api_base}/datasets/meta?url={explorer_url}/", headers=headers)
+        res = data_portal_session.get(
+            url=f"{data_portal_api_base}/datasets/meta?url={explorer_url}/", headers=headers, timeout=timeout
+        )
+    except Exception as e:
+        raise DataPortalUnavailableError(str(e)) from e
+
+    if res.status_code == 200:
+        dataset_identifiers = json.loads(res.content)
+        return dataset_identifiers
+
+    log_error_response_from_data_portal(res)
+    if res.status_code >= 500:
+        raise DataPortalUnavailableError(f"Data Portal returned {res.status_code}")
+    return None
 
-        if res.status_code == 200:
-            dataset_identifiers = json.loads(res.content)
-            return dataset_identifiers
-        else:
-            log_error_response_from_data_portal(res)
-            return None
-    except Exception:
-        return None
+
+def request_collection_from_data_portal(
+    data_portal_api_base: str, collection_id: str, collection_visibility: str, timeout: float = None
+):
+    """
+    Return the collection from the data portal collections api, or None if it does not exist.
+    Raise DataPortalUnavailableError if the data portal could not answer.
+    """
+    suffix = "?visibility=PRIVATE" if collection_visibility == "PRIVATE" else ""
+    try:
+        res = data_portal_session.get(f"{data_portal_api_base}/collections/{collection_id}{suffix}", timeout=timeout)
+    except Exception as e:
+        raise DataPortalUnavailableError(str(e)) from e
+
+    if res.ok:
+        return res.json()
+
+    log_error_response_from_data_portal(res)
+    if res.status_code >= 500:
+        raise DataPortalUnavailableError(f"Data Portal returned {res.status_code}")
+    return None
 
 
 def infer_dataset_s3_uri(app_config: AppConfig, dataset_root: str, dataset_id: str) -> Union[str, None]:
@@ -74,9 +140,21 @@ def get_dataset_metadata(dataset_root: str, dataset_id: str, app_config: AppConf
     explorer_url_path = f"{app_config.server__app__web_base_url}/{dataset_root}/{dataset_id}"
 
     if app_config.server__data_locator__api_base:
-        dataset_metadata = request_dataset_metadata_from_data_portal(
-            data_portal_api_base=app_config.server__data_locator__api_base, explorer_url=explorer_url_path
-        )
+        # Data portal lookups are cached, including "not found" and tombstoned results.  If the data portal
+        # is unavailable, an expired entry is used, or failing that the location is inferred (and not cached).
+        try:
+            dataset_metadata = get_data_portal_cached(
+                ("datasets/meta", explorer_url_path),
+                lambda _: request_dataset_metadata_from_data_portal(
+                    data_portal_api_base=app_config.server__data_locator__api_base,
+                    explorer_url=explorer_url_path,
+                    timeout=app_config.server__data_locator__timeout,
+                ),
+                app_config,
+            )
+        except DataPortalUnavailableError:
+            current_app.logger.log(logging.WARNING, f"Data Portal unavailable: {explorer_url_path}", exc_info=True)
+            dataset_metadata = None
 
         if dataset_metadata:
             if dataset_metadata["tombstoned"]:
@@ -121,12 +199,18 @@ def get_dataset_and_collection_metadata(dataset_root: str, dataset_id: str, app_
         dataset_id = base_metadata["dataset_id"]
         collection_visibility = base_metadata["collection_visibility"]
 
-        suffix = "?visibility=PRIVATE" if collection_visibility == "PRIVATE" else ""
-
-        res = requests.get(f"{data_locator_base_url}/collections/{collection_id}{suffix}")
-        if not res.ok:
-            log_error_response_from_data_portal(res)
-        res_json = res.json()
+        res_json = get_data_portal_cached(
+            ("collections", collection_id, collection_visibility),
+            lambda _: request_collection_from_data_portal(
+                data_locator_base_url,
+                collection_id,
+                collection_visibility,
+                timeout=app_config.server__data_locator__timeout,
+            ),
+            app_config,
+        )
+        if res_json is None:
+            raise DatasetMetadataError(f"Collection {collection_id} not found")
         canonical_collection_id = res_json["id"]
         web_base_url = app_config.server__app__web_base_url
         metadata = {
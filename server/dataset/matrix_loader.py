@@ -24,8 +24,18 @@ class DataLoader(object):
             raise DatasetAccessError("Missing dataset config", HTTPStatus.NOT_FOUND)
         return dataset_config
 
+    def __is_trusted(self):
+        """True if the dataset is in a dataroot configured as trusted, i.e. containing immutable datasets"""
+        if self.app_config is None:
+            return False
+        location = self.location.uri_or_path
+        for dataroot_dict in self.app_config.server__multi_dataset__dataroots.values():
+            if dataroot_dict.get("trusted") and location.startswith(dataroot_dict["dataroot"].rstrip("/") + "/"):
+                return True
+        return False
+
     def pre_load_validation(self):
-        self.matrix_type.pre_load_validation(self.location)
+        self.matrix_type.pre_load_validation(self.location, trusted=self.__is_trusted())
 
     def file_size(self):
         return self.matrix_type.file_size(self.location)
@@ -49,6 +49,10 @@ server:
     #
     # In this case, datasets can be accessed from <server>/set1/<datasetname> or
     # <server>/set2/subdir/<datasetname>.
+    #
+    # A dataroot may also set "trusted: true" if the datasets it contains are immutable (e.g. published
+    # datasets).  The structure of a dataset in a trusted dataroot is validated when it is first opened,
+    # and is not re-checked for modification when the dataset is re-opened.
 
     dataroot: null
 
@@ -66,6 +70,17 @@ server:
     #   if false/null, then do not set.
     #   if a string, then use that value (e.g. us-east-1).
     s3_region_name: true
+    # timeout, in seconds, of requests to the data portal api.
+    timeout: 10
+    # Data portal responses are cached.  All times are in seconds.
+    #   ttl: time-to-live of dataset and collection metadata.
+    #   negative_ttl: time-to-live of "not found" responses.
+    #   stale_ttl: an expired entry may be served for this long after expiry if the data portal is unavailable.
+    cache:
+      max_entries: 10000
+      ttl: 300
+      negative_ttl: 30
+      stale_ttl: 3600
 
   gene_info:
     api_base: null
@@ -79,9 +94,93 @@ server:
         sm.tile_cache_size:  8589934592  # 8GiB
         py.init_buffer_bytes: 536870912  # 512MiB
 
+      # Opened datasets are cached, and shared by all requests handled by a server process.
+      # The least recently used datasets are closed when either limit is exceeded.
+      #   max_datasets: maximum number of datasets held open.
+      #   max_open_arrays: maximum number of TileDB array handles held open, across all cached datasets.
+      dataset_cache:
+        max_datasets: 32
+        max_open_arrays: 512
+
+      # Size, in bytes, of the cache of decoded X columns (genes), shared by all datasets.  Set to 0 to disable.
+      X_column_cache_bytes: 536870912  # 512MiB
+
+      # Size, in bytes, of the cache of differential expression results and per-cell-set statistics,
+      # shared by all datasets.  Set to 0 to disable.
+      diffexp_cache_bytes: 134217728  # 128MiB
+
+      # Maximum size, in bytes, of the memory used to read X rows and compute differential expression
+      # statistics for one cell set of a dense X, including read buffers and temporaries.  Larger selections
+      # are streamed in chunks.  null for no limit.
+      diffexp_memory_limit: 1073741824  # 1GiB
+
+      # If true, the differential expression statistics of float32 datasets are accumulated in float32,
+      # with compensated (Kahan) summation, rather than in float64.
+      diffexp_float32: false
+
+      # Number of native threads, shared by all requests, on which X is read and differential expression
+      # statistics are computed concurrently.  null for min(8, the number of CPUs available to the process).
+      compute_threads: null
+
   limits:
     column_request_max: 32
     diffexp_cellcount_max: null
+    diffexp_batch_groups_max: 100
+
+  # Hot datasets, which are opened and prefetched in the background when the server starts, so that the
+  # first request for them does not pay the full cost of opening the dataset.  The layout/obs (default
+  # embedding) and annotations/var (var index) responses of each are loaded into the response cache.
+  #   datasets: list of dataset locations (path or S3 URI of the CXG).
+  #   file: location (path or S3 URI) of a file listing dataset locations, one per line.
+  #   genes: list of genes (var index values), eg, common markers, whose data/var (expression) responses
+  #      are also loaded into the response cache, for each dataset which contains them.
+  warmup:
+    datasets: []
+    file: null
+    genes: []
+
+  # Background differential expression jobs, submitted to /diffexp/jobs, for computations too long to
+  # run within a request.  Jobs are held in the memory of the server process which accepted them, and
+  # requests for a job which reach another process are refused with a 421 (Misdirected Request).
+  #   max_workers: number of jobs computed concurrently.
+  #   max_jobs: maximum number of pending and running jobs.  Further submissions are rejected.
+  #   result_ttl: seconds for which the result of a finished job is retained.
+  diffexp_jobs:
+    max_workers: 2
+    max_jobs: 16
+    result_ttl: 300
+
+  # Cache of encoded responses of the endpoints which are immutable for a dataset (layout/obs,
+  # annotations/var, built-in annotations/obs columns and data/var).
+  #   max_bytes: size, in bytes, of the in-process cache.  Set to 0 to disable.
+  #   disk_dir: optional directory, shared by all server processes, in which responses are also cached.
+  #     The directory survives restarts.  Responses are cached per dataset location and last modification
+  #     time, so those of a dataset which is replaced are not served.
+  #   disk_max_bytes: size, in bytes, of the disk cache.
+  response_cache:
+    max_bytes: 268435456  # 256MiB
+    disk_dir: null
+    disk_max_bytes: 4294967296  # 4GiB
+
+  # Encoding of the FBS matrices returned by the data endpoints.
+  #   sparse_density_threshold: expression columns with a fraction of non-zero values below this threshold
+  #     are sent as sparse (indices, values) columns - at a density of 0.1, a fifth of the size of a dense one.
+  #     null disables sparse encoding, eg, for clients unable to decode sparse columns.
+  #   compression: content encoding of the binary (FBS) responses, negotiated with the client's
+  #     Accept-Encoding.  The compressed responses of the cached endpoints are themselves cached.
+  #     encodings: content codings offered, in order of preference.  zstd and br are offered only if the
+  #       zstandard and brotli modules are installed.  An empty list disables compression.
+  #     min_bytes: responses smaller than this are sent uncompressed.
+  #     levels: compression level of each coding, overriding the defaults (zstd: 3, br: 4, gzip: 6).
+  #     endpoint_levels: levels by endpoint, eg, {layout/obs: {zstd: 19, br: 9}}.  Endpoints are
+  #       annotations/obs, annotations/var, data/var, layout/obs and summarize/var.
+  encoding:
+    sparse_density_threshold: 0.1
+    compression:
+      encodings: [zstd, br, gzip]
+      min_bytes: 1024
+      levels: {}
+      endpoint_levels: {}
 
 
 default_dataset:
@@ -108,6 +207,12 @@ default_dataset:
     top_n: 10
     count: 15
 
+    # Approximate differential expression, requested with `?approximate=true`, computes the t-test on a
+    # stratified random sample of at most approximate_sample_size cells of each cell set.  The sample of
+    # a given cell set is determined by approximate_seed.
+    approximate_sample_size: 20000
+    approximate_seed: 0
+
   X_approximate_distribution: normal # currently fixed config
 """
 
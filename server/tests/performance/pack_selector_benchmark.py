@@ -0,0 +1,71 @@
+import argparse
+import sys
+import timeit
+from functools import partial
+
+import numpy as np
+
+from server.dataset.cxg_util import choose_selector_from_indices, pack_selector_from_indices
+
+
+def pack_selector_loop(selector):
+    """the original, per-index, implementation of pack_selector_from_indices - for comparison"""
+    if len(selector) == 0:
+        return None
+
+    result = []
+    current = slice(selector[0], selector[0])
+    for sel in selector[1:]:
+        if sel == current.stop + 1:
+            current = slice(current.start, sel)
+        else:
+            result.append(current if current.start != current.stop else current.start)
+            current = slice(sel, sel)
+
+    if len(result) == 0 or result[-1] != current:
+        result.append(current if current.start != current.stop else current.start)
+
+    return result
+
+
+def make_masks(n_obs, rng):
+    """sparse, dense and clustered selections of n_obs cells"""
+    clustered = np.zeros(n_obs, dtype=bool)
+    for start in rng.integers(0, n_obs, size=20):
+        clustered[start : start + n_obs // 100] = True
+    return {
+        "sparse (1%)": rng.random(n_obs) < 0.01,
+        "dense (50%)": rng.random(n_obs) < 0.5,
+        "clustered": clustered,
+        "all": np.ones(n_obs, dtype=bool),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser("A command to benchmark selector packing")
+    parser.add_argument("-n", "--n-obs", default=2_000_000, type=int, help="number of obs in the mask")
+    parser.add_argument("-t", "--trials", default=3, type=int, help="number of trials")
+    parser.add_argument("--no-loop", default=False, action="store_true", help="skip the per-index implementation")
+    parser.add_argument("--seed", default=1, type=int, help="set the random seed")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(seed=args.seed)
+    for name, mask in make_masks(args.n_obs, rng).items():
+        indices = mask.nonzero()[0]
+        items, covering = choose_selector_from_indices(indices)
+        strategy = "covering range" if covering else f"{len(items)} ranges"
+        print(f"{name}: {len(indices)} selected, {strategy}")
+
+        timings = {
+            "pack_selector_from_indices": partial(pack_selector_from_indices, indices),
+            "choose_selector_from_indices": partial(choose_selector_from_indices, indices),
+        }
+        if not args.no_loop:
+            timings["loop (original)"] = partial(pack_selector_loop, indices)
+        for label, fn in timings.items():
+            t = min(timeit.repeat(fn, number=1, repeat=args.trials))
+            print(f"    {label:30} {t * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
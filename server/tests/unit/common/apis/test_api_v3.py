@@ -1,19 +1,24 @@
+import gzip
 import hashlib
 import json
 import os
 import time
 import unittest
+from datetime import datetime
 from http import HTTPStatus
 from unittest.mock import patch
 from urllib.parse import quote
 import os
 
 
+import brotli
 import numpy as np
 import requests
+import zstandard
 
 from server.common.config.app_config import AppConfig
-from server.common.diffexpdu import DiffExArguments
+from server.common.diffexpdu import DiffExArguments, DiffExBatchArguments
+from server.dataset.cxg_dataset import CxgDataset
 from server.tests import FIXTURES_ROOT, FIXTURES_ROOT_UNS, decode_fbs
 from server.tests.fixtures.fixtures import pbmc3k_colors
 from server.tests.unit import BaseTest as _BaseTest
@@ -149,6 +154,64 @@ class EndPoints(BaseTest):
                 self.assertIsNone(df["row_idx"])
                 self.assertEqual(len(df["columns"]), df["n_cols"])
 
+    def test_response_cache(self):
+        header = {"Accept": "application/octet-stream"}
+        for endpoint in ["layout/obs?layout-name=umap", "annotations/var", "data/var?var:name_0=F5&nbins=10"]:
+            with self.subTest(endpoint=endpoint):
+                url = f"{self.TEST_URL_BASE}{endpoint}"
+                first = self.client.get(url, headers=header)
+                hits = self.app.response_cache.stats()["hits"]
+                second = self.client.get(url, headers=header)
+                self.assertEqual(second.status_code, HTTPStatus.OK)
+                self.assertEqual(second.data, first.data)
+                self.assertEqual(self.app.response_cache.stats()["hits"], hits + 1)
+
+    def test_response_cache_dataset_replaced(self):
+        header = {"Accept": "application/octet-stream"}
+        url = f"{self.TEST_URL_BASE}annotations/var"
+        expected = self.client.get(url, headers=header).data
+        misses = self.app.response_cache.stats()["misses"]
+
+        # responses are cached per dataset modification time, so a replaced dataset is not served stale responses
+        with patch.object(CxgDataset, "get_last_mod_time", return_value=datetime(2000, 1, 1)):
+            result = self.client.get(url, headers=header)
+        self.assertEqual(result.data, expected)
+        self.assertEqual(self.app.response_cache.stats()["misses"], misses + 1)
+
+        # without a modification time, responses are not cached
+        with patch.object(CxgDataset, "get_last_mod_time", return_value=None):
+            stats = self.app.response_cache.stats()
+            for _ in range(2):
+                result = self.client.get(url, headers=header)
+                self.assertEqual(result.data, expected)
+            self.assertEqual(self.app.response_cache.stats(), stats)
+
+    def test_response_compression(self):
+        for endpoint in ["layout/obs?layout-name=umap", "data/var?var:name_0=F5"]:
+            with self.subTest(endpoint=endpoint):
+                url = f"{self.TEST_URL_BASE}{endpoint}"
+                raw = self.client.get(url, headers={"Accept": "application/octet-stream"})
+                self.assertNotIn("Content-Encoding", raw.headers)
+                self.assertIn("Accept-Encoding", raw.headers["Vary"])
+
+                for _ in range(2):  # compressed, then served from the response cache
+                    result = self.client.get(
+                        url, headers={"Accept": "application/octet-stream", "Accept-Encoding": "gzip, deflate"}
+                    )
+                    self.assertEqual(result.status_code, HTTPStatus.OK)
+                    self.assertEqual(result.headers["Content-Encoding"], "gzip")
+                    self.assertEqual(gzip.decompress(result.data), raw.data)
+
+                # zstd and br are preferred, when accepted by the client
+                decompress = {"zstd": zstandard.ZstdDecompressor().decompress, "br": brotli.decompress}
+                for accept_encoding, content_encoding in [("gzip, deflate, br, zstd", "zstd"), ("gzip, br", "br")]:
+                    result = self.client.get(
+                        url, headers={"Accept": "application/octet-stream", "Accept-Encoding": accept_encoding}
+                    )
+                    self.assertEqual(result.status_code, HTTPStatus.OK)
+                    self.assertEqual(result.headers["Content-Encoding"], content_encoding)
+                    self.assertEqual(decompress[content_encoding](result.data), raw.data)
+
     def test_bad_filter(self):
         endpoint = "data/var"
         for url_base in [self.TEST_URL_BASE, self.TEST_URL_BASE_SPARSE]:
@@ -359,6 +422,49 @@ class EndPoints(BaseTest):
                     ],
                 )
 
+    def test_diffex2_wilcoxon(self):
+        endpoint = "diffexp/obs2"
+        for url_base in [self.TEST_URL_BASE, self.TEST_URL_BASE_SPARSE]:
+            with self.subTest(url_base=url_base):
+                url = f"{url_base}{endpoint}"
+                de_args = DiffExArguments(
+                    mode=DiffExArguments.DiffExMode.WilcoxonTopN,
+                    params=DiffExArguments.TopNParams(N=15),
+                    set1=np.arange(0, 500, dtype=np.uint32),
+                    set2=np.arange(500, 1000, dtype=np.uint32),
+                )
+                result = self.client.post(
+                    url, headers={"Content-Type": "application/octet-stream"}, data=de_args.pack()
+                )
+                self.assertEqual(result.status_code, HTTPStatus.OK)
+                result_data = json.loads(result.data)
+                self.assertEqual(len(result_data["positive"]), 15)
+                self.assertEqual(len(result_data["negative"]), 15)
+                for _, _, pval, pval_adj in result_data["positive"]:
+                    self.assertTrue(0 <= pval <= pval_adj <= 1)
+
+    def test_diffex2_approximate(self):
+        endpoint = "diffexp/obs2?approximate=true"
+        for url_base in [self.TEST_URL_BASE, self.TEST_URL_BASE_SPARSE]:
+            with self.subTest(url_base=url_base):
+                url = f"{url_base}{endpoint}"
+                de_args = DiffExArguments(
+                    mode=DiffExArguments.DiffExMode.TopN,
+                    params=DiffExArguments.TopNParams(N=10),
+                    set1=np.arange(0, 500, dtype=np.uint32),
+                    set2=np.arange(500, 1000, dtype=np.uint32),
+                )
+                result = self.client.post(
+                    url, headers={"Content-Type": "application/octet-stream"}, data=de_args.pack()
+                )
+                self.assertEqual(result.status_code, HTTPStatus.OK)
+                result_data = json.loads(result.data)
+                self.assertEqual(len(result_data["positive"]), 10)
+                # the sets are smaller than the default sample size, so are not sampled
+                self.assertEqual(result_data["set_sizes"], [500, 500])
+                self.assertEqual(result_data["sample_sizes"], [500, 500])
+                self.assertEqual(result_data["stability"], 1.0)
+
     def test_diffex2_error_conditions(self):
         endpoint = "diffexp/obs2"
         for url_base in [self.TEST_URL_BASE, self.TEST_URL_BASE_SPARSE]:
@@ -391,6 +497,155 @@ class EndPoints(BaseTest):
                 )
                 self.assertEqual(result.status_code, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
 
+    def test_diffex_batch(self):
+        endpoint = "diffexp/batch"
+        for url_base in [self.TEST_URL_BASE, self.TEST_URL_BASE_SPARSE]:
+            with self.subTest(url_base=url_base):
+                url = f"{url_base}{endpoint}"
+
+                # one-vs-rest for each value of a categorical annotation
+                result = self.client.post(url, json={"field": "louvain", "count": 5})
+                self.assertEqual(result.status_code, HTTPStatus.OK)
+                self.assertEqual(result.headers["Content-Type"], "application/json")
+                result_data = json.loads(result.data)
+                self.assertIn("NK cells", [group["group"] for group in result_data])
+                for group in result_data:
+                    self.assertEqual(len(group["positive"]), 5)
+                    self.assertEqual(len(group["negative"]), 5)
+
+                # one-vs-rest for postings lists, each equivalent to a pairwise diffexp against the rest
+                sets = [np.arange(0, 500, dtype=np.uint32), np.arange(500, 1000, dtype=np.uint32)]
+                de_args = DiffExBatchArguments(
+                    mode=DiffExArguments.DiffExMode.OneVsRest, params=DiffExArguments.TopNParams(N=10), sets=sets
+                )
+                result = self.client.post(
+                    url, headers={"Content-Type": "application/octet-stream"}, data=de_args.pack()
+                )
+                self.assertEqual(result.status_code, HTTPStatus.OK)
+                result_data = json.loads(result.data)
+                self.assertEqual([group["group"] for group in result_data], [0, 1])
+
+                rest = np.arange(500, 2638, dtype=np.uint32)
+                de_args = DiffExArguments(
+                    mode=DiffExArguments.DiffExMode.TopN,
+                    params=DiffExArguments.TopNParams(N=10),
+                    set1=sets[0],
+                    set2=rest,
+                )
+                pairwise = self.client.post(
+                    f"{url_base}diffexp/obs2",
+                    headers={"Content-Type": "application/octet-stream"},
+                    data=de_args.pack(),
+                )
+                pairwise_data = json.loads(pairwise.data)
+                self.assertEqual({p[0] for p in result_data[0]["positive"]}, {p[0] for p in pairwise_data["positive"]})
+
+                # errors
+                result = self.client.post(url, json={"field": "n_genes"})
+                self.assertEqual(result.status_code, HTTPStatus.BAD_REQUEST)
+                result = self.client.post(url, json={"field": "louvain", "count": "ten"})
+                self.assertEqual(result.status_code, HTTPStatus.BAD_REQUEST)
+                result = self.client.post(url, headers={"Content-Type": "application/octet-stream"}, data=bytes(20))
+                self.assertEqual(result.status_code, HTTPStatus.BAD_REQUEST)
+                result = self.client.post(url, data=de_args.pack())
+                self.assertEqual(result.status_code, HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+
+    def test_diffex_batch_bad_sets(self):
+        endpoint = "diffexp/batch"
+        for url_base in [self.TEST_URL_BASE, self.TEST_URL_BASE_SPARSE]:
+            with self.subTest(url_base=url_base):
+                url = f"{url_base}{endpoint}"
+                for sets in [
+                    # out of range obs index
+                    [np.arange(0, 500, dtype=np.uint32), np.array([2637, 2638], dtype=np.uint32)],
+                    # overlapping sets
+                    [np.arange(0, 500, dtype=np.uint32), np.arange(499, 1000, dtype=np.uint32)],
+                ]:
+                    de_args = DiffExBatchArguments(
+                        mode=DiffExArguments.DiffExMode.OneVsRest, params=DiffExArguments.TopNParams(N=10), sets=sets
+                    )
+                    result = self.client.post(
+                        url, headers={"Content-Type": "application/octet-stream"}, data=de_args.pack()
+                    )
+                    self.assertEqual(result.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_diffex_jobs(self):
+        endpoint = "diffexp/jobs"
+        for url_base in [self.TEST_URL_BASE, self.TEST_URL_BASE_SPARSE]:
+            with self.subTest(url_base=url_base):
+                url = f"{url_base}{endpoint}"
+                de_args = DiffExArguments(
+                    mode=DiffExArguments.DiffExMode.TopN,
+                    params=DiffExArguments.TopNParams(N=10),
+                    set1=np.arange(0, 500, dtype=np.uint32),
+                    set2=np.arange(500, 1000, dtype=np.uint32),
+                )
+                result = self.client.post(
+                    url, headers={"Content-Type": "application/octet-stream"}, data=de_args.pack()
+                )
+                self.assertEqual(result.status_code, HTTPStatus.ACCEPTED)
+                job_id = json.loads(result.data)["id"]
+
+                # poll until done - the result is the same as that of the synchronous API
+                for _ in range(100):
+                    result = self.client.get(f"{url}/{job_id}")
+                    self.assertEqual(result.status_code, HTTPStatus.OK)
+                    job = json.loads(result.data)
+                    if job["status"] not in ("pending", "running"):
+                        break
+                    time.sleep(0.1)
+                self.assertEqual(job["status"], "done")
+                self.assertEqual(job["progress"]["done"], job["progress"]["total"])
+                expected = self.client.post(
+                    f"{url_base}diffexp/obs2", headers={"Content-Type": "application/octet-stream"}, data=de_args.pack()
+                )
+                self.assertEqual(job["result"], json.loads(expected.data))
+
+                # cancelling a finished job has no effect
+                result = self.client.delete(f"{url}/{job_id}")
+                self.assertEqual(result.status_code, HTTPStatus.OK)
+                self.assertEqual(json.loads(result.data)["status"], "done")
+
+                # unknown job, or a job of another dataset
+                result = self.client.get(f"{url}/{'0' * 32}")
+                self.assertEqual(result.status_code, HTTPStatus.NOT_FOUND)
+                result = self.client.get(f"{url}/{job_id.split('-')[0]}-{'0' * 32}")
+                self.assertEqual(result.status_code, HTTPStatus.NOT_FOUND)
+                other_url_base = self.TEST_URL_BASE_SPARSE if url_base == self.TEST_URL_BASE else self.TEST_URL_BASE
+                result = self.client.get(f"{other_url_base}{endpoint}/{job_id}")
+                self.assertEqual(result.status_code, HTTPStatus.NOT_FOUND)
+
+                # errors
+                result = self.client.post(url, data=de_args.pack())
+                self.assertEqual(result.status_code, HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+                result = self.client.post(url, headers={"Content-Type": "application/octet-stream"}, data=bytes(20))
+                self.assertEqual(result.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_diffex_job_of_another_process(self):
+        # jobs are only known to the server process which accepted them
+        url = f"{self.TEST_URL_BASE}diffexp/jobs/{'0' * 12}-{'0' * 32}"
+        for result in [self.client.get(url), self.client.delete(url)]:
+            self.assertEqual(result.status_code, HTTPStatus.MISDIRECTED_REQUEST)
+            self.assertIn("another server process", json.loads(result.data)["message"])
+
+    def test_diffex_bad_sets(self):
+        # bad requests are refused by both the synchronous and background APIs - the latter when submitted
+        for url_base in [self.TEST_URL_BASE, self.TEST_URL_BASE_SPARSE]:
+            for endpoint in ["diffexp/obs2", "diffexp/jobs"]:
+                with self.subTest(url_base=url_base, endpoint=endpoint):
+                    url = f"{url_base}{endpoint}"
+                    # out of range obs index
+                    de_args = DiffExArguments(
+                        mode=DiffExArguments.DiffExMode.TopN,
+                        params=DiffExArguments.TopNParams(N=10),
+                        set1=np.arange(0, 500, dtype=np.uint32),
+                        set2=np.array([2637, 2638], dtype=np.uint32),
+                    )
+                    result = self.client.post(
+                        url, headers={"Content-Type": "application/octet-stream"}, data=de_args.pack()
+                    )
+                    self.assertEqual(result.status_code, HTTPStatus.BAD_REQUEST)
+
     def test_get_annotations_var_fbs(self):
         endpoint = "annotations/var"
         for url_base in [self.TEST_URL_BASE, self.TEST_URL_BASE_SPARSE]:
@@ -905,8 +1160,11 @@ class TestDatasetMetadata(BaseTest):
         cls.app.app_config.server__app__testing = True
         cls.client = cls.app.test_client()
 
+    def setUp(self):
+        self.app.data_portal_cache.clear()
+
     @patch("server.dataset.dataset_metadata.request_dataset_metadata_from_data_portal")
-    @patch("server.dataset.dataset_metadata.requests.get")
+    @patch("server.dataset.dataset_metadata.data_portal_session.get")
     def test_dataset_metadata_api_called_for_public_collection(self, mock_get, mock_dp):
         self.TEST_DATASET_URL_BASE = "/e/pbmc3k_v0_public.cxg"
         self.TEST_URL_BASE = f"{self.TEST_DATASET_URL_BASE}/api/v0.3/"
@@ -957,7 +1215,7 @@ class TestDatasetMetadata(BaseTest):
         self.assertEqual(response_obj["collection_datasets"], response_body["datasets"])
 
     @patch("server.dataset.dataset_metadata.request_dataset_metadata_from_data_portal")
-    @patch("server.dataset.dataset_metadata.requests.get")
+    @patch("server.dataset.dataset_metadata.data_portal_session.get")
     def test_dataset_metadata_api_called_for_private_collection(self, mock_get, mock_dp):
         self.TEST_DATASET_URL_BASE = "/e/pbmc3k_v0_private.cxg"
         self.TEST_URL_BASE = f"{self.TEST_DATASET_URL_BASE}/api/v0.3/"
@@ -1025,7 +1283,7 @@ class TestDatasetMetadata(BaseTest):
         self.assertEqual(result.status_code, HTTPStatus.NOT_FOUND)
 
     @patch("server.dataset.dataset_metadata.request_dataset_metadata_from_data_portal")
-    @patch("server.dataset.dataset_metadata.requests.get")
+    @patch("server.dataset.dataset_metadata.data_portal_session.get")
     def test_dataset_metadata_api_fails_gracefully_on_connection_failure(self, mock_get, mock_dp):
         self.TEST_DATASET_URL_BASE = "/e/pbmc3k_v0.cxg"
         self.TEST_URL_BASE = f"{self.TEST_DATASET_URL_BASE}/api/v0.3/"
@@ -1094,7 +1352,10 @@ class TestS3URI(BaseTest):
 
         cls.url = f"{test_url_base}{endpoint}"
 
-    @patch("server.dataset.dataset_metadata.requests.get")
+    def setUp(self):
+        self.app.data_portal_cache.clear()
+
+    @patch("server.dataset.dataset_metadata.data_portal_session.get")
     def test_get_S3_URI_in_data_portal(self, mock_get):
         test_s3_uris = [
             (f"{FIXTURES_ROOT}/pbmc3k.cxg", f"{FIXTURES_ROOT}/pbmc3k.cxg"),
@@ -1109,6 +1370,7 @@ class TestS3URI(BaseTest):
         }
         for actual, expected in test_s3_uris:
             with self.subTest(actual):
+                self.app.data_portal_cache.clear()
                 test_response_body["s3_uri"] = actual
                 response_body = json.dumps(test_response_body)
                 mock_get.return_value = MockResponse(body=response_body, status_code=200)
@@ -1117,14 +1379,42 @@ class TestS3URI(BaseTest):
                 self.assertEqual(result.status_code, HTTPStatus.OK)
                 self.assertEqual(json.loads(result.data), expected)
 
-    @patch("server.dataset.dataset_metadata.requests.get")
+    @patch("server.dataset.dataset_metadata.data_portal_session.get")
     def test_get_S3_URI_not_in_data_portal(self, mock_get):
         mock_get.return_value = MockResponse(body="", status_code=404)
         result = self.client.get(self.url)
         self.assertEqual(result.status_code, HTTPStatus.OK)
         self.assertIsNotNone(json.loads(result.data))
 
-    @patch("server.dataset.dataset_metadata.requests.get")
+    @patch("server.dataset.dataset_metadata.data_portal_session.get")
+    def test_data_portal_responses_are_cached(self, mock_get):
+        found = json.dumps({"s3_uri": f"{FIXTURES_ROOT}/pbmc3k.cxg", "tombstoned": False})
+        for status_code, body in [(200, found), (404, "")]:
+            with self.subTest(status_code):
+                self.app.data_portal_cache.clear()
+                mock_get.reset_mock()
+                mock_get.return_value = MockResponse(body=body, status_code=status_code)
+                for _ in range(3):
+                    result = self.client.get(self.url)
+                    self.assertEqual(result.status_code, HTTPStatus.OK)
+                self.assertEqual(mock_get.call_count, 1)
+
+    @patch("server.dataset.dataset_metadata.data_portal_session.get")
+    def test_data_portal_unavailable(self, mock_get):
+        mock_get.return_value = MockResponse(body="", status_code=503)
+        result = self.client.get(self.url)
+        self.assertEqual(result.status_code, HTTPStatus.OK)
+        self.assertIsNotNone(json.loads(result.data))
+
+        # errors are not cached
+        mock_get.return_value = MockResponse(
+            body=json.dumps({"s3_uri": f"{FIXTURES_ROOT}/pbmc3k.cxg", "tombstoned": False}), status_code=200
+        )
+        result = self.client.get(self.url)
+        self.assertEqual(json.loads(result.data), f"{FIXTURES_ROOT}/pbmc3k.cxg")
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch("server.dataset.dataset_metadata.data_portal_session.get")
     def test_tombstoned_datasets_redirect_to_data_portal(self, mock_get):
         response_body = json.dumps(
             {
@@ -1184,6 +1474,8 @@ class TestDeployedVersion(BaseTest):
 
 class MockResponse:
     def __init__(self, body, status_code, text="monocyte", ok=True):
+        self.url = None
+        self.headers = {}
         self.text = text
         self.content = body
         self.status_code = status_code
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from http import HTTPStatus
+from urllib.parse import quote
+
+from server.app.app import Server
+from server.app.warmup import _default_embedding, get_warmup_datasets
+from server.tests import FIXTURES_ROOT
+from server.tests.unit import app_config
+
+
+class TestWarmup(unittest.TestCase):
+    def test_warmup_datasets_from_config_and_file(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            manifest = os.path.join(dirname, "warmup.txt")
+            with open(manifest, "w") as f:
+                f.write(f"# hot datasets\n{FIXTURES_ROOT}/pbmc3k.cxg/\n\n{FIXTURES_ROOT}/pbmc3k_sparse.cxg\n")
+            config = app_config(
+                extra_server_config=dict(
+                    warmup__datasets=[f"{FIXTURES_ROOT}/pbmc3k.cxg"],
+                    warmup__file=manifest,
+                )
+            )
+            self.assertEqual(
+                get_warmup_datasets(config),
+                [f"{FIXTURES_ROOT}/pbmc3k.cxg", f"{FIXTURES_ROOT}/pbmc3k_sparse.cxg"],
+            )
+
+    def test_no_warmup_by_default(self):
+        server = Server(app_config())
+        self.assertIsNone(server.warmup_thread)
+        self.assertEqual(len(server.app.dataset_cache), 0)
+
+    def test_warmup_opens_datasets(self):
+        location = f"{FIXTURES_ROOT}/pbmc3k.cxg"
+        config = app_config(
+            extra_server_config=dict(
+                multi_dataset__dataroot=FIXTURES_ROOT,
+                warmup__datasets=[location, f"{FIXTURES_ROOT}/does_not_exist.cxg"],
+            )
+        )
+        server = Server(config)
+        server.warmup_thread.join()
+
+        dataset_cache = server.app.dataset_cache
+        self.assertIn(location, dataset_cache)
+        self.assertEqual(len(dataset_cache), 1)
+        with dataset_cache.data_adaptor(location, None) as data_adaptor:
+            self.assertIsNotNone(data_adaptor.schema)
+
+    def test_warmup_fills_response_cache(self):
+        location = f"{FIXTURES_ROOT}/pbmc3k.cxg"
+        config = app_config(
+            extra_server_config=dict(multi_dataset__dataroot=FIXTURES_ROOT, warmup__datasets=[location])
+        )
+        server = Server(config)
+        server.warmup_thread.join()
+        app = server.app
+        with app.dataset_cache.data_adaptor(location, None) as data_adaptor:
+            embedding = _default_embedding(data_adaptor)
+            var_index = data_adaptor.get_schema()["annotations"]["var"]["index"]
+
+        # the responses, raw and compressed with the preferred encoding, are served from the cache
+        url_base = f"/s3_uri/{quote(quote(location, safe=''), safe='')}/api/v0.3/"
+        for content_encoding in [None, app.response_compression.encodings[0]]:
+            headers = {"Accept": "application/octet-stream", "Accept-Encoding": content_encoding or "identity"}
+            for endpoint in [f"layout/obs?layout-name={embedding}", f"annotations/var?annotation-name={var_index}"]:
+                with self.subTest(endpoint=endpoint, content_encoding=content_encoding):
+                    stats = app.response_cache.stats()
+                    result = app.test_client().get(f"{url_base}{endpoint}", headers=headers)
+                    self.assertEqual(result.status_code, HTTPStatus.OK)
+                    self.assertEqual(result.headers.get("Content-Encoding"), content_encoding)
+                    self.assertEqual(app.response_cache.stats()["misses"], stats["misses"])
+                    self.assertGreater(app.response_cache.stats()["hits"], stats["hits"])
+
+    def test_warmup_fills_response_cache_with_genes(self):
+        location = f"{FIXTURES_ROOT}/pbmc3k.cxg"
+        config = app_config(
+            extra_server_config=dict(
+                multi_dataset__dataroot=FIXTURES_ROOT,
+                warmup__datasets=[location],
+                warmup__genes=["F5", "not a gene"],
+            )
+        )
+        server = Server(config)
+        server.warmup_thread.join()
+        app = server.app
+        entries = app.response_cache.stats()["entries"]
+
+        url = f"/s3_uri/{quote(quote(location, safe=''), safe='')}/api/v0.3/data/var?var:name_0=F5"
+        result = app.test_client().get(url, headers={"Accept": "application/octet-stream"})
+        self.assertEqual(result.status_code, HTTPStatus.OK)
+        self.assertEqual(app.response_cache.stats()["entries"], entries)
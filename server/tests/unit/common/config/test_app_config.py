@@ -51,6 +51,7 @@ class AppConfigTest(ConfigTests):
                 ("server__app__verbose", True, False),
                 ("server__multi_dataset__dataroots__d__base_url", "d", None),
                 ("server__multi_dataset__dataroots__d__dataroot", "datadir", None),
+                ("server__multi_dataset__dataroots__d__trusted", False, None),
             ],
         )
 
@@ -94,6 +95,7 @@ class AppConfigTest(ConfigTests):
                     ("server__multi_dataset__dataroots__d__dataroot", "test_dataroot", None),
                     ("server__app__flask_secret_key", "secret", None),
                     ("server__multi_dataset__dataroots__d__base_url", "d", None),
+                    ("server__multi_dataset__dataroots__d__trusted", False, None),
                 ],
             )
 
@@ -1,6 +1,7 @@
 import json
 import unittest
 
+import flatbuffers
 import numpy as np
 import pandas as pd
 from parameterized import parameterized_class
@@ -8,6 +9,7 @@ from scipy import sparse
 
 import server.common.fbs as fbs
 from server.common.fbs.matrix import decode_matrix_fbs, encode_matrix_fbs
+from server.common.fbs.writer import Scalar, Table, serialize
 from server.common.utils.type_conversion_utils import get_dtypes_and_schemas_of_dataframe
 from server.tests import decode_fbs
 
@@ -90,6 +92,109 @@ class FbsTests(unittest.TestCase):
         fbs = encode_matrix_fbs(matrix=cat32, row_idx=None, col_idx=None)
         self.fbs_checks(fbs, (2**15 - 1, 1), expected_types, None)
 
+    def test_encode_bool(self):
+        df = pd.DataFrame({"a": np.array([True, False, True])})
+        fbs = encode_matrix_fbs(matrix=df, row_idx=None, col_idx=df.columns)
+        self.fbs_checks(fbs, (3, 1), ((np.ndarray, np.uint32),), ["a"])
+        self.assertListEqual(decode_matrix_fbs(fbs)["a"].tolist(), [1, 0, 1])
+
+    def test_encode_exact_size(self):
+        df = pd.DataFrame(
+            {
+                "a": pd.Categorical(["x", "y", "x"]),
+                "b": np.arange(3, dtype=np.float64),
+                "c": np.array(["s", "t", "u"], dtype=object),
+            }
+        )
+        buf = encode_matrix_fbs(matrix=df, col_idx=df.columns)
+        self.assertIsInstance(buf, bytearray)
+
+        # the buffer ends with the last vector - the column index
+        matrix = fbs.NetEncoding.Matrix.Matrix.GetRootAsMatrix(buf, 0)
+        col_index = fbs.NetEncoding.JSONEncodedFBArray.JSONEncodedFBArray()
+        col_index.Init(matrix.ColIndex().Bytes, matrix.ColIndex().Pos)
+        self.assertEqual(len(buf), col_index._tab.Vector(col_index._tab.Offset(4)) + col_index.DataLength())
+
+        # numeric vectors are aligned to their element size
+        column = fbs.NetEncoding.Float32FBArray.Float32FBArray()
+        column.Init(matrix.Columns(1).U().Bytes, matrix.Columns(1).U().Pos)
+        self.assertEqual(column._tab.Vector(column._tab.Offset(4)) % 4, 0)
+
+    def test_table_field_alignment(self):
+        table = Table([Scalar(np.float64, 2.5), Scalar(np.uint8, 7)])
+        buf = serialize(table)
+
+        # fields wider than the table's offset to its vtable are aligned to their size
+        self.assertEqual((table.pos + table.field_offsets[0]) % 8, 0)
+        tab = flatbuffers.table.Table(buf, flatbuffers.encode.Get(flatbuffers.packer.uoffset, buf, 0))
+        self.assertEqual(tab.Get(flatbuffers.number_types.Float64Flags, tab.Pos + tab.Offset(4)), 2.5)
+        self.assertEqual(tab.Get(flatbuffers.number_types.Uint8Flags, tab.Pos + tab.Offset(6)), 7)
+
+    def test_roundtrip_sparse(self):
+        dense = np.array([[0, 1.5, 0], [2.5, 0, 0], [0, 0, 0], [3.5, 4.5, 0]], dtype=np.float32)
+        for nbins in [None, 100]:
+            with self.subTest(nbins=nbins):
+                sparse_df = decode_matrix_fbs(encode_matrix_fbs(sparse.csr_matrix(dense), num_bins=nbins))
+                dense_df = decode_matrix_fbs(encode_matrix_fbs(dense, num_bins=nbins))
+                pd.testing.assert_frame_equal(sparse_df, dense_df)
+        csc_df = decode_matrix_fbs(encode_matrix_fbs(sparse.csc_matrix(dense)))
+        self.assertTrue(np.array_equal(csc_df.to_numpy(), dense))
+
+    def test_encode_sparse_columns(self):
+        dense = np.array([[0, 1.5, 0], [2.5, 0, 0], [0, 0, 0], [3.5, 4.5, 0], [0, 5.5, 6.5]], dtype=np.float32)
+        csc = sparse.csc_matrix(dense)
+        csc.data[csc.data == 5.5] = 0  # explicitly stored zero
+        dense[4, 1] = 0
+        for matrix in [dense, csc, sparse.csr_matrix(csc)]:
+            with self.subTest(matrix=type(matrix)):
+                buf = encode_matrix_fbs(matrix, sparse_threshold=0.5)
+                # column densities are 0.4, 0.4 and 0.2
+                self.assertEqual(
+                    [self.column_type(buf, i) for i in range(3)],
+                    [fbs.NetEncoding.TypedFBArray.TypedFBArray.SparseFloat32FBArray] * 3,
+                )
+                df = decode_matrix_fbs(buf)
+                self.assertTrue(np.array_equal(df.to_numpy(), dense))
+                self.assertTrue(all(dtype == np.float32 for dtype in df.dtypes))
+
+        # denser columns, integer columns and lossy encoding are unaffected
+        buf = encode_matrix_fbs(dense, sparse_threshold=0.4)
+        self.assertEqual(
+            [self.column_type(buf, i) for i in range(3)],
+            [fbs.NetEncoding.TypedFBArray.TypedFBArray.Float32FBArray] * 2
+            + [fbs.NetEncoding.TypedFBArray.TypedFBArray.SparseFloat32FBArray],
+        )
+        buf = encode_matrix_fbs(dense.astype(np.int32), sparse_threshold=1)
+        self.assertEqual(self.column_type(buf, 0), fbs.NetEncoding.TypedFBArray.TypedFBArray.Int32FBArray)
+        buf = encode_matrix_fbs(dense, num_bins=100, sparse_threshold=1)
+        self.assertEqual(self.column_type(buf, 0), fbs.NetEncoding.TypedFBArray.TypedFBArray.Int16EncodedXFBArray)
+
+    def test_encode_sparse_all_zero(self):
+        buf = encode_matrix_fbs(np.zeros((4, 1), dtype=np.float32), sparse_threshold=0.5)
+        self.assertEqual(self.column_type(buf, 0), fbs.NetEncoding.TypedFBArray.TypedFBArray.SparseFloat32FBArray)
+        self.assertListEqual(decode_matrix_fbs(buf)[0].tolist(), [0, 0, 0, 0])
+
+    def test_category_dictionary_cache(self):
+        cache = fbs.fbs_coders.CategoryDictionaryCache()
+        dtype = pd.CategoricalDtype(["x", "y", "z"])
+        df = pd.DataFrame({"a": pd.Categorical.from_codes([0, 2, 1], dtype=dtype)})
+        expected = decode_matrix_fbs(encode_matrix_fbs(df, col_idx=df.columns))
+        for _ in range(2):
+            result = decode_matrix_fbs(encode_matrix_fbs(df, col_idx=df.columns, category_dictionaries=cache))
+            pd.testing.assert_frame_equal(result, expected)
+
+        dictionary = cache.get("a", dtype.categories)
+        self.assertIs(cache.get("a", pd.Index(["x", "y", "z"])), dictionary)
+        # the same categories in another order are another dictionary
+        df = pd.DataFrame({"a": pd.Categorical(["x", "z", "y"], categories=["z", "y", "x"])})
+        result = decode_matrix_fbs(encode_matrix_fbs(df, col_idx=df.columns, category_dictionaries=cache))
+        self.assertListEqual(result["a"].tolist(), ["x", "z", "y"])
+        self.assertListEqual(result["a"].cat.categories.tolist(), ["z", "y", "x"])
+
+    @staticmethod
+    def column_type(buf, i):
+        return fbs.NetEncoding.Matrix.Matrix.GetRootAsMatrix(buf, 0).Columns(i).UType()
+
     def test_roundtrip(self):
         dfSrc = pd.DataFrame(
             data={
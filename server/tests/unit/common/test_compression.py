@@ -0,0 +1,55 @@
+import gzip
+import unittest
+
+import brotli
+import zstandard
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+from server.common import compression
+from server.common.compression import ResponseCompression
+
+
+def accept_encodings(value):
+    return parse_accept_header(value, Accept)
+
+
+class TestResponseCompression(unittest.TestCase):
+    def test_negotiate(self):
+        rc = ResponseCompression(encodings=["zstd", "br", "gzip"], min_bytes=10)
+        self.assertEqual(rc.negotiate(accept_encodings("gzip, deflate"), 100), "gzip")
+        self.assertIsNone(rc.negotiate(accept_encodings(""), 100))
+        self.assertIsNone(rc.negotiate(accept_encodings("deflate"), 100))
+        self.assertIsNone(rc.negotiate(accept_encodings("gzip"), 9))
+        # client quality values take precedence over the server preference
+        self.assertEqual(rc.negotiate(accept_encodings("gzip, br;q=0.5"), 100), "gzip")
+        self.assertEqual(rc.negotiate(accept_encodings("gzip, br"), 100), "br")
+        self.assertEqual(rc.negotiate(accept_encodings("gzip, br, zstd"), 100), "zstd")
+        self.assertEqual(rc.negotiate(accept_encodings("zstd"), 100), "zstd")
+
+    def test_zstd_and_brotli_are_available(self):
+        # both are server requirements, so must be offered - not silently dropped
+        self.assertEqual(compression.AVAILABLE_CODINGS, ["zstd", "br", "gzip"])
+        self.assertEqual(ResponseCompression(encodings=["zstd", "br", "gzip"]).encodings, ["zstd", "br", "gzip"])
+
+    def test_unavailable_encodings_are_not_offered(self):
+        rc = ResponseCompression(encodings=["zstd", "br", "gzip"])
+        expected = [coding for coding in ["zstd", "br", "gzip"] if coding in compression.AVAILABLE_CODINGS]
+        self.assertEqual(rc.encodings, expected)
+        self.assertIsNone(ResponseCompression(encodings=[]).negotiate(accept_encodings("gzip"), 100))
+
+    def test_levels(self):
+        rc = ResponseCompression(
+            encodings=["gzip"], levels={"gzip": 1}, endpoint_levels={"layout/obs": {"gzip": 9, "zstd": 19}}
+        )
+        self.assertEqual(rc.level("data/var", "gzip"), 1)
+        self.assertEqual(rc.level("layout/obs", "gzip"), 9)
+        self.assertEqual(rc.level("data/var", "zstd"), 3)
+        self.assertEqual(rc.level("layout/obs", "zstd"), 19)
+
+    def test_compress(self):
+        rc = ResponseCompression(encodings=["zstd", "br", "gzip"])
+        data = bytearray(b"0123456789" * 100)
+        self.assertEqual(gzip.decompress(rc.compress("data/var", "gzip", data)), data)
+        self.assertEqual(zstandard.ZstdDecompressor().decompress(rc.compress("data/var", "zstd", data)), data)
+        self.assertEqual(brotli.decompress(rc.compress("data/var", "br", data)), data)
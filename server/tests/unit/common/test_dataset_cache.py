@@ -0,0 +1,147 @@
+import threading
+import unittest
+
+from server.common.cache.dataset_cache import DatasetCache
+
+
+class FakeDataAdaptor:
+    def __init__(self, location, open_arrays=0):
+        self.location = location
+        self.open_arrays = open_arrays
+        self.closed = False
+
+    def get_open_array_count(self):
+        return 0 if self.closed else self.open_arrays
+
+    def cleanup(self):
+        self.closed = True
+
+
+class TestDatasetCache(unittest.TestCase):
+    def setUp(self):
+        self.opened = []
+
+    def factory(self, location, open_arrays=0):
+        data_adaptor = FakeDataAdaptor(location, open_arrays)
+        self.opened.append(data_adaptor)
+        return data_adaptor
+
+    def test_cache_hit(self):
+        cache = DatasetCache(max_datasets=2)
+        with cache.data_adaptor("a", self.factory) as first:
+            pass
+        with cache.data_adaptor("a", self.factory) as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(len(self.opened), 1)
+        self.assertFalse(first.closed)
+        self.assertIn("a", cache)
+
+    def test_lru_eviction_by_dataset_count(self):
+        cache = DatasetCache(max_datasets=2)
+        for location in ["a", "b", "a", "c"]:
+            with cache.data_adaptor(location, self.factory):
+                pass
+        self.assertEqual(len(cache), 2)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual([d.closed for d in self.opened], [False, True, False])
+
+    def test_eviction_by_open_array_count(self):
+        cache = DatasetCache(max_datasets=10, max_open_arrays=5)
+        for location in ["a", "b", "c"]:
+            with cache.data_adaptor(location, lambda loc: self.factory(loc, open_arrays=2)):
+                pass
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.open_array_count(), 4)
+
+    def test_in_use_adaptor_is_not_closed(self):
+        cache = DatasetCache(max_datasets=1)
+        with cache.data_adaptor("a", self.factory) as a:
+            with cache.data_adaptor("b", self.factory):
+                self.assertNotIn("a", cache)
+                self.assertFalse(a.closed)
+            self.assertFalse(a.closed)
+        self.assertTrue(a.closed)
+        self.assertIn("b", cache)
+
+    def test_factory_error_is_not_cached(self):
+        cache = DatasetCache()
+
+        def failing_factory(location):
+            raise OSError("no such dataset")
+
+        with self.assertRaises(OSError):
+            with cache.data_adaptor("a", failing_factory):
+                pass
+        self.assertNotIn("a", cache)
+        with cache.data_adaptor("a", self.factory) as a:
+            self.assertEqual(a.location, "a")
+
+    def test_evict_and_clear(self):
+        cache = DatasetCache()
+        for location in ["a", "b"]:
+            with cache.data_adaptor(location, self.factory):
+                pass
+        cache.evict("a")
+        self.assertNotIn("a", cache)
+        self.assertTrue(self.opened[0].closed)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertTrue(all(d.closed for d in self.opened))
+
+    def test_concurrent_opens_are_coalesced(self):
+        cache = DatasetCache()
+        started = threading.Event()
+        release = threading.Event()
+        acquired = []
+
+        def slow_factory(location):
+            started.set()
+            release.wait()
+            return self.factory(location)
+
+        def worker():
+            with cache.data_adaptor("a", slow_factory) as data_adaptor:
+                acquired.append(data_adaptor)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        threads[0].start()
+        started.wait()
+        for t in threads[1:]:
+            t.start()
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(len(acquired), 8)
+        self.assertTrue(all(a is self.opened[0] for a in acquired))
+        self.assertEqual(cache.entries["a"].in_use, 0)
+
+    def test_concurrent_access(self):
+        cache = DatasetCache(max_datasets=3)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(50):
+                    location = str((n + i) % 5)
+                    with cache.data_adaptor(location, self.factory) as data_adaptor:
+                        self.assertFalse(data_adaptor.closed)
+                        self.assertEqual(data_adaptor.location, location)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(cache), 3)
+        cached = {id(cache.entries[location].data_adaptor) for location in cache.entries}
+        self.assertTrue(all(d.closed for d in self.opened if id(d) not in cached))
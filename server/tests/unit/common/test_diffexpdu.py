@@ -3,7 +3,12 @@ import unittest
 
 import numpy as np
 
-from server.common.diffexpdu import DiffExArguments, deflate_postings_lists, inflate_postings_lists
+from server.common.diffexpdu import (
+    DiffExArguments,
+    DiffExBatchArguments,
+    deflate_postings_lists,
+    inflate_postings_lists,
+)
 
 
 class TestDiffexPdu(unittest.TestCase):
@@ -25,6 +30,30 @@ class TestDiffexPdu(unittest.TestCase):
         decoded = DiffExArguments.unpack_from(encoded)
         self.assertEqual(decoded, de_args)
 
+    def test_roundtrip_diffex_wilcoxon(self):
+        de_args = DiffExArguments(
+            mode=DiffExArguments.DiffExMode.WilcoxonTopN,
+            params=DiffExArguments.TopNParams(N=20),
+            set1=np.arange(0, 100, 2, dtype=np.uint32),
+            set2=np.arange(1, 100, 2, dtype=np.uint32),
+        )
+        decoded = DiffExArguments.unpack_from(de_args.pack())
+        self.assertEqual(decoded, de_args)
+        self.assertEqual(decoded.mode, DiffExArguments.DiffExMode.WilcoxonTopN)
+
+    def test_roundtrip_diffex_batch(self):
+        de_args = DiffExBatchArguments(
+            mode=DiffExArguments.DiffExMode.OneVsRest,
+            params=DiffExArguments.TopNParams(N=10),
+            sets=[np.arange(i, 300, 3, dtype=np.uint32) for i in range(3)],
+        )
+        decoded = DiffExBatchArguments.unpack_from(de_args.pack())
+        self.assertEqual(decoded, de_args)
+        self.assertEqual(len(decoded.sets), 3)
+
+        with self.assertRaises(AssertionError):
+            DiffExArguments.unpack_from(de_args.pack())
+
     def test_roundtrip_multi_postings_list(self):
         n_obs = 100_000
         n_elem = (50_000, 10, 1000)
@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+
+from server.common.errors import ExceedsLimitError
+from server.common.jobs import Job, JobManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_until_finished(job, timeout=10):
+    for _ in range(int(timeout / 0.01)):
+        if job.is_finished():
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"job {job.id} did not finish")
+
+
+class TestJobManager(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.job_manager = JobManager(max_workers=1, max_jobs=2, result_ttl=60, clock=self.clock)
+
+    def tearDown(self):
+        self.job_manager.shutdown()
+
+    def test_result_and_progress(self):
+        def fn(job, n):
+            job.set_total(n)
+            for _ in range(n):
+                job.check_cancelled()
+                job.advance(1)
+            return n * 2
+
+        job = self.job_manager.submit(fn, 5, owner="dataset")
+        wait_until_finished(job)
+        self.assertIs(self.job_manager.get(job.id), job)
+        self.assertEqual(job.to_dict(), dict(id=job.id, status=Job.DONE, progress=dict(done=5, total=5), result=10))
+        self.assertEqual(job.owner, "dataset")
+
+    def test_failure(self):
+        def fn(job):
+            raise ValueError("bad data")
+
+        job = self.job_manager.submit(fn)
+        wait_until_finished(job)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.to_dict()["error"], "bad data")
+
+    def test_cancel(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def fn(job):
+            started.set()
+            release.wait()
+            job.check_cancelled()
+            return "not cancelled"
+
+        running = self.job_manager.submit(fn)
+        pending = self.job_manager.submit(fn)  # waits for the single worker
+        started.wait()
+        self.assertEqual(running.status, Job.RUNNING)
+        self.assertEqual(pending.status, Job.PENDING)
+
+        # a pending job is cancelled immediately, a running job at its next check
+        self.assertIs(self.job_manager.cancel(pending.id), pending)
+        self.assertEqual(pending.status, Job.CANCELLED)
+        self.job_manager.cancel(running.id)
+        release.set()
+        wait_until_finished(running)
+        self.assertEqual(running.status, Job.CANCELLED)
+        self.assertIsNone(running.result)
+        self.assertIsNone(self.job_manager.cancel("unknown"))
+
+    def test_is_local(self):
+        job = self.job_manager.submit(lambda job: None)
+        wait_until_finished(job)
+        self.assertTrue(self.job_manager.is_local(job.id))
+        self.assertTrue(self.job_manager.is_local("malformed"))
+
+        # the job ids of another JobManager, eg, in another process
+        other = JobManager(max_workers=1)
+        try:
+            other_job = other.submit(lambda job: None)
+            self.assertFalse(self.job_manager.is_local(other_job.id))
+            self.assertIsNone(self.job_manager.get(other_job.id))
+        finally:
+            other.shutdown()
+
+    def test_cancelled_job_is_not_run(self):
+        calls = []
+        job = Job()
+        self.job_manager.jobs[job.id] = job
+        self.job_manager.cancel(job.id)
+        self.assertEqual(job.status, Job.CANCELLED)
+        finished_at = job.finished_at
+
+        # a worker picking up the job once cancelled neither runs nor finishes it again
+        self.clock.now += 1
+        self.job_manager._run(job, lambda job: calls.append(job), ())
+        self.assertEqual(calls, [])
+        self.assertEqual(job.status, Job.CANCELLED)
+        self.assertEqual(job.finished_at, finished_at)
+
+        # nor does a finished job change status
+        self.job_manager._finish(job, Job.DONE, result="result")
+        self.assertEqual(job.status, Job.CANCELLED)
+        self.assertIsNone(job.result)
+
+    def test_max_jobs(self):
+        release = threading.Event()
+        jobs = [self.job_manager.submit(lambda job: release.wait()) for _ in range(2)]
+        with self.assertRaises(ExceedsLimitError):
+            self.job_manager.submit(lambda job: None)
+        release.set()
+        for job in jobs:
+            wait_until_finished(job)
+        # finished jobs do not count towards the limit
+        self.job_manager.submit(lambda job: None)
+
+    def test_result_ttl(self):
+        job = self.job_manager.submit(lambda job: "result")
+        wait_until_finished(job)
+        self.clock.now += 60
+        self.assertIs(self.job_manager.get(job.id), job)
+        self.clock.now += 1
+        self.assertIsNone(self.job_manager.get(job.id))
+        self.assertEqual(len(self.job_manager), 0)
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+from server.common.cache.lru_cache import ByteBudgetLRUCache
+
+
+class TestByteBudgetLRUCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = ByteBudgetLRUCache(max_bytes=1024)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", np.zeros(10, dtype=np.float32))
+        self.assertEqual(cache.get("a").shape, (10,))
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["bytes"], 40)
+
+    def test_byte_budget(self):
+        cache = ByteBudgetLRUCache(max_bytes=100)
+        for key in ["a", "b", "c"]:
+            cache.put(key, np.zeros(10, dtype=np.float32))
+            cache.get("a")  # keep "a" recently used
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(cache.stats()["bytes"], 80)
+
+    def test_oversized_values_are_not_cached(self):
+        cache = ByteBudgetLRUCache(max_bytes=100)
+        cache.put("a", np.zeros(10, dtype=np.float32))
+        cache.put("big", np.zeros(100, dtype=np.float32))
+        self.assertNotIn("big", cache)
+        self.assertIn("a", cache)
+
+    def test_replace_and_clear(self):
+        cache = ByteBudgetLRUCache(max_bytes=100)
+        cache.put("a", np.zeros(10, dtype=np.float32))
+        cache.put("a", np.zeros(5, dtype=np.float32))
+        self.assertEqual(cache.stats()["bytes"], 20)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+    def test_disabled(self):
+        cache = ByteBudgetLRUCache(max_bytes=0)
+        cache.put("a", np.zeros(10, dtype=np.float32))
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from server.common.cache.response_cache import ResponseCache
+
+
+class Encoder:
+    def __init__(self, payload=b"payload"):
+        self.payload = payload
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.payload
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.disk_dir = os.path.join(self.tmp_dir.name, "responses")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_memory(self):
+        cache = ResponseCache(max_bytes=1024)
+        encode = Encoder()
+        key = ("dataset", "layout/obs", ("umap",), None)
+        self.assertEqual(cache.get(key, encode), b"payload")
+        self.assertEqual(cache.get(key, encode), b"payload")
+        self.assertEqual(encode.calls, 1)
+        self.assertEqual(cache.get(("dataset", "layout/obs", ("umap",), 500), encode), b"payload")
+        self.assertEqual(encode.calls, 2)
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["bytes"], 14)
+        self.assertNotIn("disk_hits", stats)
+
+    def test_disabled(self):
+        cache = ResponseCache(max_bytes=0)
+        encode = Encoder()
+        cache.get("key", encode)
+        cache.get("key", encode)
+        self.assertEqual(encode.calls, 2)
+
+    def test_disk_is_shared(self):
+        # eg, by a restarted server, or another server process
+        encode = Encoder()
+        ResponseCache(max_bytes=1024, disk_dir=self.disk_dir, disk_max_bytes=1024).get("key", encode)
+        cache = ResponseCache(max_bytes=1024, disk_dir=self.disk_dir, disk_max_bytes=1024)
+        self.assertEqual(cache.get("key", encode), b"payload")
+        self.assertEqual(encode.calls, 1)
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        self.assertEqual(cache.stats()["disk_misses"], 0)
+
+    def test_disk_budget(self):
+        cache = ResponseCache(max_bytes=0, disk_dir=self.disk_dir, disk_max_bytes=20)
+        for mtime, key in enumerate(["a", "b", "c"]):
+            cache.get(key, Encoder(b"0123456789"))
+            os.utime(cache._disk_path(key), (mtime, mtime))
+        self.assertEqual([os.path.exists(cache._disk_path(key)) for key in ["a", "b", "c"]], [False, True, True])
+
+        # payloads larger than the budget are not written
+        cache.get("big", Encoder(b"x" * 21))
+        self.assertFalse(os.path.exists(cache._disk_path("big")))
+
+    def test_concurrent_misses_are_coalesced(self):
+        cache = ResponseCache(max_bytes=1024)
+        release = threading.Event()
+        calls = []
+
+        def encode():
+            calls.append(1)
+            release.wait()
+            return b"payload"
+
+        threads = [threading.Thread(target=cache.get, args=("key", encode)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
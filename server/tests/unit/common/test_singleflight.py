@@ -0,0 +1,68 @@
+import threading
+import unittest
+
+from server.common.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def run_concurrently(self, n_threads, target):
+        threads = [threading.Thread(target=target) for _ in range(n_threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def test_concurrent_calls_are_coalesced(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def slow(key):
+            calls.append(key)
+            started.set()
+            release.wait()
+            return key.upper()
+
+        def worker():
+            results.append(flights.do("a", slow))
+
+        leader = threading.Thread(target=worker)
+        leader.start()
+        started.wait()
+        self.assertIn("a", flights)
+
+        followers = [threading.Thread(target=worker) for _ in range(7)]
+        for t in followers:
+            t.start()
+        release.set()
+        leader.join()
+        for t in followers:
+            t.join()
+
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(results, ["A"] * 8)
+        self.assertNotIn("a", flights)
+
+    def test_errors_are_shared_and_not_retained(self):
+        flights = SingleFlight()
+        errors = []
+
+        def failing(key):
+            raise KeyError(key)
+
+        def worker():
+            try:
+                flights.do("a", failing)
+            except KeyError as e:
+                errors.append(e)
+
+        self.run_concurrently(4, worker)
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(flights.do("a", lambda key: key * 2), "aa")
+
+    def test_distinct_keys(self):
+        flights = SingleFlight()
+        self.assertEqual(flights.do("a", lambda key: key), "a")
+        self.assertEqual(flights.do("b", lambda key: key), "b")
@@ -0,0 +1,64 @@
+import threading
+import unittest
+
+from server.common.threadpool import ComputePool
+
+
+class TestComputePool(unittest.TestCase):
+    def test_map(self):
+        pool = ComputePool(max_workers=4)
+        self.assertEqual(pool.map(lambda x: x * x, range(10)), [x * x for x in range(10)])
+        self.assertEqual(pool.map(lambda x: x, []), [])
+
+    def test_concurrency_is_bounded(self):
+        pool = ComputePool(max_workers=2)
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def task(_):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            threading.Event().wait(0.01)
+            with lock:
+                running.pop()
+
+        pool.map(task, range(8))
+        self.assertLessEqual(max(peak), 2)
+
+    def test_nested_map_runs_inline(self):
+        # all workers are busy with outer tasks, which would deadlock if they waited on the pool
+        pool = ComputePool(max_workers=2)
+        outer_threads = {}
+
+        def outer(i):
+            outer_threads[i] = threading.get_ident()
+            return pool.map(lambda j: (threading.get_ident(), i * 10 + j), range(3))
+
+        results = pool.map(outer, range(4))
+        for i, inner in enumerate(results):
+            self.assertEqual([value for _, value in inner], [i * 10 + j for j in range(3)])
+            self.assertTrue(all(ident == outer_threads[i] for ident, _ in inner))
+
+    def test_exception(self):
+        pool = ComputePool(max_workers=2)
+
+        def task(x):
+            if x == 3:
+                raise ValueError("three")
+            return x
+
+        with self.assertRaises(ValueError):
+            pool.map(task, range(8))
+        # the pool remains usable
+        self.assertEqual(pool.map(task, [1, 2]), [1, 2])
+
+    def test_configure(self):
+        pool = ComputePool(max_workers=2)
+        pool.map(lambda x: x, range(4))
+        pool.configure(3)
+        self.assertEqual(pool.max_workers, 3)
+        self.assertEqual(pool.map(lambda x: x, range(4)), list(range(4)))
+        pool.configure(None)
+        self.assertGreaterEqual(pool.max_workers, 1)
@@ -0,0 +1,93 @@
+import unittest
+
+from server.common.cache.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.calls = []
+
+    def loader(self, key):
+        self.calls.append(key)
+        return key.upper()
+
+    def test_values_expire(self):
+        cache = TTLCache(clock=self.clock)
+        self.assertEqual(cache.get("a", self.loader, ttl=10), "A")
+        self.assertEqual(cache.get("a", self.loader, ttl=10), "A")
+        self.assertEqual(self.calls, ["a"])
+        self.assertIn("a", cache)
+
+        self.clock.now = 10
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.get("a", self.loader, ttl=10), "A")
+        self.assertEqual(self.calls, ["a", "a"])
+
+    def test_ttl_function_of_value(self):
+        cache = TTLCache(clock=self.clock)
+
+        def ttl(value):
+            return 1 if value is None else 100
+
+        cache.get("missing", lambda key: None, ttl=ttl)
+        cache.get("found", self.loader, ttl=ttl)
+        self.clock.now = 50
+        self.assertNotIn("missing", cache)
+        self.assertIn("found", cache)
+
+    def test_zero_ttl_is_not_cached(self):
+        cache = TTLCache(clock=self.clock)
+        cache.get("a", self.loader, ttl=0)
+        cache.get("a", self.loader, ttl=0)
+        self.assertEqual(self.calls, ["a", "a"])
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = TTLCache(max_entries=2, clock=self.clock)
+        for key in ["a", "b", "a", "c"]:
+            cache.get(key, self.loader, ttl=10)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+
+    def test_stale_if_error(self):
+        cache = TTLCache(stale_ttl=5, clock=self.clock)
+        cache.get("a", self.loader, ttl=10)
+
+        def failing(key):
+            raise ConnectionError()
+
+        self.clock.now = 12
+        self.assertEqual(cache.get("a", failing, ttl=10), "A")
+
+        self.clock.now = 15
+        with self.assertRaises(ConnectionError):
+            cache.get("a", failing, ttl=10)
+
+    def test_errors_are_not_cached(self):
+        cache = TTLCache(clock=self.clock)
+
+        def failing(key):
+            raise ConnectionError()
+
+        with self.assertRaises(ConnectionError):
+            cache.get("a", failing, ttl=10)
+        self.assertEqual(cache.get("a", self.loader, ttl=10), "A")
+
+    def test_evict_and_clear(self):
+        cache = TTLCache(clock=self.clock)
+        cache.get("a", self.loader, ttl=10)
+        cache.get("b", self.loader, ttl=10)
+        cache.evict("a")
+        self.assertNotIn("a", cache)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
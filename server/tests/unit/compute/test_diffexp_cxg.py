@@ -1,11 +1,15 @@
 import tempfile
 import unittest
+from unittest.mock import patch
 
 import numpy as np
+from scipy import stats
 
 from server.common.fbs.matrix import decode_matrix_fbs, encode_matrix_fbs
+from server.common.jobs import Job, JobCancelledError
 from server.compute import diffexp_cxg
 from server.compute.diffexp_cxg import diffexp_ttest
+from server.dataset.cxg_dataset import CxgDataset
 from server.dataset.matrix_loader import DataLoader
 from server.tests import FIXTURES_ROOT
 from server.tests.unit import app_config
@@ -145,3 +149,256 @@ class DiffExpTest(unittest.TestCase):
                     vsparse = cols_sparse[row][col]
                     vdense = cols_dense[row][col]
                     self.assertTrue(np.isclose(vdense, vsparse, 1e-6, 1e-6))
+
+    def test_diffexp_cache(self):
+        CxgDataset.set_diffexp_cache(64 * 1024**2)
+        adaptor = self.load_dataset(f"{FIXTURES_ROOT}/pbmc3k.cxg")
+        maskA = self.get_mask(adaptor, 1, 10)
+        maskB = self.get_mask(adaptor, 2, 10)
+        maskC = self.get_mask(adaptor, 3, 10)
+
+        with patch.object(diffexp_cxg, "mean_var_cnt_dense", wraps=diffexp_cxg.mean_var_cnt_dense) as scan:
+            results = diffexp_ttest(adaptor, maskA, maskB, 10)
+            self.check_1_10_2_10(results)
+            self.assertEqual(scan.call_count, 2)
+
+            # same sets, as masks or lists - cached result
+            self.assertIs(diffexp_ttest(adaptor, maskA, maskB, 10), results)
+            self.assertIs(
+                diffexp_ttest(adaptor, maskA.nonzero()[0], maskB.nonzero()[0], 10, selector_lists=True), results
+            )
+            self.assertEqual(scan.call_count, 2)
+
+            # a different top_n is a new result, but the cell set statistics are re-used
+            self.assertEqual(len(diffexp_ttest(adaptor, maskA, maskB, 12)["positive"]), 12)
+            self.assertEqual(scan.call_count, 2)
+
+            # a new comparison re-using one set only scans the other
+            expected = diffexp_ttest(adaptor, maskC, maskB, 10)
+            self.assertEqual(scan.call_count, 3)
+            CxgDataset.set_diffexp_cache(0)
+            self.assertEqual(diffexp_ttest(adaptor, maskC, maskB, 10), expected)
+
+        CxgDataset.set_diffexp_cache(app_config().server__adaptor__cxg_adaptor__diffexp_cache_bytes)
+
+    def test_cxg_sparse_chunked(self):
+        CxgDataset.set_diffexp_cache(0)
+        adaptor = self.load_dataset(f"{FIXTURES_ROOT}/pbmc3k_sparse.cxg")
+        rows = self.get_mask(adaptor, 1, 3).nonzero()[0]
+        n_var = adaptor.get_shape()[1]
+        matrix = adaptor.open_X_array()
+        mean, var, n = diffexp_cxg.mean_var_cnt_sparse(matrix, n_var, rows)
+
+        with patch.object(diffexp_cxg, "SPARSE_MIN_CHUNK_ROWS", 64), patch.object(
+            diffexp_cxg.compute_pool, "max_workers", 5
+        ):
+            chunked_mean, chunked_var, chunked_n = diffexp_cxg.mean_var_cnt_sparse(matrix, n_var, rows)
+            self.check_1_10_2_10(
+                diffexp_ttest(adaptor, self.get_mask(adaptor, 1, 10), self.get_mask(adaptor, 2, 10), 10)
+            )
+
+        self.assertEqual(chunked_n, n)
+        np.testing.assert_allclose(chunked_mean, mean, rtol=1e-10)
+        np.testing.assert_allclose(chunked_var, var, rtol=1e-8)
+        CxgDataset.set_diffexp_cache(app_config().server__adaptor__cxg_adaptor__diffexp_cache_bytes)
+
+    def test_one_vs_rest(self):
+        CxgDataset.set_diffexp_cache(0)
+        for dataset in ["pbmc3k.cxg", "pbmc3k_sparse.cxg"]:
+            with self.subTest(dataset=dataset):
+                adaptor = self.load_dataset(f"{FIXTURES_ROOT}/{dataset}")
+                n_obs = adaptor.get_shape()[0]
+                labels = np.full(n_obs, -1)
+                labels[1::10] = 0
+                labels[2::10] = 1
+                results = diffexp_cxg.diffexp_ttest_one_vs_rest(adaptor, labels, 3, 10)
+                self.assertEqual(len(results), 3)
+                self.assertIsNone(results[2])  # empty group
+
+                for group in [0, 1]:
+                    expected = diffexp_ttest(adaptor, labels == group, labels != group, 10)
+                    for key in ["positive", "negative"]:
+                        self.compare_diffexp_results(results[group][key], expected[key])
+        CxgDataset.set_diffexp_cache(app_config().server__adaptor__cxg_adaptor__diffexp_cache_bytes)
+
+    def test_cxg_dense_streaming(self):
+        adaptor = self.load_dataset(f"{FIXTURES_ROOT}/pbmc3k.cxg")
+        rows = self.get_mask(adaptor, 1, 3).nonzero()[0]
+        n_var = adaptor.get_shape()[1]
+        matrix = adaptor.open_X_array()
+        mean, var, n = diffexp_cxg.mean_var_cnt_dense(matrix, n_var, rows)
+
+        # a memory limit of ~100 rows, read by 4 workers
+        with patch.object(diffexp_cxg.compute_pool, "max_workers", 4):
+            max_chunk_bytes = 4 * 100 * diffexp_cxg._dense_row_bytes(n_var, matrix.schema.attr(0).dtype.itemsize)
+            chunked_mean, chunked_var, chunked_n = diffexp_cxg.mean_var_cnt_dense(
+                matrix, n_var, rows, max_chunk_bytes=max_chunk_bytes
+            )
+
+        self.assertEqual(chunked_n, n)
+        np.testing.assert_allclose(chunked_mean, mean, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(chunked_var, var, rtol=1e-4, atol=1e-6)
+
+    def test_dense_row_bytes(self):
+        # the read, which may cover 4 rows per selected row, the gathered copy, and two float64 temporaries
+        self.assertEqual(diffexp_cxg._dense_row_bytes(1000, 4), 1000 * (4 * 5 + 2 * 8))
+        self.assertEqual(diffexp_cxg._dense_row_bytes(1000, 4, float32=True), 1000 * 4 * 5)
+        self.assertEqual(diffexp_cxg._dense_row_bytes(0, 4), 1)
+
+    def test_job_progress_and_cancellation(self):
+        CxgDataset.set_diffexp_cache(0)
+        for dataset in ["pbmc3k.cxg", "pbmc3k_sparse.cxg"]:
+            with self.subTest(dataset=dataset):
+                adaptor = self.load_dataset(f"{FIXTURES_ROOT}/{dataset}")
+                maskA = self.get_mask(adaptor, 1, 10)
+                maskB = self.get_mask(adaptor, 2, 10)
+
+                job = Job()
+                self.check_1_10_2_10(diffexp_ttest(adaptor, maskA, maskB, 10, job=job))
+                self.assertEqual(job.total, np.count_nonzero(maskA) + np.count_nonzero(maskB))
+                self.assertEqual(job.done, job.total)
+
+                job = Job()
+                job.cancel_requested = True
+                with self.assertRaises(JobCancelledError):
+                    diffexp_ttest(adaptor, maskA, maskB, 10, job=job)
+        CxgDataset.set_diffexp_cache(app_config().server__adaptor__cxg_adaptor__diffexp_cache_bytes)
+
+    def test_wilcoxon(self):
+        CxgDataset.set_diffexp_cache(0)
+        results = []
+        for dataset in ["pbmc3k.cxg", "pbmc3k_sparse.cxg"]:
+            with self.subTest(dataset=dataset):
+                adaptor = self.load_dataset(f"{FIXTURES_ROOT}/{dataset}")
+                maskA = self.get_mask(adaptor, 1, 10)
+                maskB = self.get_mask(adaptor, 2, 10)
+                result = adaptor.compute_diffexp_wilcoxon(maskA, maskB, 10)
+                self.assertEqual(len(result["positive"]), 10)
+                self.assertEqual(len(result["negative"]), 10)
+                results.append(result)
+
+                # the same p-values as scipy's Mann-Whitney U test, which ranks every value
+                X = adaptor.get_X_array()
+                for var_index, _, pval, _ in result["positive"][:3] + result["negative"][:3]:
+                    expected = stats.mannwhitneyu(
+                        X[maskA, var_index], X[maskB, var_index], use_continuity=False, method="asymptotic"
+                    )
+                    self.assertAlmostEqual(pval, expected.pvalue, places=6)
+
+        # dense and sparse agree
+        self.assertEqual([p[0] for p in results[0]["positive"]], [p[0] for p in results[1]["positive"]])
+        self.assertEqual([n[0] for n in results[0]["negative"]], [n[0] for n in results[1]["negative"]])
+        CxgDataset.set_diffexp_cache(app_config().server__adaptor__cxg_adaptor__diffexp_cache_bytes)
+
+    def test_wilcoxon_overlapping_sets(self):
+        CxgDataset.set_diffexp_cache(0)
+        for dataset in ["pbmc3k.cxg", "pbmc3k_sparse.cxg"]:
+            with self.subTest(dataset=dataset):
+                adaptor = self.load_dataset(f"{FIXTURES_ROOT}/{dataset}")
+                # cells 1, 13, 25, ... are in both sets, and are ranked as a member of each
+                maskA = self.get_mask(adaptor, 1, 4)
+                maskB = self.get_mask(adaptor, 1, 6)
+                result = adaptor.compute_diffexp_wilcoxon(maskA, maskB, 10)
+
+                X = adaptor.get_X_array()
+                for var_index, _, pval, _ in result["positive"][:3] + result["negative"][:3]:
+                    expected = stats.mannwhitneyu(
+                        X[maskA, var_index], X[maskB, var_index], use_continuity=False, method="asymptotic"
+                    )
+                    self.assertAlmostEqual(pval, expected.pvalue, places=6)
+        CxgDataset.set_diffexp_cache(app_config().server__adaptor__cxg_adaptor__diffexp_cache_bytes)
+
+    def test_approximate(self):
+        for dataset in ["pbmc3k.cxg", "pbmc3k_sparse.cxg"]:
+            with self.subTest(dataset=dataset):
+                adaptor = self.load_dataset(f"{FIXTURES_ROOT}/{dataset}")
+                maskA = self.get_mask(adaptor, 1, 2)
+                maskB = self.get_mask(adaptor, 2, 2)
+                nA, nB = np.count_nonzero(maskA), np.count_nonzero(maskB)
+
+                # sets no larger than the sample size are not sampled
+                result = diffexp_cxg.diffexp_ttest_approximate(adaptor, maskA, maskB, sample_size=nA, top_n=10)
+                exact = diffexp_ttest(adaptor, maskA, maskB, 10)
+                self.assertEqual(result["positive"], exact["positive"])
+                self.assertEqual(result["sample_sizes"], [nA, nB])
+                self.assertEqual(result["stability"], 1.0)
+
+                result = diffexp_cxg.diffexp_ttest_approximate(adaptor, maskA, maskB, sample_size=500, top_n=10)
+                self.assertEqual(result["set_sizes"], [nA, nB])
+                self.assertEqual(result["sample_sizes"], [500, 500])
+                self.assertTrue(0 <= result["stability"] <= 1)
+                self.assertEqual(len(result["positive"]), 10)
+                self.assertEqual(
+                    diffexp_cxg.diffexp_ttest_approximate(adaptor, maskA, maskB, sample_size=500, top_n=10), result
+                )
+
+    def test_stratified_sample(self):
+        rows = np.arange(0, 10000, 3)
+        sample = diffexp_cxg.stratified_sample(rows, 100, seed=1)
+        self.assertEqual(len(sample), 100)
+        self.assertTrue(np.all(np.diff(sample) > 0))
+        self.assertTrue(np.isin(sample, rows).all())
+        # one sample from each stratum
+        bounds = (np.arange(101) * len(rows)) // 100
+        positions = np.searchsorted(rows, sample)
+        self.assertTrue(np.all((bounds[:-1] <= positions) & (positions < bounds[1:])))
+        np.testing.assert_array_equal(diffexp_cxg.stratified_sample(rows, 100, seed=1), sample)
+        self.assertFalse(np.array_equal(diffexp_cxg.stratified_sample(rows, 100, seed=2), sample))
+        self.assertIs(diffexp_cxg.stratified_sample(rows, len(rows), seed=1), rows)
+
+    def test_float32_accumulation(self):
+        CxgDataset.set_diffexp_cache(0)
+        for dataset in ["pbmc3k.cxg", "pbmc3k_sparse.cxg"]:
+            with self.subTest(dataset=dataset):
+                adaptor = self.load_dataset(f"{FIXTURES_ROOT}/{dataset}")
+                rows = self.get_mask(adaptor, 1, 3).nonzero()[0]
+                n_var = adaptor.get_shape()[1]
+                matrix = adaptor.open_X_array()
+                mean_var_cnt = diffexp_cxg.mean_var_cnt_sparse if adaptor.is_sparse else diffexp_cxg.mean_var_cnt_dense
+                mean, var, n = mean_var_cnt(matrix, n_var, rows)
+                mean32, var32, n32 = mean_var_cnt(matrix, n_var, rows, float32=True)
+                self.assertEqual(n32, n)
+                np.testing.assert_allclose(mean32, mean, rtol=1e-5, atol=1e-6)
+                np.testing.assert_allclose(var32, var, rtol=1e-5, atol=1e-6)
+
+                with patch.object(CxgDataset, "diffexp_float32", True):
+                    self.check_1_10_2_10(
+                        diffexp_ttest(adaptor, self.get_mask(adaptor, 1, 10), self.get_mask(adaptor, 2, 10), 10)
+                    )
+        CxgDataset.set_diffexp_cache(app_config().server__adaptor__cxg_adaptor__diffexp_cache_bytes)
+
+    def test_float32_kahan_accuracy(self):
+        # many values with a large mean relative to their spread, where uncompensated float32 sums drift
+        rng = np.random.default_rng(0)
+        X = (rng.random((200000, 8)) * 0.2 + 3).astype(np.float32)
+        mean, var, n = diffexp_cxg.mean_var_n(X.astype(np.float64))
+
+        mean32, var32, n32 = diffexp_cxg.mean_var_n_float32(X)
+        self.assertEqual(mean32.dtype, np.float32)
+        self.assertEqual(n32, n)
+        np.testing.assert_allclose(mean32, mean, rtol=1e-6)
+        np.testing.assert_allclose(var32, var, rtol=1e-5)
+
+        cols = np.tile(np.arange(8), 200000)
+        n_a = np.zeros(8, dtype=np.uint32)
+        u, u_c, M2, M2_c = (np.zeros(8, dtype=np.float32) for _ in range(4))
+        diffexp_cxg._mean_var_sparse_accumulate_kahan(cols, X.ravel(), n_a, u, u_c, M2, M2_c)
+        np.testing.assert_allclose(u - u_c, mean, rtol=1e-6)
+        np.testing.assert_allclose((M2 - M2_c) / (n - 1), var, rtol=1e-5)
+
+    def test_ttest_top_n_pvals_match_full(self):
+        rng = np.random.default_rng(0)
+        n_var = 2000
+        meanA, varA, meanB, varB = (rng.random(n_var).astype(np.float32) for _ in range(4))
+        results = diffexp_cxg.diffexp_ttest_from_mean_var(meanA, varA, 100, meanB, varB, 300, 10, 0.01)
+        full = diffexp_cxg.diffexp_ttest_all_from_mean_var(meanA, varA, 100, meanB, varB, 300)
+
+        self.assertEqual(len(results["positive"]), 10)
+        self.assertEqual(len(results["negative"]), 10)
+        self.assertEqual(results["positive"][0][0], np.argmax(full["tscores"]))
+        self.assertEqual(results["negative"][0][0], np.argmin(full["tscores"]))
+        for var_index, lfc, pval, pval_adj in results["positive"] + results["negative"]:
+            self.assertIsInstance(var_index, int)
+            self.assertAlmostEqual(lfc, full["logfoldchanges"][var_index], places=6)
+            self.assertEqual(pval, full["pvals"][var_index])
+            self.assertEqual(pval_adj, full["pvals_adj"][var_index])
@@ -0,0 +1,74 @@
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from server.compute.diffexp_cxg import diffexp_ttest, is_complement
+from server.compute import sufficient_stats
+from server.compute.sufficient_stats import X_STATS_ARRAY_NAME, XStats, compute_X_stats, write_X_stats
+from server.dataset import cxg_dataset
+from server.dataset.cxg_dataset import CxgDataset
+from server.dataset.matrix_loader import DataLoader
+from server.tests import FIXTURES_ROOT
+from server.tests.unit import app_config
+
+
+class SufficientStatsTest(unittest.TestCase):
+    def test_complement_mean_var(self):
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(100, 5))
+        X_stats = XStats(n_obs=100, sum=X.sum(axis=0), sumsq=np.square(X).sum(axis=0), nnz=np.count_nonzero(X, axis=0))
+        A, B = X[:30], X[30:]
+        mean, var, n = X_stats.complement_mean_var(A.mean(axis=0), A.var(axis=0, ddof=1), 30)
+        self.assertEqual(n, 70)
+        np.testing.assert_allclose(mean, B.mean(axis=0))
+        np.testing.assert_allclose(var, B.var(axis=0, ddof=1))
+
+    def test_is_complement(self):
+        self.assertTrue(is_complement(np.array([0, 2]), np.array([1, 3, 4]), 5))
+        self.assertFalse(is_complement(np.array([0, 2]), np.array([1, 3]), 5))
+        self.assertFalse(is_complement(np.array([0, 2]), np.array([2, 3, 4]), 5))
+        self.assertFalse(is_complement(np.array([], dtype=int), np.arange(5), 5))
+
+    def test_diffexp_with_X_stats(self):
+        CxgDataset.set_diffexp_cache(0)
+        for dataset in ["pbmc3k.cxg", "pbmc3k_sparse.cxg"]:
+            with self.subTest(dataset=dataset):
+                config = app_config(extra_dataset_config=dict(X_approximate_distribution="normal"))
+                adaptor = DataLoader(location=f"{FIXTURES_ROOT}/{dataset}", app_config=config).open()
+                self.assertIsNone(adaptor.get_X_stats())
+
+                n_obs = adaptor.get_shape()[0]
+                maskA = np.zeros(n_obs, dtype=bool)
+                maskA[1::10] = True
+                selections = [(maskA, ~maskA), (~maskA, maskA)]
+                expected = [diffexp_ttest(adaptor, setA, setB, 10) for setA, setB in selections]
+
+                X_stats = compute_X_stats(adaptor.open_X_array(), adaptor.get_shape())
+                self.assertEqual(X_stats.n_var, adaptor.get_shape()[1])
+                adaptor.X_stats = X_stats
+                for (setA, setB), expect in zip(selections, expected):
+                    results = diffexp_ttest(adaptor, setA, setB, 10)
+                    for key in ["positive", "negative"]:
+                        for result, expected_result in zip(results[key], expect[key]):
+                            self.assertEqual(result[0], expected_result[0])
+                            self.assertTrue(np.isclose(result[1], expected_result[1], 1e-5, 1e-4))
+                            self.assertTrue(np.isclose(result[2], expected_result[2], 1e-5, 1e-4))
+        CxgDataset.set_diffexp_cache(app_config().server__adaptor__cxg_adaptor__diffexp_cache_bytes)
+
+    def test_X_stats_loaded_lazily(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            location = f"{dirname}/pbmc3k.cxg"
+            shutil.copytree(f"{FIXTURES_ROOT}/pbmc3k.cxg", location)
+            n_obs, n_var = DataLoader(location=location, app_config=app_config()).open().get_shape()
+            X_stats = XStats(n_obs=n_obs, sum=np.ones(n_var), sumsq=np.ones(n_var), nnz=np.ones(n_var, dtype=np.uint64))
+            write_X_stats(f"{location}/{X_STATS_ARRAY_NAME}", X_stats)
+
+            with patch.object(cxg_dataset, "read_X_stats", wraps=sufficient_stats.read_X_stats) as read_X_stats:
+                adaptor = DataLoader(location=location, app_config=app_config()).open()
+                read_X_stats.assert_not_called()
+                self.assertEqual(adaptor.get_X_stats().n_obs, n_obs)
+                np.testing.assert_array_equal(adaptor.get_X_stats().sum, X_stats.sum)
+                read_X_stats.assert_called_once()
@@ -1,11 +1,15 @@
 import json
 import unittest
+from datetime import datetime
+from unittest.mock import patch
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from werkzeug.datastructures import MultiDict
 
-from server.common.constants import Axis
+from server.common.constants import Axis, DiffExpTest
+from server.common.errors import DatasetAccessError, ExceedsLimitError, FilterError
 from server.common.rest import _query_parameter_to_filter
 from server.common.utils.data_locator import DataLocator
 from server.dataset.cxg_dataset import CxgDataset
@@ -174,3 +178,202 @@ class TestCxgDataset(unittest.TestCase):
         )
         decoded = decode_fbs.decode_matrix_FBS(encoded)
         self.assertEqual(decoded["columns"][0].tolist(), ["label"] * n_obs)
+
+    def test_prepare_diffexp_topN_from_list(self):
+        config = app_config(
+            extra_server_config={"limits__diffexp_cellcount_max": 1000},
+            extra_dataset_config={"diffexp__approximate_sample_size": 400},
+        )
+        data = CxgDataset(DataLocator(f"{FIXTURES_ROOT}/pbmc3k.cxg"), config)
+        setA = np.arange(0, 500, dtype=np.uint32)
+        setB = np.arange(500, 1000, dtype=np.uint32)
+        self.assertTrue(callable(data.prepare_diffexp_topN_from_list(setA, setB, 10)))
+
+        # empty sets, and out of range obs indices
+        for listA, listB in [
+            (np.array([], dtype=np.uint32), setB),
+            (setA, np.array([2637, 2638], dtype=np.uint32)),
+        ]:
+            with self.assertRaises(FilterError):
+                data.prepare_diffexp_topN_from_list(listA, listB, 10)
+
+        # the cell count limit applies to the (sampled) cell count
+        setB = np.arange(500, 1500, dtype=np.uint32)
+        with self.assertRaises(ExceedsLimitError):
+            data.prepare_diffexp_topN_from_list(setA, setB, 10)
+        with self.assertRaises(ExceedsLimitError):
+            data.prepare_diffexp_topN_from_list(setA, setB, 10, test=DiffExpTest.WILCOXON, approximate=True)
+        self.assertTrue(callable(data.prepare_diffexp_topN_from_list(setA, setB, 10, approximate=True)))
+
+    def test_pre_load_validation_is_memoized(self):
+        data_locator = DataLocator(f"{FIXTURES_ROOT}/pbmc3k.cxg")
+        CxgDataset.validated_locations.clear()
+        with patch.object(CxgDataset, "isvalid", wraps=CxgDataset.isvalid) as isvalid:
+            CxgDataset.pre_load_validation(data_locator)
+            CxgDataset.pre_load_validation(data_locator)
+            self.assertEqual(isvalid.call_count, 1)
+
+            # re-validated if the CXG group is modified
+            with patch.object(CxgDataset, "_group_lastmodtime", return_value=datetime(2000, 1, 1)):
+                CxgDataset.pre_load_validation(data_locator)
+            self.assertEqual(isvalid.call_count, 2)
+
+    def test_pre_load_validation_trusted(self):
+        data_locator = DataLocator(f"{FIXTURES_ROOT}/pbmc3k.cxg")
+        CxgDataset.validated_locations.clear()
+        with patch.object(CxgDataset, "_group_lastmodtime", return_value=None) as lastmodtime:
+            with patch.object(CxgDataset, "isvalid", wraps=CxgDataset.isvalid) as isvalid:
+                CxgDataset.pre_load_validation(data_locator, trusted=True)
+                CxgDataset.pre_load_validation(data_locator, trusted=True)
+                self.assertEqual(isvalid.call_count, 1)
+                self.assertEqual(lastmodtime.call_count, 1)
+
+                # without a modification time, untrusted datasets are always re-validated
+                CxgDataset.pre_load_validation(data_locator)
+                self.assertEqual(isvalid.call_count, 2)
+
+    def test_get_last_mod_time(self):
+        data_locator = DataLocator(f"{FIXTURES_ROOT}/pbmc3k.cxg")
+        lastmod = CxgDataset._group_lastmodtime(data_locator)
+        self.assertIsNotNone(lastmod)
+        CxgDataset.validated_locations.clear()
+        self.assertEqual(CxgDataset(data_locator, app_config()).get_last_mod_time(), lastmod)
+
+        # the modification time memoized by validation is used, rather than fetched again
+        CxgDataset.pre_load_validation(data_locator)
+        with patch.object(CxgDataset, "_group_lastmodtime") as group_lastmodtime:
+            self.assertEqual(CxgDataset(data_locator, app_config()).get_last_mod_time(), lastmod)
+            group_lastmodtime.assert_not_called()
+
+    def test_pre_load_validation_failure_is_not_memoized(self):
+        data_locator = DataLocator(f"{FIXTURES_ROOT}/pbmc3k.cxg")
+        CxgDataset.validated_locations.clear()
+        with patch.object(CxgDataset, "isvalid", return_value=False):
+            with self.assertRaises(DatasetAccessError):
+                CxgDataset.pre_load_validation(data_locator, trusted=True)
+        self.assertNotIn(data_locator.uri_or_path, CxgDataset.validated_locations)
+
+    def test_X_descriptor(self):
+        for fixture, is_sparse in [("pbmc3k.cxg", False), ("pbmc3k_sparse.cxg", True)]:
+            with self.subTest(fixture=fixture):
+                data = self.get_data(fixture)
+                descriptor = data.X_descriptor
+                X = data.open_X_array()
+                self.assertEqual(descriptor.is_sparse, is_sparse)
+                self.assertEqual(descriptor.dtype, X.attr(0).dtype)
+                self.assertEqual(descriptor.shape, (2638, 1838))
+                self.assertEqual(data.get_shape(), descriptor.shape)
+                self.assertEqual(len(descriptor.tile_extents), X.schema.domain.ndim)
+                if is_sparse:
+                    self.assertGreater(descriptor.nnz, 0)
+                    self.assertLessEqual(descriptor.nnz, 2638 * 1838)
+                else:
+                    self.assertIsNone(descriptor.nnz)
+                with self.assertRaises(AttributeError):
+                    descriptor.is_sparse = not is_sparse
+
+    def test_X_column_cache(self):
+        for fixture in ["pbmc3k.cxg", "pbmc3k_sparse.cxg"]:
+            with self.subTest(fixture=fixture):
+                data = self.get_data(fixture)
+                n_obs, n_vars = data.get_shape()
+                var_mask_1 = np.zeros(n_vars, dtype=bool)
+                var_mask_1[[3, 10, 11, 500]] = True
+                var_mask_2 = var_mask_1.copy()
+                var_mask_2[[0, 11]] = True
+
+                CxgDataset.set_X_column_cache(0)
+                expected_1 = data.get_X_array(None, var_mask_1)
+                expected_2 = data.get_X_array(None, var_mask_2)
+
+                CxgDataset.set_X_column_cache(64 * 1024**2)
+                cache = CxgDataset.X_column_cache
+                np.testing.assert_array_equal(data.get_X_array(None, var_mask_1), expected_1)
+                self.assertEqual(cache.stats()["misses"], 4)
+                self.assertEqual(len(cache), 4)
+
+                # partially cached
+                np.testing.assert_array_equal(data.get_X_array(None, var_mask_2), expected_2)
+                self.assertEqual(cache.stats()["misses"], 5)
+                self.assertEqual(cache.stats()["hits"], 4)
+
+                # obs filtering bypasses the cache
+                obs_mask = np.zeros(n_obs, dtype=bool)
+                obs_mask[:10] = True
+                np.testing.assert_array_equal(data.get_X_array(obs_mask, var_mask_2), expected_2[:10])
+                self.assertEqual(cache.stats()["misses"], 5)
+        CxgDataset.set_X_column_cache(app_config().server__adaptor__cxg_adaptor__X_column_cache_bytes)
+
+    def test_get_X_array_allow_sparse(self):
+        data = self.get_data("pbmc3k_sparse.cxg")
+        n_obs, n_vars = data.get_shape()
+        var_mask = np.zeros(n_vars, dtype=bool)
+        var_mask[[0, 5, 6, 7, 1000]] = True
+        obs_mask = np.zeros(n_obs, dtype=bool)
+        obs_mask[::3] = True
+
+        CxgDataset.set_X_column_cache(0)
+        for obs_selector in [None, obs_mask]:
+            with self.subTest(obs_mask=obs_selector is not None):
+                dense = data.get_X_array(obs_selector, var_mask)
+                X = data.get_X_array(obs_selector, var_mask, allow_sparse=True)
+                self.assertTrue(sparse.isspmatrix_csc(X))
+                self.assertEqual(X.shape, dense.shape)
+                np.testing.assert_array_equal(X.toarray(), dense)
+        CxgDataset.set_X_column_cache(app_config().server__adaptor__cxg_adaptor__X_column_cache_bytes)
+
+        # dense CXGs always return an ndarray
+        data = self.get_data("pbmc3k.cxg")
+        self.assertIsInstance(data.get_X_array(None, var_mask, allow_sparse=True), np.ndarray)
+
+    def test_get_X_array_allow_sparse_bypasses_column_cache(self):
+        # with the default config, ie, the X column cache enabled
+        data = self.get_data("pbmc3k_sparse.cxg")
+        n_obs, n_vars = data.get_shape()
+        var_mask = np.zeros(n_vars, dtype=bool)
+        var_mask[[0, 5, 6, 7, 1000]] = True
+        self.assertGreater(CxgDataset.X_column_cache.max_bytes, 0)
+
+        stats = CxgDataset.X_column_cache.stats()
+        X = data.get_X_array(None, var_mask, allow_sparse=True)
+        self.assertTrue(sparse.isspmatrix_csc(X))
+        self.assertEqual(X.shape, (n_obs, 5))
+        self.assertEqual(CxgDataset.X_column_cache.stats(), stats)
+        np.testing.assert_array_equal(X.toarray(), data.get_X_array(None, var_mask))
+
+    def test_get_X_array_partitioned(self):
+        CxgDataset.set_X_column_cache(0)
+        for fixture in ["pbmc3k.cxg", "pbmc3k_sparse.cxg"]:
+            with self.subTest(fixture=fixture):
+                data = self.get_data(fixture)
+                n_obs, n_vars = data.get_shape()
+                var_mask = np.zeros(n_vars, dtype=bool)
+                var_mask[::7] = True
+                obs_mask = np.zeros(n_obs, dtype=bool)
+                obs_mask[::5] = True
+
+                with patch.object(CxgDataset, "X_read_max_partitions", 1):
+                    expected = data.get_X_array(obs_mask, var_mask)
+                with patch.object(CxgDataset, "X_read_max_partitions", 4):
+                    np.testing.assert_array_equal(data.get_X_array(obs_mask, var_mask), expected)
+                    X = data.get_X_array(obs_mask, var_mask, allow_sparse=True)
+                    np.testing.assert_array_equal(X.toarray() if sparse.issparse(X) else X, expected)
+        CxgDataset.set_X_column_cache(app_config().server__adaptor__cxg_adaptor__X_column_cache_bytes)
+
+    def test_get_X_array_covering_obs_selection(self):
+        CxgDataset.set_X_column_cache(0)
+        for fixture in ["pbmc3k.cxg", "pbmc3k_sparse.cxg"]:
+            with self.subTest(fixture=fixture):
+                data = self.get_data(fixture)
+                n_obs, n_vars = data.get_shape()
+                var_mask = np.zeros(n_vars, dtype=bool)
+                var_mask[[0, 5, 6, 7, 1000]] = True
+                # dense and fragmented, so read as a single covering range and post-filtered
+                obs_mask = np.zeros(n_obs, dtype=bool)
+                obs_mask[1::2] = True
+
+                expected = data.get_X_array(None, var_mask)[obs_mask]
+                np.testing.assert_array_equal(data.get_X_array(obs_mask, var_mask), expected)
+                X = data.get_X_array(obs_mask, var_mask, allow_sparse=True)
+                np.testing.assert_array_equal(X.toarray() if sparse.issparse(X) else X, expected)
+        CxgDataset.set_X_column_cache(app_config().server__adaptor__cxg_adaptor__X_column_cache_bytes)
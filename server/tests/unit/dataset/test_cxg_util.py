@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+
+from server.dataset.cxg_util import (
+    choose_selector_from_indices,
+    choose_selector_from_mask,
+    pack_selector_from_indices,
+    pack_selector_from_mask,
+    partition_indices_by_tile,
+)
+
+
+class TestPartitionIndicesByTile(unittest.TestCase):
+    def test_partitions_are_tile_aligned(self):
+        indices = np.array([0, 1, 2, 5, 9, 10, 11, 20, 21, 30, 31, 32, 40, 41, 50, 60])
+        partitions = partition_indices_by_tile(indices, tile_extent=10, max_partitions=4)
+        self.assertGreater(len(partitions), 1)
+        self.assertLessEqual(len(partitions), 4)
+        np.testing.assert_array_equal(np.concatenate(partitions), indices)
+        tiles = [set(partition // 10) for partition in partitions]
+        for i in range(len(tiles) - 1):
+            self.assertTrue(tiles[i].isdisjoint(tiles[i + 1]))
+
+    def test_small_selections_are_not_partitioned(self):
+        indices = np.arange(0, 100, 10)
+        partitions = partition_indices_by_tile(indices, tile_extent=10, max_partitions=8, min_partition_size=16)
+        self.assertEqual(len(partitions), 1)
+        np.testing.assert_array_equal(partitions[0], indices)
+
+    def test_single_tile(self):
+        indices = np.arange(50)
+        partitions = partition_indices_by_tile(indices, tile_extent=100, max_partitions=4)
+        self.assertEqual(len(partitions), 1)
+
+    def test_no_tile_extent(self):
+        indices = np.arange(100)
+        partitions = partition_indices_by_tile(indices, tile_extent=None, max_partitions=4)
+        self.assertEqual([len(p) for p in partitions], [25, 25, 25, 25])
+
+
+class TestPackSelector(unittest.TestCase):
+    def test_pack_selector_from_indices(self):
+        self.assertIsNone(pack_selector_from_indices(np.array([], dtype=np.int64)))
+        self.assertEqual(pack_selector_from_indices(np.array([4])), [4])
+        self.assertEqual(
+            pack_selector_from_indices(np.array([0, 1, 2, 5, 7, 8, 10])), [slice(0, 2), 5, slice(7, 8), 10]
+        )
+
+    def test_pack_selector_from_mask(self):
+        mask = np.zeros(10, dtype=bool)
+        self.assertIsNone(pack_selector_from_mask(mask))
+        mask[[1, 2, 3, 9]] = True
+        self.assertEqual(pack_selector_from_mask(mask), [slice(1, 3), 9])
+        self.assertEqual(pack_selector_from_mask(None), slice(None))
+
+    def test_choose_selector(self):
+        # clustered - packed into slices
+        indices = np.arange(1000)
+        self.assertEqual(choose_selector_from_indices(indices), ([slice(0, 999)], False))
+
+        # sparse - packed into points
+        indices = np.arange(10, 100000, 100)
+        items, covering = choose_selector_from_indices(indices)
+        self.assertFalse(covering)
+        self.assertEqual(items, indices.tolist())
+
+        # dense but fragmented - a covering range
+        indices = np.arange(10, 100000, 2)
+        self.assertEqual(choose_selector_from_indices(indices), ([slice(10, 99998)], True))
+        self.assertEqual(choose_selector_from_indices(indices, max_ranges=100000), (indices.tolist(), False))
+
+        self.assertEqual(choose_selector_from_indices(np.array([], dtype=np.int64)), (None, False))
+        self.assertEqual(choose_selector_from_mask(None), (slice(None), False))